@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+共享异步运行时模块
+全应用共用一个常驻事件循环（独立线程），HTTP请求、webhook发送、图表生成和OI/资金费率预取都在其中执行；
+其他线程通过线程安全的 submit() 提交协程，不再为每个任务创建和关闭事件循环
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+from typing import Optional
+from config import Config
+
+class AsyncRuntime:
+    """常驻事件循环，首次提交任务时启动"""
+
+    def __init__(self, name: str = "async-runtime"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.stopped = False
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """事件循环（未启动时自动启动）"""
+        if self.stopped:
+            raise RuntimeError("异步运行时已停止")
+        if self._loop is None:
+            with self._start_lock:
+                if self._loop is None:
+                    ready = threading.Event()
+                    loop = asyncio.new_event_loop()
+
+                    def run():
+                        asyncio.set_event_loop(loop)
+                        ready.set()
+                        loop.run_forever()
+                        loop.close()
+
+                    self._thread = threading.Thread(target=run, daemon=True, name=self.name)
+                    self._thread.start()
+                    ready.wait()
+                    self._loop = loop
+        return self._loop
+
+    def in_loop(self) -> bool:
+        """当前是否运行在运行时的事件循环线程中"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coroutine) -> concurrent.futures.Future:
+        """
+        把协程提交到常驻事件循环执行（任意线程可调用）
+
+        Args:
+            coroutine: 要执行的协程
+
+        Returns:
+            concurrent.futures.Future: 线程安全的结果，cancel() 会取消对应的任务
+        """
+        try:
+            return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        except Exception:
+            # 未能提交时关闭协程，避免 "coroutine was never awaited" 警告
+            coroutine.close()
+            raise
+
+    def run(self, coroutine, timeout: Optional[float] = None):
+        """提交协程并阻塞等待结果，不能在运行时的事件循环线程中调用"""
+        if self.in_loop():
+            coroutine.close()
+            raise RuntimeError("不能在异步运行时的事件循环线程中同步等待")
+        return self.submit(coroutine).result(timeout)
+
+    def stop(self, timeout: float = 5.0):
+        """取消仍在运行的任务并停止事件循环线程，总共最多等待 timeout 秒"""
+        with self._start_lock:
+            if self.stopped:
+                return
+            self.stopped = True
+            loop = self._loop
+        if loop is None:
+            return
+
+        async def cancel_tasks():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        deadline = time.monotonic() + timeout
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_tasks(), loop).result(timeout)
+        except Exception as e:
+            if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                print(f"停止异步运行时时出错: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(max(0.0, deadline - time.monotonic()))
+
+# 全局共享异步运行时
+async_runtime = AsyncRuntime()
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+性能基准测试
+覆盖数据接入、分析计算、图表渲染和消息投递各阶段，输出 ops/sec 与延迟分位数，
+结果保存为JSON，可与基线结果对比并标记性能回退
+
+用法:
+    python benchmark.py                                  # 运行全部用例
+    python benchmark.py --quick --cases apply_update     # 快速运行指定用例
+    python benchmark.py --baseline baseline.json         # 与基线对比，回退时返回非零退出码
+
+所有网络请求都指向本地模拟交易所（market_depth_server.py，默认 http://127.0.0.1:5000），
+未启动模拟交易所时 OI/资金费率请求会快速失败，webhook 投递用例会被跳过
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from config import Config
+from mock_market import SyntheticMarket, SyntheticWorkload
+
+BOOK_SIZES = [100, 1000, 5000]
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(percent / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+def run_case(name: str, op: Callable[[int], None], iterations: int, warmup: int = 0) -> Dict:
+    """
+    运行单个用例并统计延迟
+
+    Args:
+        name: 用例名称
+        op: 单次操作，参数为迭代序号
+        iterations: 计时迭代次数
+        warmup: 预热迭代次数（不计时）
+
+    Returns:
+        Dict: ops/sec 与延迟分位数（毫秒）
+    """
+    for i in range(warmup):
+        op(i)
+
+    samples = []
+    start = time.perf_counter()
+    for i in range(warmup, warmup + iterations):
+        t0 = time.perf_counter_ns()
+        op(i)
+        samples.append((time.perf_counter_ns() - t0) / 1e6)
+    elapsed = time.perf_counter() - start
+
+    samples.sort()
+    result = {
+        "iterations": iterations,
+        "total_seconds": elapsed,
+        "ops_per_sec": iterations / elapsed if elapsed > 0 else 0.0,
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": _percentile(samples, 50),
+        "p90_ms": _percentile(samples, 90),
+        "p99_ms": _percentile(samples, 99),
+        "max_ms": samples[-1],
+    }
+    print(f"  {name:<40} {result['ops_per_sec']:>12,.1f} ops/s   "
+          f"p50 {result['p50_ms']:>9.3f} ms   p99 {result['p99_ms']:>9.3f} ms")
+    return result
+
+def _loaded_manager(symbol: str, is_futures: bool, levels: int, seed: int = 1):
+    """创建一个已加载合成快照的订单簿管理器，并返回对应的合成市场"""
+    from data_manager import OrderBookManager
+
+    market = SyntheticMarket(symbol, is_futures=is_futures, levels=levels, seed=seed)
+    manager = OrderBookManager(symbol, is_futures=is_futures)
+    manager.load_snapshot(market.snapshot(limit=levels))
+    return manager, market
+
+# ----------------------------------------------------------------------
+# 数据接入
+# ----------------------------------------------------------------------
+
+def bench_apply_update(results: Dict, scale: float):
+    for levels in BOOK_SIZES:
+        manager, market = _loaded_manager("BTCUSDT", False, levels)
+        iterations = max(50, int(2000 * scale))
+        updates = [market.next_update()["data"] for _ in range(iterations + 100)]
+        results[f"apply_update[levels={levels}]"] = run_case(
+            f"apply_update[levels={levels}]",
+            lambda i: manager.apply_update(updates[i]["b"], updates[i]["a"]),
+            iterations, warmup=100,
+        )
+
+def bench_process_websocket_message(results: Dict, scale: float):
+    from data_manager import DataManager
+
+    data_manager = DataManager()
+    workload = SyntheticWorkload(Config.SYMBOLS, seed=1)
+    for (symbol, is_futures), market in workload.markets.items():
+        data_manager.get_manager(symbol, is_futures).load_snapshot(market.snapshot())
+
+    iterations = max(60, int(3000 * scale))
+    messages = list(workload.messages(iterations + 60))
+    results["process_websocket_message"] = run_case(
+        "process_websocket_message",
+        lambda i: data_manager.process_websocket_message(messages[i][1], is_futures=messages[i][0]),
+        iterations, warmup=60,
+    )
+
+# ----------------------------------------------------------------------
+# 分析计算
+# ----------------------------------------------------------------------
+
+def bench_depth_ratio(results: Dict, scale: float):
+    manager, _ = _loaded_manager("BTCUSDT", False, 1000)
+
+    def all_bands(_):
+        for i, (lower, upper) in enumerate(Config.ANALYSIS_RANGES):
+            if i == 0:
+                manager.calculate_depth_ratio(upper)
+            else:
+                manager.calculate_depth_ratio_range(lower, upper)
+
+    results["calculate_depth_ratio_range[all_bands]"] = run_case(
+        "calculate_depth_ratio_range[all_bands]", all_bands, max(20, int(1000 * scale)), warmup=10,
+    )
+
+def bench_filtered_orders(results: Dict, scale: float):
+    manager, _ = _loaded_manager("BTCUSDT", False, 1000)
+    limit = Config.CHART_CONFIG["display_order_count"]
+    results["get_filtered_orders"] = run_case(
+        "get_filtered_orders", lambda _: manager.get_filtered_orders(limit), max(20, int(1000 * scale)), warmup=10,
+    )
+    # 图表数据采集阶段的持锁部分：一次加锁复制整个订单簿
+    results["capture_snapshot"] = run_case(
+        "capture_snapshot", lambda _: manager.capture_snapshot(), max(20, int(1000 * scale)), warmup=10,
+    )
+
+# ----------------------------------------------------------------------
+# 图表渲染与文本报告
+# ----------------------------------------------------------------------
+
+def bench_text_report(results: Dict, scale: float):
+    from text_output import TextOutputManager
+
+    text_output = TextOutputManager()
+    spot, _ = _loaded_manager("BTCUSDT", False, 1000)
+    futures, _ = _loaded_manager("BTCUSDT", True, 1000, seed=2)
+    results["text_report"] = run_case(
+        "text_report",
+        lambda _: (text_output.generate_market_analysis(spot), text_output.generate_market_analysis(futures)),
+        max(10, int(200 * scale)), warmup=5,
+    )
+
+def bench_chart(results: Dict, scale: float):
+    import chart_render
+    from chart_output import chart_output_manager
+
+    spot, _ = _loaded_manager("BTCUSDT", False, 1000)
+    futures, _ = _loaded_manager("BTCUSDT", True, 1000, seed=2)
+
+    def cold_build(_):
+        chart_render.clear_figure_templates()
+        chart_output_manager.create_depth_chart(spot, futures)
+
+    results["create_depth_chart[cold]"] = run_case(
+        "create_depth_chart[cold]", cold_build, max(5, int(50 * scale)), warmup=2,
+    )
+    results["create_depth_chart"] = run_case(
+        "create_depth_chart",
+        lambda _: chart_output_manager.create_depth_chart(spot, futures),
+        max(5, int(50 * scale)), warmup=2,
+    )
+    saved = results["create_depth_chart[cold]"]["mean_ms"] - results["create_depth_chart"]["mean_ms"]
+    print(f"  {'figure template saving':<40} {saved:>12.3f} ms/chart")
+
+    fig = chart_output_manager.create_depth_chart(spot, futures)
+    if fig is None:
+        print("  image_export: 图表创建失败，跳过")
+        return
+    results["image_export"] = run_case(
+        "image_export",
+        lambda _: chart_output_manager.export_chart_image(fig),
+        max(3, int(10 * scale)), warmup=1,
+    )
+
+    data = chart_output_manager._collect_chart_data(spot, futures)
+    matplotlib_spec = {**chart_output_manager._render_spec(data=data), "backend": "matplotlib"}
+    results["image_export[matplotlib]"] = run_case(
+        "image_export[matplotlib]",
+        lambda _: chart_output_manager.export_chart_image(matplotlib_spec),
+        max(3, int(10 * scale)), warmup=1,
+    )
+
+# ----------------------------------------------------------------------
+# 消息投递
+# ----------------------------------------------------------------------
+
+def bench_webhook_post(results: Dict, scale: float):
+    # 走生产环境的发送路径：webhook_dispatcher（限流桶、重试）+ 共享HTTP客户端，运行在共享事件循环中
+    from async_runtime import async_runtime
+    from http_client import http_client, REQUEST_ERRORS
+    from webhook_dispatcher import webhook_dispatcher
+
+    try:
+        response = http_client.get(f"{Config.ENDPOINTS['futures_rest']}/mock/stats", timeout=2)
+        if response.status != 200:
+            raise RuntimeError(f"status {response.status}")
+    except (REQUEST_ERRORS + (RuntimeError,)) as e:
+        print(f"  webhook_post: 模拟交易所不可用，跳过 ({e})")
+        return
+
+    payload = b"\x89PNG" + b"\x00" * 200_000
+    iterations = max(5, int(50 * scale))
+
+    async def run() -> List[float]:
+        samples = []
+        for i in range(iterations):
+            # 每次使用不同的webhook地址（各自一个限流桶），测量的是发送路径本身而不是模拟的限流等待
+            url = f"{Config.ENDPOINTS['futures_rest']}/api/webhooks/benchmark{i}/token"
+            t0 = time.perf_counter_ns()
+            response = await webhook_dispatcher.post(url, "benchmark", [("chart.png", payload, "image/png")])
+            if response.status not in (200, 204):
+                raise RuntimeError(f"webhook返回状态码 {response.status}")
+            samples.append((time.perf_counter_ns() - t0) / 1e6)
+        return samples
+
+    # 关闭合并窗口，否则每次发送都包含 batch_window 的等待
+    batch_window = Config.WEBHOOK_CONFIG["batch_window"]
+    Config.WEBHOOK_CONFIG["batch_window"] = 0
+    try:
+        start = time.perf_counter()
+        samples = async_runtime.run(run())
+        elapsed = time.perf_counter() - start
+    finally:
+        Config.WEBHOOK_CONFIG["batch_window"] = batch_window
+    samples.sort()
+    results["webhook_post"] = {
+        "iterations": iterations,
+        "total_seconds": elapsed,
+        "ops_per_sec": iterations / elapsed,
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": _percentile(samples, 50),
+        "p90_ms": _percentile(samples, 90),
+        "p99_ms": _percentile(samples, 99),
+        "max_ms": samples[-1],
+    }
+    print(f"  {'webhook_post':<40} {results['webhook_post']['ops_per_sec']:>12,.1f} ops/s   "
+          f"p50 {results['webhook_post']['p50_ms']:>9.3f} ms")
+
+CASES = {
+    "apply_update": bench_apply_update,
+    "process_websocket_message": bench_process_websocket_message,
+    "depth_ratio": bench_depth_ratio,
+    "filtered_orders": bench_filtered_orders,
+    "text_report": bench_text_report,
+    "chart": bench_chart,
+    "webhook_post": bench_webhook_post,
+}
+
+def compare_with_baseline(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """对比基线，返回回退用例列表（吞吐下降或p50延迟上升超过阈值）"""
+    regressions = []
+    print("\n与基线对比:")
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        ops_change = current["ops_per_sec"] / previous["ops_per_sec"] - 1 if previous["ops_per_sec"] else 0.0
+        p50_change = current["p50_ms"] / previous["p50_ms"] - 1 if previous["p50_ms"] else 0.0
+        regressed = ops_change < -threshold or p50_change > threshold
+        flag = "❌ 回退" if regressed else "✅"
+        print(f"  {name:<40} ops/s {ops_change:+7.1%}   p50 {p50_change:+7.1%}   {flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='市场深度监控系统性能基准测试')
+    parser.add_argument('--cases', help=f"逗号分隔的用例列表，可选: {', '.join(CASES)}")
+    parser.add_argument('--quick', action='store_true', help='减少迭代次数，快速运行')
+    parser.add_argument('--output', default='benchmark_results.json', help='结果输出文件')
+    parser.add_argument('--baseline', help='基线结果文件，用于对比')
+    parser.add_argument('--threshold', type=float, default=0.2, help='判定回退的相对变化阈值（默认0.2即20%%）')
+    parser.add_argument('--mock-exchange', default='http://127.0.0.1:5000', help='模拟交易所地址')
+    args = parser.parse_args()
+
+    Config.use_mock_exchange(args.mock_exchange)
+    Config.OUTPUT_OPTIONS["enable_console_output"] = False
+    scale = 0.1 if args.quick else 1.0
+    selected = args.cases.split(",") if args.cases else list(CASES)
+
+    print("=" * 60)
+    print("市场深度监控系统 - 性能基准测试")
+    print("=" * 60)
+
+    results = {}
+    for name in selected:
+        if name not in CASES:
+            print(f"未知用例: {name}")
+            continue
+        try:
+            CASES[name](results, scale)
+        except ImportError as e:
+            print(f"  {name}: 缺少依赖，跳过 ({e})")
+
+    # 关闭用例中用到的共享HTTP客户端和事件循环
+    from async_runtime import async_runtime
+    from http_client import http_client
+    http_client.close()
+    async_runtime.stop()
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "symbols": Config.SYMBOLS,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n结果已保存: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n检测到 {len(regressions)} 个性能回退: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -6,299 +6,232 @@ This version uses a 3-row layout with a 4-column table row at the bottom.
 All text content is in English, with specific color schemes and layout adjustments.
 """
 
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import requests
-import time
 import os
-import aiohttp
-import asyncio
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Dict, List, Tuple
 from datetime import datetime
 from config import Config
-from data_manager import OrderBookManager
-# from oi_funding_data import OIFundingDataManager # 註釋：移除不再需要的導入
+from data_manager import OrderBookManager, filter_orders, calculate_depth_ratio, calculate_depth_ratio_range
+import profiler
+from memory_report import estimate_size
+from render_pool import RenderPool
+import chart_render
+from oi_funding_data import get_oi_funding_manager
+from webhook_dispatcher import webhook_dispatcher
+from delivery_spool import DeliverySpool
 import threading
-from queue import Queue
 import math
 
 class ChartOutputManager:
     """Chart Output Manager"""
     
-    def __init__(self):
+    def __init__(self, oi_funding_manager=None):
         self.last_send_time = {}
-        self.send_queue = Queue()
-        self.send_lock = threading.Lock()
-        # self.oi_funding_manager = OIFundingDataManager() # 註釋：移除不存在的管理器實例化
-        
-        # 註釋：將所有顏色配置集中到此處，方便統一修改。
-        self.color_palettes = {
-            "Spot": {
-                "bids": "#00b894",  # Green
-                "asks": "#ff7675"   # Red
-            },
-            "Futures": {
-                "bids": "#3498db",  # Sky Blue (買單 - 冷色)
-                "asks": "#f39c12"   # Orange (賣單 - 暖色，推薦搭配)
-            },
-            "Neutral": "#6c757d", # 中性/無數據時的顏色
-            "FundingRate": {
-                "positive": "#ff7675", # 紅色
-                "negative": "#00b894"  # 綠色
-            }
-        }
-        
-        self._start_sender_thread()
-
-    def _start_sender_thread(self):
-        # 註釋：啟動背景執行緒，用於發送圖表
-        def sender_worker():
-            while True:
-                try:
-                    task = self.send_queue.get()
-                    if task is None: break
-                    fig, symbol, webhook_urls = task
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    try:
-                        loop.run_until_complete(
-                            self._send_chart_with_delay(fig, symbol, webhook_urls)
-                        )
-                    finally: loop.close()
-                    self.send_queue.task_done()
-                except Exception as e:
-                    if Config.OUTPUT_OPTIONS["enable_console_output"]:
-                        print(f"Sender thread error: {e}")
-        
-        sender_thread = threading.Thread(target=sender_worker, daemon=True)
-        sender_thread.start()
-
-    async def _send_chart_with_delay(self, fig, symbol: str, webhook_urls: List[str]):
-        # 註釋：在發送圖表前，根據配置等待一段時間
-        with self.send_lock:
-            delay = Config.CHART_CONFIG.get("send_delay", 3)
-            await asyncio.sleep(delay)
-            if Config.OUTPUT_OPTIONS["enable_console_output"]:
-                print(f"Sending {symbol} chart...")
-            await self.send_chart_to_discord(fig, symbol, webhook_urls)
-    
-    def _add_depth_traces(self, fig, bids: List[Tuple], asks: List[Tuple], current_price: float, 
-                          market_type: str, row: int, col: int, subplot_num: int):
-        # 註釋：此函式負責添加市場深度圖（頂部圖表）
-        colors = self.color_palettes.get(market_type, self.color_palettes["Spot"])
-        all_orders = bids + asks
-        if not all_orders: return
-
-        quantities = [q for p, q in all_orders]
-        min_qty, max_qty = min(quantities), max(quantities)
-        min_bar_width, max_bar_width = 0.1, 0.3
-
-        def get_bar_width(qty):
-            if max_qty == min_qty: return (min_bar_width + max_bar_width) / 2
-            log_min, log_max = math.log1p(min_qty), math.log1p(max_qty)
-            if log_max == log_min: return (min_bar_width + max_bar_width) / 2
-            normalized_log = (math.log1p(qty) - log_min) / (log_max - log_min)
-            return min_bar_width + normalized_log * (max_bar_width - min_bar_width)
-
-        corrected_asks = [order for order in all_orders if order[0] > current_price]
-        corrected_bids = [order for order in all_orders if order[0] <= current_price]
-
-        if corrected_asks:
-            fig.add_trace(go.Bar(x=[q for p, q in corrected_asks], y=[f"${p:,.2f}" for p, q in corrected_asks], name=f"{market_type} Asks", orientation='h', marker_color=colors["asks"], width=[get_bar_width(q) for p, q in corrected_asks], hovertemplate=f"{market_type} Ask<br>Price: %{{y}}<br>Qty: %{{x:.2f}}<extra></extra>", opacity=0.8), row=row, col=col)
-        if corrected_bids:
-            fig.add_trace(go.Bar(x=[q for p, q in corrected_bids], y=[f"${p:,.2f}" for p, q in corrected_bids], name=f"{market_type} Bids", orientation='h', marker_color=colors["bids"], width=[get_bar_width(q) for p, q in corrected_bids], hovertemplate=f"{market_type} Bid<br>Price: %{{y}}<br>Qty: %{{x:.2f}}<extra></extra>", opacity=0.8), row=row, col=col)
-        
-        x_ref = f'x{subplot_num}' if subplot_num > 1 else 'x'
-        y_ref = f'y{subplot_num}' if subplot_num > 1 else 'y'
-        current_price_str = f"${current_price:,.2f}"
-        fig.add_shape(type="line", x0=0, y0=current_price_str, x1=1, y1=current_price_str, xref=f"{x_ref} domain", yref=y_ref, line=dict(color='#ffffff', width=1, dash='dash'))
-        fig.add_annotation(x=0.98, y=current_price_str, xref=f"{x_ref} domain", yref=y_ref, text=f"Current: {current_price_str}", showarrow=False, font=dict(color='#ffffff', size=10), xanchor="right", yanchor="bottom", bgcolor="rgba(0,0,0,0.5)")
-
-    def _add_single_order_table(self, fig, orders: List[Tuple], market_type: str, order_type: str, row: int, col: int):
-        # 註釋：此函式負責添加單一的掛單列表（賣或買）
-        color = self.color_palettes.get(market_type, {}).get(order_type, 'white')
-        orders.sort(key=lambda x: x[0], reverse=True)
-        header_values = ['<b>Price (USDT)</b>', '<b>Quantity</b>']
-        prices = [f"<b>${price:,.2f}</b>" for price, _ in orders]
-        quantities = [f"<b>{qty:.3f}</b>" for _, qty in orders]
-        font_colors = [[color] * len(orders), [color] * len(orders)]
-        fig.add_trace(go.Table(header=dict(values=header_values, fill_color='#2a2a2a', font=dict(color='white', size=12), align='left'), cells=dict(values=[prices, quantities], fill_color='#1e1e1e', font=dict(color=font_colors, size=11), align='left', height=30)), row=row, col=col)
-
-    def _add_oi_funding_annotation(self, fig, oi_value, funding_rate, row, col, subplot_num):
-        # 註釋：(新) 在指定的子圖上添加 OI 和資金費率的註解
-        if oi_value is None and funding_rate is None:
-            return
-
-        oi_text = f"<b>OI: {oi_value:,.0f}</b>" if oi_value is not None else ""
-        fr_text = ""
-        if funding_rate is not None:
-            rate_color = self.color_palettes["FundingRate"]["positive"] if funding_rate >= 0 else self.color_palettes["FundingRate"]["negative"]
-            fr_text = f"<b>Funding: <span style='color:{rate_color};'>{funding_rate:+.4f}%</span></b>"
-
-        separator = " | " if oi_text and fr_text else ""
-        annotation_text = f"{oi_text}{separator}{fr_text}"
-
-        x_ref = f'x{subplot_num}' if subplot_num > 1 else 'x'
-        y_ref = f'y{subplot_num}' if subplot_num > 1 else 'y'
+        # 註釋：每個交易對上次發送的圖表輸入指紋（用於跳過未變化的渲染）
+        self.last_fingerprints = {}
+        self.last_fingerprint_time = {}
+        self.last_fingerprint_check = {}
+        self.skipped_renders = 0
+        # 註釋：已提交渲染、尚未寫入發送佇列的圖表（計入記憶體統計）
+        self.pending_renders = {}
+        self.pending_lock = threading.Lock()
+        # 註釋：常駐渲染進程池，首次提交時才啟動工作進程；render_workers 為 0 時在本進程內匯出
+        workers = Config.CHART_CONFIG.get("render_workers", 0)
+        self.render_pool = RenderPool(
+            workers=workers, backend=Config.CHART_CONFIG.get("backend", "plotly"),
+            job_timeout=Config.CHART_CONFIG.get("render_timeout", 60),
+            max_jobs_per_worker=Config.CHART_CONFIG.get("render_max_jobs_per_worker", 50)
+        ) if workers > 0 else None
+        # 註釋：沒有渲染進程時在單個背景執行緒中匯出，不阻塞共享事件循環
+        self.render_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chart-render") if workers <= 0 else None
+        # 註釋：渲染好的圖片與通知寫入磁碟發送佇列，失敗時退避重試，重啟後繼續發送
+        spool_cfg = Config.DELIVERY_SPOOL_CONFIG
+        self.spool = DeliverySpool(os.path.join(spool_cfg["directory"], "charts"), self._deliver_entry,
+                                   max_entries=spool_cfg["max_entries"], max_per_key=spool_cfg["max_per_symbol"])
+        # 註釋：OI 與資金費率由後台預取器刷新，繪圖時只讀取快取
+        self.oi_funding_manager = oi_funding_manager or get_oi_funding_manager()
+
+    def _spool_when_rendered(self, future: Future, symbol: str, webhook_urls: List[str]):
+        # 註釋：渲染完成後把圖片字節寫入發送佇列；訊息時間取提交時刻，重發時不變
+        content = f"## {symbol} Market Depth & Order Book Analysis - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} (UTC+8)"
+        with self.pending_lock:
+            self.pending_renders[future] = symbol
+        future.add_done_callback(lambda f: self._on_rendered(f, symbol, webhook_urls, content))
+
+    def _on_rendered(self, future: Future, symbol: str, webhook_urls: List[str], content: str):
+        # 註釋：寫入發送佇列之後才從 pending_renders 移除，停止時據此等待渲染完成
+        try:
+            self._spool_rendered(future, symbol, webhook_urls, content)
+        finally:
+            with self.pending_lock:
+                self.pending_renders.pop(future, None)
 
-        # *** MODIFICATION: Repositioned the annotation ***
-        # 註釋：將註解放置在圖表下方，取代X軸標題的位置
-        fig.add_annotation(
-            x=0.5, y=-0.3, # 將Y位置設為負數，使其在圖表下方
-            xref=f"{x_ref} domain", yref=f"{y_ref} domain",
-            text=annotation_text, showarrow=False,
-            font=dict(color='white', size=14), # 增大字體
-            align="center", xanchor="center", yanchor="top",
-        )
+    def _spool_rendered(self, future: Future, symbol: str, webhook_urls: List[str], content: str):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            print(f"Error rendering {symbol} chart: {future.exception()}")
+            return
+        image_bytes = future.result()
+        image_name = f"depth_chart_{symbol}_{int(time.time())}.{Config.CHART_CONFIG['format']}"
+        # 註釋：只有開啟本地保存時才寫入磁碟
+        if Config.OUTPUT_OPTIONS["save_charts_locally"]:
+            try:
+                with open(image_name, 'wb') as f: f.write(image_bytes)
+                print(f"Chart saved to: {image_name}")
+            except Exception as e: print(f"Failed to save chart locally: {e}")
+        try:
+            self.spool.put(f"chart:{symbol}", {
+                "kind": "chart", "symbol": symbol, "content": content, "webhooks": webhook_urls,
+                "filename": image_name, "content_type": f'image/{Config.CHART_CONFIG["format"]}'
+            }, image_bytes)
+        except OSError as e: print(f"Failed to spool {symbol} chart: {e}")
+
+    async def _deliver_entry(self, entry: Dict, payload: bytes, urls: List[str]) -> List[str]:
+        # 註釋：發送佇列中的一條訊息；返回已完成的 webhook（成功，或 429 以外的 4xx 這類重試也無用的失敗）
+        kind = entry["kind"]
+        if kind == "chart" and Config.OUTPUT_OPTIONS["enable_console_output"]:
+            print(f"Sending {entry['symbol']} chart...")
+        files = [(entry["filename"], payload, entry["content_type"])] if payload is not None else None
+        results = await webhook_dispatcher.post_many(urls, entry["content"], files)
+        finished = []
+        for url, result in zip(urls, results):
+            number = entry["webhooks"].index(url) + 1
+            if isinstance(result, Exception):
+                print(f"Error sending {kind} to Discord webhook #{number}: {result}")
+            elif result.status in [200, 204]:
+                finished.append(url)
+                if kind == "chart": print(f"Chart successfully sent to Discord webhook #{number}")
+            else:
+                if 400 <= result.status < 500 and result.status != 429: finished.append(url)
+                print(f"Failed to send {kind} to Discord webhook #{number}, status: {result.status}, message: {result.text}")
+        return finished
+
+    def _collect_chart_data(self, spot_manager: OrderBookManager, futures_manager: OrderBookManager) -> Dict:
+        # 註釋：每個市場只加鎖一次擷取訂單簿快照，之後的過濾與比率計算都在鎖外進行
+        with profiler.stage("snapshot_capture"):
+            snapshots = {"Spot": spot_manager.capture_snapshot(), "Futures": futures_manager.capture_snapshot()}
+        if not snapshots["Spot"] or not snapshots["Futures"]: return None
+
+        # 註釋：只讀取快取，不在繪圖路徑上發起任何網路請求
+        oi_funding = self.oi_funding_manager.get_cached(futures_manager.symbol)
+
+        return {
+            "title": f"Market Depth & Order Book Analysis - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} (UTC+8)",
+            "markets": {market_type: self._market_chart_data(snapshot) for market_type, snapshot in snapshots.items()},
+            "display_order_count": Config.CHART_CONFIG["display_order_count"],
+            "oi_value": oi_funding["oi_value"],
+            "funding_rate": oi_funding["funding_rate"],
+            "oi_funding_updated": oi_funding["updated_at"],
+            "oi_funding_stale": oi_funding["updated_at"] is not None
+                                and time.time() - oi_funding["updated_at"] > Config.OI_FUNDING_CONFIG["stale_after"],
+        }
 
+    def _market_chart_data(self, snapshot: Dict) -> Dict:
+        # 註釋：從快照計算單一市場的圖表數據（純計算，不持有任何鎖）
+        bids, asks, mid_price = snapshot["bids"], snapshot["asks"], snapshot["mid_price"]
+        filtered_bids, filtered_asks = filter_orders(bids, asks, snapshot["min_quantity"], Config.CHART_CONFIG["display_order_count"])
+        ranges, ratios = [], []
+        for i, (lower, upper) in enumerate(Config.ANALYSIS_RANGES):
+            ratio, _, _, _ = calculate_depth_ratio_range(bids, asks, mid_price, lower, upper) if i > 0 else calculate_depth_ratio(bids, asks, mid_price, upper)
+            ranges.append(f"{lower}-{upper}%" if i > 0 else f"0-{upper}%")
+            ratios.append(ratio if ratio is not None else 0)
+        return {
+            "symbol": snapshot["symbol"],
+            "mid_price": mid_price,
+            "bids": filtered_bids,
+            "asks": filtered_asks,
+            "ratio": {"ranges": ranges, "ratios": ratios},
+        }
 
+    @profiler.timed("figure_build")
     def create_depth_chart(self, spot_manager: OrderBookManager, futures_manager: OrderBookManager):
-        # 註釋：創建圖表的核心函式
+        # 註釋：創建 Plotly 圖表物件（本進程內，供本地預覽與測試腳本使用）
         try:
-            spot_data = spot_manager.get_market_data()
-            futures_data = futures_manager.get_market_data()
-            if not spot_data or not futures_data: return None
-
-            symbol = futures_manager.symbol
-            oi_value, funding_rate = None, None
-            try:
-                oi_url = f"https://fapi.binance.com/fapi/v1/openInterest?symbol={symbol.upper()}"
-                oi_response = requests.get(oi_url, timeout=5)
-                if oi_response.status_code == 200:
-                    oi_data = oi_response.json()
-                    oi_value = float(oi_data.get("openInterest", 0))
-
-                funding_url = f"https://fapi.binance.com/fapi/v1/premiumIndex?symbol={symbol.upper()}"
-                funding_response = requests.get(funding_url, timeout=5)
-                if funding_response.status_code == 200:
-                    funding_data = funding_response.json()
-                    funding_rate = float(funding_data.get("lastFundingRate", 0)) * 100
-            except Exception as e:
-                if Config.OUTPUT_OPTIONS["enable_console_output"]:
-                    print(f"Error fetching OI/Funding data: {e}")
-
-            fig = make_subplots(
-                rows=3, cols=4,
-                specs=[
-                    [{"type": "xy", "colspan": 2}, None, {"type": "xy", "colspan": 2}, None],
-                    [{"type": "xy", "colspan": 2}, None, {"type": "xy", "colspan": 2}, None],
-                    [{"type": "table"}, {"type": "table"}, {"type": "table"}, {"type": "table"}]
-                ],
-                row_heights=[0.45, 0.2, 0.35],
-                column_widths=[0.25, 0.25, 0.25, 0.25],
-                vertical_spacing=0.1,
-                horizontal_spacing=0.04,
-                subplot_titles=(
-                    f"<b>Binance {spot_manager.symbol} Spot Market Depth</b>", 
-                    f"<b>Binance {futures_manager.symbol} Futures Market Depth</b>",
-                    f"<b>Spot Buy/Sell Ratio</b>", f"<b>Futures Buy/Sell Ratio</b>",
-                    "<b>Spot Ask Book</b>", "<b>Spot Bid Book</b>", "<b>Futures Ask Book</b>", "<b>Futures Bid Book</b>"
-                )
-            )
-
-            # --- PREPARE DATA ---
-            spot_bids, spot_asks = spot_manager.get_filtered_orders(Config.CHART_CONFIG["display_order_count"])
-            futures_bids, futures_asks = futures_manager.get_filtered_orders(Config.CHART_CONFIG["display_order_count"])
-            
-            all_spot_prices_set = {p for p, q in spot_bids} | {p for p, q in spot_asks} | {spot_data["mid_price"]}
-            spot_y_axis_order = [f"${p:,.2f}" for p in sorted(list(all_spot_prices_set), reverse=True)]
-
-            all_futures_prices_set = {p for p, q in futures_bids} | {p for p, q in futures_asks} | {futures_data["mid_price"]}
-            futures_y_axis_order = [f"${p:,.2f}" for p in sorted(list(all_futures_prices_set), reverse=True)]
-            
-            # --- POPULATE GRID ---
-            # *** MODIFICATION: Changed annotation call position ***
-            self._add_depth_traces(fig, spot_bids, spot_asks, spot_data["mid_price"], "Spot", 1, 1, subplot_num=1)
-            self._add_depth_traces(fig, futures_bids, futures_asks, futures_data["mid_price"], "Futures", 1, 3, subplot_num=2)
-            
-            self._add_ratio_chart(fig, spot_manager, "Spot", 2, 1)
-            self._add_ratio_chart(fig, futures_manager, "Futures", 2, 3)
-            # 註釋：將註解添加到 Ratio Chart 下方
-            self._add_oi_funding_annotation(fig, oi_value, funding_rate, row=2, col=3, subplot_num=4)
-            
-            self._add_single_order_table(fig, spot_asks, "Spot", "asks", 3, 1)
-            self._add_single_order_table(fig, spot_bids, "Spot", "bids", 3, 2)
-            self._add_single_order_table(fig, futures_asks, "Futures", "asks", 3, 3)
-            self._add_single_order_table(fig, futures_bids, "Futures", "bids", 3, 4)
-
-            # --- UPDATE AXES & LAYOUT ---
-            self._update_axes(fig, spot_y_axis_order, futures_y_axis_order)
-            
-            fig.update_layout(
-                barmode='overlay', plot_bgcolor='#1e1e1e', paper_bgcolor='#1a1a1a',
-                font=dict(color='#ffffff', size=12),
-                height=Config.CHART_CONFIG.get("chart_height_final", 1600),
-                width=Config.CHART_CONFIG["chart_width"], showlegend=True,
-                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, font=dict(size=10)),
-                title=dict(text=f"<b>Market Depth & Order Book Analysis - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} (UTC+8)</b>", font=dict(size=18, color='#ffffff'), x=0.5),
-                margin=dict(l=40, r=40, t=100, b=40)
-            )
-
-            return fig
-
+            data = self._collect_chart_data(spot_manager, futures_manager)
+            if not data: return None
+            return chart_render.build_plotly_figure(data, Config.CHART_CONFIG["chart_width"], Config.CHART_CONFIG.get("chart_height_final", 1600))
         except Exception as e:
             if Config.OUTPUT_OPTIONS["enable_console_output"]:
                 print(f"Error creating chart: {e}")
             return None
-    
-    def _add_ratio_chart(self, fig, manager: OrderBookManager, market_type: str, row: int, col: int):
-        # 註釋：此函式負責添加買賣比率圖
-        ratios, ranges, colors = [], [], []
-        market_colors = self.color_palettes.get(market_type, self.color_palettes["Spot"])
 
-        for i, (lower, upper) in enumerate(Config.ANALYSIS_RANGES):
-            ratio, _, _, _ = manager.calculate_depth_ratio_range(lower, upper) if i > 0 else manager.calculate_depth_ratio(upper)
-            range_name = f"{lower}-{upper}%" if i > 0 else f"0-{upper}%"
-            ratios.append(ratio if ratio is not None else 0)
-            ranges.append(range_name)
-            
-            if ratio is None or ratio == 0: colors.append(self.color_palettes["Neutral"])
-            elif ratio > 0: colors.append(market_colors['bids'])
-            else: colors.append(market_colors['asks'])
-
-        fig.add_trace(go.Bar(x=ranges, y=ratios, name=f"{market_type} Ratio", marker_color=colors, text=[f"{r:.3f}" for r in ratios], textposition='auto', textfont=dict(size=9, color='white'), hovertemplate=f"{market_type} Ratio<br>Range: %{{x}}<br>Ratio: %{{y:.3f}}<extra></extra>"), row=row, col=col)
-
-    def _update_axes(self, fig, spot_y_order, futures_y_order):
-        # 註釋：更新所有子圖的坐標軸
-        fig.update_yaxes(type='category', categoryorder='array', categoryarray=spot_y_order, autorange='reversed', title_text="Price (USDT)", gridcolor='#3d3d3d', row=1, col=1)
-        fig.update_xaxes(title_text="Quantity", gridcolor='#3d3d3d', zerolinecolor='#ffffff', row=1, col=1)
-        fig.update_yaxes(type='category', categoryorder='array', categoryarray=futures_y_order, autorange='reversed', title_text="Price (USDT)", gridcolor='#3d3d3d', row=1, col=3)
-        fig.update_xaxes(title_text="Quantity", gridcolor='#3d3d3d', zerolinecolor='#ffffff', row=1, col=3)
-        fig.update_xaxes(title_text="Price Range", gridcolor='#3d3d3d', row=2, col=1)
-        fig.update_yaxes(title_text="Buy/Sell Ratio", gridcolor='#3d3d3d', zerolinecolor='white', zerolinewidth=1, row=2, col=1)
-        # *** MODIFICATION: Hide the x-axis title for the futures ratio chart ***
-        fig.update_xaxes(title_text="", gridcolor='#3d3d3d', row=2, col=3)
-        fig.update_yaxes(title_text="Buy/Sell Ratio", gridcolor='#3d3d3d', zerolinecolor='white', zerolinewidth=1, row=2, col=3)
-
-    async def send_chart_to_discord(self, fig, symbol: str, webhook_urls: List[str]):
-        # 註釋：發送圖表到 Discord
-        if not fig or not webhook_urls: return
-        try:
-            timestamp = int(time.time())
-            image_path = f"depth_chart_{symbol}_{timestamp}.{Config.CHART_CONFIG['format']}"
-            fig.write_image(image_path, engine="kaleido", width=Config.CHART_CONFIG["chart_width"], height=Config.CHART_CONFIG.get("chart_height_final", 1600), scale=2, format=Config.CHART_CONFIG["format"])
-            await asyncio.sleep(1)
+    def _spec_from_data(self, data: Dict) -> Dict:
+        # 註釋：圖表物件在渲染進程中由普通數據建立，這裡只傳遞數據
+        return self._render_spec(data=data)
+
+    @staticmethod
+    def _round_significant(value: float, digits: int) -> float:
+        # 註釋：按有效數字取整，使不同量級的數量使用相同的相對精度
+        if not value:
+            return 0.0
+        return round(value, digits - 1 - int(math.floor(math.log10(abs(value)))))
+
+    def chart_fingerprint(self, data: Dict) -> Tuple:
+        """Fingerprint of the chart inputs: top-N levels, rounded band ratios, OI and funding."""
+        cfg = Config.CHART_CONFIG
+        markets = []
+        for market_type in ("Spot", "Futures"):
+            market = data["markets"][market_type]
+            levels = tuple((price, self._round_significant(qty, cfg["fingerprint_quantity_digits"]))
+                           for price, qty in market["bids"] + market["asks"])
+            ratios = tuple(round(r, cfg["fingerprint_ratio_decimals"]) for r in market["ratio"]["ratios"])
+            markets.append((levels, ratios))
+        oi_value = data["oi_value"]
+        oi = self._round_significant(oi_value, cfg["fingerprint_oi_digits"]) if oi_value is not None else None
+        funding = round(data["funding_rate"], 4) if data["funding_rate"] is not None else None
+        return (tuple(markets), oi, funding)
+
+    def _fingerprint_moved(self, old: Tuple, new: Tuple) -> bool:
+        # 註釋：比率變化或掛單牆變動超過門檻時提前渲染
+        cfg = Config.CHART_CONFIG
+        ratio_delta = cfg.get("early_render_ratio_delta")
+        level_changes = cfg.get("early_render_level_changes")
+        if old is None:
+            return False
+        for (old_levels, old_ratios), (new_levels, new_ratios) in zip(old[0], new[0]):
+            if ratio_delta is not None and any(abs(a - b) >= ratio_delta for a, b in zip(old_ratios, new_ratios)):
+                return True
+            if level_changes is not None and len({p for p, _ in old_levels} ^ {p for p, _ in new_levels}) >= level_changes:
+                return True
+        return False
 
-            if not os.path.exists(image_path):
-                print(f"Chart file generation failed: {image_path}")
-                return
-            content = f"## {symbol} Market Depth & Order Book Analysis - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} (UTC+8)"
-            for i, url in enumerate(webhook_urls):
-                if i > 0: await asyncio.sleep(Config.CHART_CONFIG.get("webhook_delay", 2))
-                async with aiohttp.ClientSession() as session:
-                    form = aiohttp.FormData()
-                    form.add_field('content', content)
-                    with open(image_path, 'rb') as f:
-                        form.add_field('file', f.read(), filename=os.path.basename(image_path), content_type=f'image/{Config.CHART_CONFIG["format"]}')
-                    async with session.post(url, data=form) as response:
-                        if response.status in [200, 204]: print(f"Chart successfully sent to Discord webhook #{i+1}")
-                        else: print(f"Failed to send chart to Discord webhook #{i+1}, status: {response.status}, message: {await response.text()}")
-        except Exception as e: print(f"Error sending chart: {e}")
-        finally:
-            if not Config.OUTPUT_OPTIONS["save_charts_locally"] and os.path.exists(image_path):
-                try: os.remove(image_path)
-                except Exception as e: print(f"Failed to delete temp file: {e}")
-            elif Config.OUTPUT_OPTIONS["save_charts_locally"]: print(f"Chart saved to: {image_path}")
+    def export_chart_image(self, chart) -> bytes:
+        # 註釋：在記憶體中匯出圖表圖片（Plotly 圖表或渲染規格），每張圖表只匯出一次
+        spec = chart if isinstance(chart, dict) and "backend" in chart else self._render_spec(chart)
+        with profiler.stage("image_export"):
+            return chart_render.render_spec(spec)
+
+    def _render_spec(self, fig=None, data: Dict = None) -> Dict:
+        # 註釋：渲染規格只包含普通字典，可直接傳給渲染進程
+        if data is not None:
+            content = {"backend": Config.CHART_CONFIG.get("backend", "plotly"), "data": data}
+        else:
+            content = {"backend": "plotly", "figure": fig if isinstance(fig, dict) else fig.to_dict()}
+        return {
+            **content,
+            "format": Config.CHART_CONFIG["format"],
+            "width": Config.CHART_CONFIG["chart_width"],
+            "height": Config.CHART_CONFIG.get("chart_height_final", 1600),
+            "scale": 2
+        }
+
+    def start_render_pool(self):
+        """Starts the render workers ahead of the first chart so Kaleido is already warm."""
+        if self.render_pool is not None:
+            self.render_pool.start()
+
+    def render_chart_image(self, chart) -> Future:
+        """Submits a render spec (or Plotly figure) to the render pool; returns a future resolving to image bytes."""
+        spec = chart if isinstance(chart, dict) and "backend" in chart else self._render_spec(chart)
+        if self.render_pool is not None:
+            return self.render_pool.submit(spec)
+        return self.render_thread.submit(self.export_chart_image, spec)
+
+    def get_render_metrics(self) -> Dict:
+        """Returns render pool metrics (queue depth, in-flight jobs, timeouts, recycles)."""
+        return self.render_pool.get_metrics() if self.render_pool is not None else {}
 
     def should_send_now(self, symbol: str) -> bool:
         # 註釋：檢查是否到達發送時間
@@ -309,24 +242,128 @@ class ChartOutputManager:
             return True
         return False
 
+    def _early_render_enabled(self) -> bool:
+        cfg = Config.CHART_CONFIG
+        return cfg.get("early_render_ratio_delta") is not None or cfg.get("early_render_level_changes") is not None
+
+    def _check_due(self, symbol: str, now: float) -> Tuple[bool, bool]:
+        # 註釋：返回 (是否到達發送時間, 是否需要檢查提前渲染)；提前渲染的檢查按間隔節流
+        cfg = Config.CHART_CONFIG
+        last_send = self.last_send_time.get(symbol, 0)
+        if now - last_send >= Config.SEND_INTERVALS["chart_output"]:
+            return True, False
+        if (not self._early_render_enabled() or symbol not in self.last_fingerprints
+                or now - last_send < cfg.get("early_render_min_interval", 0)
+                or now - self.last_fingerprint_check.get(symbol, 0) < cfg.get("fingerprint_check_interval", 0)):
+            return False, False
+        self.last_fingerprint_check[symbol] = now
+        return False, True
+
+    def _send_unchanged_notice(self, symbol: str):
+        # 註釋：指紋未變化時發送輕量文字通知，代替完整圖表
+        if not (webhooks := Config.get_webhooks(symbol, "chart_output")):
+            return
+        since = datetime.fromtimestamp(self.last_fingerprint_time[symbol]).strftime('%H:%M:%S')
+        self.spool.put(f"notice:{symbol}", {
+            "kind": "notice", "symbol": symbol, "webhooks": webhooks,
+            "content": f"**{symbol}** market depth unchanged since {since} (UTC+8)"
+        })
+
     async def process_and_send(self, spot_manager: OrderBookManager, futures_manager: OrderBookManager):
         # 註釋：處理數據並發送圖表的入口函式
-        if not Config.is_output_enabled("chart_output") or not self.should_send_now(spot_manager.symbol):
+        if not Config.is_output_enabled("chart_output"):
+            return
+        symbol = spot_manager.symbol
+        now = time.time()
+        due, check_early = self._check_due(symbol, now)
+        if not due and not check_early:
             return
         try:
-            fig = self.create_depth_chart(spot_manager, futures_manager)
-            if fig and (webhooks := Config.get_webhooks(spot_manager.symbol, "chart_output")):
-                self.send_queue.put((fig, spot_manager.symbol, webhooks))
+            data = self._collect_chart_data(spot_manager, futures_manager)
+            if not data:
+                return
+
+            # 註釋：圖表輸入的指紋與上次發送相同時跳過渲染
+            fingerprint = self.chart_fingerprint(data)
+            last_fingerprint = self.last_fingerprints.get(symbol)
+            if check_early:
+                if not self._fingerprint_moved(last_fingerprint, fingerprint):
+                    return
+                if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                    print(f"{symbol} chart inputs moved past threshold, rendering early")
+            elif Config.CHART_CONFIG.get("skip_unchanged") and fingerprint == last_fingerprint:
+                self.last_send_time[symbol] = now
+                self.skipped_renders += 1
+                if Config.CHART_CONFIG.get("unchanged_action") == "notice":
+                    self._send_unchanged_notice(symbol)
+                if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                    print(f"{symbol} chart unchanged, render skipped")
+                return
+
+            self.last_send_time[symbol] = now
+            self.last_fingerprints[symbol] = fingerprint
+            self.last_fingerprint_time[symbol] = now
+            spec = self._spec_from_data(data)
+            if spec and (webhooks := Config.get_webhooks(symbol, "chart_output")):
+                # 註釋：立即提交渲染，多個交易對可在不同進程中並行渲染，完成後寫入發送佇列
+                self._spool_when_rendered(self.render_chart_image(spec), spot_manager.symbol, webhooks)
                 if Config.OUTPUT_OPTIONS["enable_console_output"]:
                     print(f"Added {spot_manager.symbol} chart to send queue")
         except Exception as e:
             if Config.OUTPUT_OPTIONS["enable_console_output"]:
                 print(f"Error creating chart: {e}")
 
-    def stop(self):
-        """Stops the chart output manager."""
-        self.send_queue.put(None)
+    def get_memory_usage(self) -> Dict:
+        """Estimates memory held by charts waiting to be rendered or delivered (bytes); image bytes stay on disk."""
+        with self.pending_lock:
+            pending = list(self.pending_renders)
+        spool = self.spool.get_metrics()
+        queue_bytes = estimate_size(pending) + spool["memory_bytes"]
+        return {
+            "queued_charts": len(pending) + spool["pending"],
+            "queue_bytes": queue_bytes,
+            "spool_disk_bytes": spool["disk_bytes"],
+            "render_queue_depth": self.get_render_metrics().get("queue_depth", 0),
+            "total_bytes": queue_bytes
+        }
+
+    def start(self):
+        """Starts the render workers and the delivery spool (replaying messages left from the last run)."""
+        self.start_render_pool()
+        self.spool.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stops the chart output manager, spending up to `timeout` seconds finishing renders and sending
+        what is due; undelivered messages stay in the spool for the next start."""
+        deadline = time.monotonic() + timeout
+        # 註釋：先等待已提交的渲染寫入發送佇列，再盡量發出
+        while self.pending_renders and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if self.pending_renders and Config.OUTPUT_OPTIONS["enable_console_output"]:
+            print(f"Abandoning {len(self.pending_renders)} unfinished chart render(s)")
+        self.spool.drain(max(0.0, deadline - time.monotonic()))
+        self.spool.stop(max(0.0, deadline - time.monotonic()))
+        if self.render_pool is not None:
+            self.render_pool.shutdown(wait=False)
+        if self.render_thread is not None:
+            self.render_thread.shutdown(wait=False)
         if Config.OUTPUT_OPTIONS["enable_console_output"]:
             print("Chart output manager stopped")
 
-chart_output_manager = ChartOutputManager()
+# 註釋：全域圖表輸出管理器，首次存取時才建立（通常由 main.create_app 建立）
+_chart_output_manager = None
+_instance_lock = threading.Lock()
+
+def get_chart_output_manager() -> ChartOutputManager:
+    """Returns the shared chart output manager, creating it on first use."""
+    global _chart_output_manager
+    with _instance_lock:
+        if _chart_output_manager is None:
+            _chart_output_manager = ChartOutputManager()
+        return _chart_output_manager
+
+def __getattr__(name: str):
+    # 註釋：相容 from chart_output import chart_output_manager
+    if name == "chart_output_manager":
+        return get_chart_output_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,586 @@
+# -*- coding: utf-8 -*-
+"""
+图表渲染模块
+渲染工作进程使用的无副作用图片导出函数，作为脚本运行时即为工作进程入口（见 render_pool.py）
+
+渲染规格为普通字典:
+    {"backend": "plotly", "figure": <plotly图表字典>, "format": "png", "width": 1200, "height": 1600, "scale": 2}
+    {"backend": "matplotlib", "data": <图表数据字典>, "format": "png", "width": 1200, "height": 1600, "scale": 2}
+
+图表数据字典由 ChartOutputManager._collect_chart_data 从订单簿快照生成，只包含普通数据:
+    {"title": str, "display_order_count": int, "oi_value": float|None, "funding_rate": float|None,
+     "oi_funding_updated": float|None (时间戳), "oi_funding_stale": bool,
+     "markets": {"Spot"/"Futures": {"symbol", "mid_price", "bids", "asks",
+                                    "ratio": {"ranges", "ratios"}}}}
+两种后端都由本模块从图表数据直接绘制，可用固定数据单独测试
+"""
+
+import io
+import math
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+# matplotlib 布局使用的配色（与 Plotly 版本一致）
+BACKGROUND_COLOR = "#1a1a1a"
+PLOT_COLOR = "#1e1e1e"
+GRID_COLOR = "#3d3d3d"
+HEADER_COLOR = "#2a2a2a"
+TEXT_COLOR = "#ffffff"
+
+# 註釋：將所有顏色配置集中到此處，方便統一修改。
+COLOR_PALETTES = {
+    "Spot": {
+        "bids": "#00b894",  # Green
+        "asks": "#ff7675"   # Red
+    },
+    "Futures": {
+        "bids": "#3498db",  # Sky Blue (買單 - 冷色)
+        "asks": "#f39c12"   # Orange (賣單 - 暖色，推薦搭配)
+    },
+    "Neutral": "#6c757d", # 中性/無數據時的顏色
+    "FundingRate": {
+        "positive": "#ff7675", # 紅色
+        "negative": "#00b894"  # 綠色
+    }
+}
+
+# 每个交易对的 Plotly 图表骨架与每种尺寸的 matplotlib 背景缓存（进程内）
+_figure_templates = {}
+_template_lock = threading.RLock()
+
+def render_spec(spec: Dict) -> bytes:
+    """将渲染规格导出为图片字节"""
+    image_format, scale = spec.get("format", "png"), spec.get("scale", 1)
+    width, height = spec.get("width", 1200), spec.get("height", 1600)
+    if spec.get("backend", "plotly") == "matplotlib":
+        return render_matplotlib(spec["data"], image_format, width, height, scale)
+
+    import plotly.io as pio
+
+    if "figure" in spec:
+        return pio.to_image(spec["figure"], engine="kaleido", format=image_format, width=width, height=height, scale=scale)
+    with _template_lock:
+        fig = build_plotly_figure(spec["data"], width, height)
+        return pio.to_image(fig, engine="kaleido", format=image_format, width=width, height=height, scale=scale)
+
+def clear_figure_templates():
+    """清空图表骨架缓存（Plotly 骨架与 matplotlib 背景）"""
+    with _template_lock:
+        _figure_templates.clear()
+
+def freshness_text(data: Dict) -> str:
+    """OI/资金费率的更新时间说明，无数据时为空"""
+    updated = data.get("oi_funding_updated")
+    if updated is None:
+        return ""
+    text = f"updated {datetime.fromtimestamp(updated).strftime('%H:%M:%S')}"
+    return f"stale, {text}" if data.get("oi_funding_stale") else text
+
+def ratio_colors(market_type: str, ratios: List[float]) -> List[str]:
+    """买卖比率柱的颜色：买方占优用买单色，卖方占优用卖单色，零为中性色"""
+    market_colors = COLOR_PALETTES.get(market_type, COLOR_PALETTES["Spot"])
+    return [COLOR_PALETTES["Neutral"] if not ratio else market_colors["bids"] if ratio > 0 else market_colors["asks"]
+            for ratio in ratios]
+
+def _bar_widths(orders: List[Tuple[float, float]]) -> List[float]:
+    """按数量对数缩放柱宽（0.1 ~ 0.3），与 Plotly 版本一致"""
+    quantities = [q for p, q in orders]
+    if not quantities:
+        return []
+    min_qty, max_qty = min(quantities), max(quantities)
+    min_width, max_width = 0.1, 0.3
+    log_min, log_max = math.log1p(min_qty), math.log1p(max_qty)
+    if log_max == log_min:
+        return [(min_width + max_width) / 2] * len(quantities)
+    return [min_width + (math.log1p(q) - log_min) / (log_max - log_min) * (max_width - min_width) for q in quantities]
+
+# ----------------------------------------------------------------------
+# Plotly 后端
+# ----------------------------------------------------------------------
+
+def _build_figure_template(spot_symbol: str, futures_symbol: str, width: int, height: int) -> Tuple[object, Dict[str, int]]:
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    # 註釋：建立一次性的圖表骨架（子圖、標題、固定數量的 trace、形狀、註解與坐標軸），之後每次只替換數據
+    fig = make_subplots(
+        rows=3, cols=4,
+        specs=[
+            [{"type": "xy", "colspan": 2}, None, {"type": "xy", "colspan": 2}, None],
+            [{"type": "xy", "colspan": 2}, None, {"type": "xy", "colspan": 2}, None],
+            [{"type": "table"}, {"type": "table"}, {"type": "table"}, {"type": "table"}]
+        ],
+        row_heights=[0.45, 0.2, 0.35],
+        column_widths=[0.25, 0.25, 0.25, 0.25],
+        vertical_spacing=0.1,
+        horizontal_spacing=0.04,
+        subplot_titles=(
+            f"<b>Binance {spot_symbol} Spot Market Depth</b>", 
+            f"<b>Binance {futures_symbol} Futures Market Depth</b>",
+            f"<b>Spot Buy/Sell Ratio</b>", f"<b>Futures Buy/Sell Ratio</b>",
+            "<b>Spot Ask Book</b>", "<b>Spot Bid Book</b>", "<b>Futures Ask Book</b>", "<b>Futures Bid Book</b>"
+        )
+    )
+    indices = {}
+
+    # 註釋：市場深度圖（頂部圖表），每個市場固定一條賣單和一條買單 trace
+    for market_type, col in (("Spot", 1), ("Futures", 3)):
+        colors = COLOR_PALETTES[market_type]
+        for side, label in (("asks", "Ask"), ("bids", "Bid")):
+            indices[f"{market_type}_depth_{side}"] = len(fig.data)
+            fig.add_trace(go.Bar(x=[], y=[], name=f"{market_type} {label}s", orientation='h', marker_color=colors[side], hovertemplate=f"{market_type} {label}<br>Price: %{{y}}<br>Qty: %{{x:.2f}}<extra></extra>", opacity=0.8), row=1, col=col)
+
+    # 註釋：買賣比率圖
+    for market_type, col in (("Spot", 1), ("Futures", 3)):
+        indices[f"{market_type}_ratio"] = len(fig.data)
+        fig.add_trace(go.Bar(x=[], y=[], name=f"{market_type} Ratio", textposition='auto', textfont=dict(size=9, color='white'), hovertemplate=f"{market_type} Ratio<br>Range: %{{x}}<br>Ratio: %{{y:.3f}}<extra></extra>"), row=2, col=col)
+
+    # 註釋：底部四個掛單列表（賣或買）
+    header_values = ['<b>Price (USDT)</b>', '<b>Quantity</b>']
+    for col, (market_type, order_type) in enumerate((("Spot", "asks"), ("Spot", "bids"), ("Futures", "asks"), ("Futures", "bids")), start=1):
+        indices[f"{market_type}_table_{order_type}"] = len(fig.data)
+        fig.add_trace(go.Table(header=dict(values=header_values, fill_color='#2a2a2a', font=dict(color='white', size=12), align='left'), cells=dict(values=[[], []], fill_color='#1e1e1e', font=dict(size=11), align='left', height=30)), row=3, col=col)
+
+    # 註釋：當前價格虛線與標註（y 值每次更新）
+    for market_type, subplot_num in (("Spot", 1), ("Futures", 2)):
+        x_ref = f'x{subplot_num}' if subplot_num > 1 else 'x'
+        y_ref = f'y{subplot_num}' if subplot_num > 1 else 'y'
+        indices[f"{market_type}_price_line"] = len(fig.layout.shapes)
+        fig.add_shape(type="line", x0=0, y0=None, x1=1, y1=None, xref=f"{x_ref} domain", yref=y_ref, line=dict(color='#ffffff', width=1, dash='dash'))
+        indices[f"{market_type}_price_label"] = len(fig.layout.annotations)
+        fig.add_annotation(x=0.98, y=None, xref=f"{x_ref} domain", yref=y_ref, text="", showarrow=False, font=dict(color='#ffffff', size=10), xanchor="right", yanchor="bottom", bgcolor="rgba(0,0,0,0.5)")
+
+    # 註釋：OI 和資金費率註解放置在合約比率圖下方，取代X軸標題的位置
+    indices["oi_funding"] = len(fig.layout.annotations)
+    fig.add_annotation(
+        x=0.5, y=-0.3, # 將Y位置設為負數，使其在圖表下方
+        xref="x4 domain", yref="y4 domain",
+        text="", showarrow=False,
+        font=dict(color='white', size=14), # 增大字體
+        align="center", xanchor="center", yanchor="top",
+    )
+
+    # 註釋：更新所有子圖的坐標軸
+    fig.update_yaxes(type='category', categoryorder='array', autorange='reversed', title_text="Price (USDT)", gridcolor='#3d3d3d', row=1, col=1)
+    fig.update_xaxes(title_text="Quantity", gridcolor='#3d3d3d', zerolinecolor='#ffffff', row=1, col=1)
+    fig.update_yaxes(type='category', categoryorder='array', autorange='reversed', title_text="Price (USDT)", gridcolor='#3d3d3d', row=1, col=3)
+    fig.update_xaxes(title_text="Quantity", gridcolor='#3d3d3d', zerolinecolor='#ffffff', row=1, col=3)
+    fig.update_xaxes(title_text="Price Range", gridcolor='#3d3d3d', row=2, col=1)
+    fig.update_yaxes(title_text="Buy/Sell Ratio", gridcolor='#3d3d3d', zerolinecolor='white', zerolinewidth=1, row=2, col=1)
+    # *** MODIFICATION: Hide the x-axis title for the futures ratio chart ***
+    fig.update_xaxes(title_text="", gridcolor='#3d3d3d', row=2, col=3)
+    fig.update_yaxes(title_text="Buy/Sell Ratio", gridcolor='#3d3d3d', zerolinecolor='white', zerolinewidth=1, row=2, col=3)
+
+    fig.update_layout(
+        barmode='overlay', plot_bgcolor='#1e1e1e', paper_bgcolor='#1a1a1a',
+        font=dict(color='#ffffff', size=12),
+        height=height, width=width, showlegend=True,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, font=dict(size=10)),
+        title=dict(text="", font=dict(size=18, color='#ffffff'), x=0.5),
+        margin=dict(l=40, r=40, t=100, b=40)
+    )
+    return fig, indices
+
+def _get_figure_template(spot_symbol: str, futures_symbol: str, width: int, height: int) -> Tuple[object, Dict[str, int]]:
+    # 註釋：每個交易對的圖表骨架只建立一次
+    key = (spot_symbol, futures_symbol, width, height)
+    with _template_lock:
+        if key not in _figure_templates:
+            _figure_templates[key] = _build_figure_template(spot_symbol, futures_symbol, width, height)
+        return _figure_templates[key]
+
+def _update_depth_traces(fig, indices: Dict[str, int], bids: List[Tuple], asks: List[Tuple], current_price: float, market_type: str):
+    # 註釋：替換市場深度圖（頂部圖表）的數據
+    all_orders = bids + asks
+    widths = dict(zip(all_orders, _bar_widths(all_orders)))
+
+    sides = {
+        "asks": [order for order in all_orders if order[0] > current_price],
+        "bids": [order for order in all_orders if order[0] <= current_price],
+    }
+    for side, orders in sides.items():
+        trace = fig.data[indices[f"{market_type}_depth_{side}"]]
+        trace.x = [q for p, q in orders]
+        trace.y = [f"${p:,.2f}" for p, q in orders]
+        trace.width = [widths[order] for order in orders]
+        trace.visible = bool(orders)
+
+    current_price_str = f"${current_price:,.2f}"
+    line = fig.layout.shapes[indices[f"{market_type}_price_line"]]
+    line.y0 = line.y1 = current_price_str
+    label = fig.layout.annotations[indices[f"{market_type}_price_label"]]
+    label.y = current_price_str
+    label.text = f"Current: {current_price_str}"
+
+def _update_order_table(fig, index: int, orders: List[Tuple], market_type: str, order_type: str):
+    # 註釋：替換單一掛單列表（賣或買）的單元格
+    color = COLOR_PALETTES.get(market_type, {}).get(order_type, 'white')
+    orders = sorted(orders, key=lambda x: x[0], reverse=True)
+    prices = [f"<b>${price:,.2f}</b>" for price, _ in orders]
+    quantities = [f"<b>{qty:.3f}</b>" for _, qty in orders]
+    cells = fig.data[index].cells
+    cells.values = [prices, quantities]
+    cells.font.color = [[color] * len(orders), [color] * len(orders)]
+
+def _format_oi_funding_text(oi_value, funding_rate, freshness: str = "") -> str:
+    # 註釋：OI 和資金費率的註解文字，兩者皆無時為空
+    if oi_value is None and funding_rate is None:
+        return ""
+
+    oi_text = f"<b>OI: {oi_value:,.0f}</b>" if oi_value is not None else ""
+    fr_text = ""
+    if funding_rate is not None:
+        rate_color = COLOR_PALETTES["FundingRate"]["positive"] if funding_rate >= 0 else COLOR_PALETTES["FundingRate"]["negative"]
+        fr_text = f"<b>Funding: <span style='color:{rate_color};'>{funding_rate:+.4f}%</span></b>"
+
+    separator = " | " if oi_text and fr_text else ""
+    suffix = f"<br><span style='font-size:11px;color:#aaaaaa;'>{freshness}</span>" if freshness else ""
+    return f"{oi_text}{separator}{fr_text}{suffix}"
+
+def build_plotly_figure(data: Dict, width: int = 1200, height: int = 1600):
+    """
+    将图表数据写入该交易对缓存的 Plotly 图表骨架（骨架只建立一次，之后原地替换数据）
+
+    注意：返回的图表对象会在下一次调用时被修改，需在 _template_lock 内使用或先复制
+    """
+    spot, futures = data["markets"]["Spot"], data["markets"]["Futures"]
+    y_axis_orders = {}
+    for market_type, market in data["markets"].items():
+        all_prices_set = {p for p, q in market["bids"]} | {p for p, q in market["asks"]} | {market["mid_price"]}
+        y_axis_orders[market_type] = [f"${p:,.2f}" for p in sorted(list(all_prices_set), reverse=True)]
+
+    fig, indices = _get_figure_template(spot["symbol"], futures["symbol"], width, height)
+    with _template_lock, fig.batch_update():
+        for market_type, market in data["markets"].items():
+            _update_depth_traces(fig, indices, market["bids"], market["asks"], market["mid_price"], market_type)
+
+            trace = fig.data[indices[f"{market_type}_ratio"]]
+            trace.x = market["ratio"]["ranges"]
+            trace.y = market["ratio"]["ratios"]
+            trace.marker.color = ratio_colors(market_type, market["ratio"]["ratios"])
+            trace.text = [f"{r:.3f}" for r in market["ratio"]["ratios"]]
+
+            _update_order_table(fig, indices[f"{market_type}_table_asks"], market["asks"], market_type, "asks")
+            _update_order_table(fig, indices[f"{market_type}_table_bids"], market["bids"], market_type, "bids")
+
+        fig.layout.annotations[indices["oi_funding"]].text = _format_oi_funding_text(data["oi_value"], data["funding_rate"], freshness_text(data))
+        fig.layout.yaxis.categoryarray = y_axis_orders["Spot"]
+        fig.layout.yaxis2.categoryarray = y_axis_orders["Futures"]
+        fig.layout.title.text = f"<b>{data['title']}</b>"
+
+    return fig
+
+# ----------------------------------------------------------------------
+# matplotlib 后端
+# ----------------------------------------------------------------------
+# 不随数据变化的部分（坐标区、标题、坐标轴名称、图例）由 matplotlib 排版并只绘制一次，缓存为背景图片；
+# 每次渲染复制背景，再用 Pillow 绘制柱、网格线、刻度和文字。matplotlib 逐个栅格化文字约 2ms/个，
+# 一张图约 170 个文字，每次都用 Artist 重绘会比 Kaleido 还慢
+
+def _style_axes(ax, xlabel: str = "", ylabel: str = "", ylabel_pad: float = 4):
+    # 刻度、网格线由 Pillow 按数据绘制，这里只保留底色和坐标轴名称（labelpad 为刻度标签留出位置）
+    ax.set_facecolor(PLOT_COLOR)
+    ax.set_xticks([])
+    ax.set_yticks([])
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+    ax.set_xlabel(xlabel, color=TEXT_COLOR, labelpad=22)
+    ax.set_ylabel(ylabel, color=TEXT_COLOR, labelpad=ylabel_pad)
+
+def _build_matplotlib_template(width: int, height: int, scale: float) -> Dict:
+    """用 matplotlib 绘制静态背景，返回背景图片、各坐标区的像素位置（左、上、右、下）和每磅像素数"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Patch
+    from PIL import Image
+
+    dpi = 100 * scale
+    fig = Figure(figsize=(width / 100, height / 100), dpi=dpi, facecolor=BACKGROUND_COLOR)
+    canvas = FigureCanvasAgg(fig)
+    # 深度图与比率图两列之间留出价格刻度标签的宽度，掛单列表另分四列
+    grid = fig.add_gridspec(3, 2, height_ratios=[0.45, 0.2, 0.35], hspace=0.35, wspace=0.3,
+                            left=0.1, right=0.97, top=0.92, bottom=0.03)
+    table_grid = grid[2, :].subgridspec(1, 4, wspace=0.45)
+
+    axes = {}
+    for market_type, col in (("Spot", 0), ("Futures", 1)):
+        depth = axes[f"{market_type}_depth"] = fig.add_subplot(grid[0, col])
+        _style_axes(depth, "Quantity", "Price (USDT)", ylabel_pad=69)
+        ratio = axes[f"{market_type}_ratio"] = fig.add_subplot(grid[1, col])
+        _style_axes(ratio, "Price Range" if market_type == "Spot" else "", "Buy/Sell Ratio", ylabel_pad=34)
+        ratio.set_title(f"{market_type} Buy/Sell Ratio", color=TEXT_COLOR, fontweight="bold", fontsize=12)
+
+    for col, (market_type, side, title) in enumerate((("Spot", "asks", "Spot Ask Book"), ("Spot", "bids", "Spot Bid Book"),
+                                                      ("Futures", "asks", "Futures Ask Book"), ("Futures", "bids", "Futures Bid Book"))):
+        table = axes[f"{market_type}_{side}"] = fig.add_subplot(table_grid[0, col])
+        table.set_axis_off()
+        table.set_title(title, color=TEXT_COLOR, fontweight="bold", fontsize=12)
+
+    handles = [Patch(color=COLOR_PALETTES[market_type][side], alpha=0.8, label=f"{market_type} {label}s")
+               for market_type in ("Spot", "Futures") for side, label in (("asks", "Ask"), ("bids", "Bid"))]
+    fig.legend(handles=handles, loc="upper right", ncol=len(handles), frameon=False,
+               fontsize=9, labelcolor=TEXT_COLOR, bbox_to_anchor=(0.97, 0.975))
+
+    canvas.draw()
+    background = Image.frombuffer("RGBA", canvas.get_width_height(), canvas.buffer_rgba(), "raw", "RGBA", 0, 1).convert("RGB")
+    boxes = {}
+    for name, ax in axes.items():
+        x0, y0, x1, y1 = ax.get_window_extent().extents
+        boxes[name] = (x0, background.height - y1, x1, background.height - y0)
+    return {"background": background, "boxes": boxes, "pt": dpi / 72, "fonts": {}}
+
+def _get_matplotlib_template(width: int, height: int, scale: float) -> Dict:
+    key = ("matplotlib", width, height, scale)
+    with _template_lock:
+        if key not in _figure_templates:
+            _figure_templates[key] = _build_matplotlib_template(width, height, scale)
+        return _figure_templates[key]
+
+def _font(template: Dict, size: float, bold: bool = False):
+    # 与 matplotlib 默认字体相同（DejaVu Sans），字号按磅换算为当前分辨率下的像素
+    key = (size, bold)
+    if key not in template["fonts"]:
+        from matplotlib import font_manager
+        from PIL import ImageFont
+
+        path = font_manager.findfont(font_manager.FontProperties(weight="bold" if bold else "normal"))
+        template["fonts"][key] = ImageFont.truetype(path, size * template["pt"])
+    return template["fonts"][key]
+
+def _text(draw, template: Dict, xy: Tuple[float, float], text: str, size: float, color: str,
+          bold: bool = False, anchor: str = "la"):
+    draw.text(xy, text, fill=color, font=_font(template, size, bold), anchor=anchor)
+
+def _line_width(template: Dict, points: float) -> int:
+    return max(1, round(points * template["pt"]))
+
+def _rgba(color: str, alpha: float) -> Tuple[int, int, int, int]:
+    from PIL import ImageColor
+
+    return ImageColor.getrgb(color)[:3] + (round(alpha * 255),)
+
+def _axis_ticks(low: float, high: float, bins: int) -> Tuple[List[float], int]:
+    """[low, high] 内的刻度值（与 matplotlib 自动刻度相同的步长）及标签需要的小数位数"""
+    from matplotlib.ticker import MaxNLocator
+
+    tolerance = (high - low) * 1e-9
+    locator = MaxNLocator(nbins=bins, steps=[1, 2, 2.5, 5, 10])
+    ticks = [float(t) for t in locator.tick_values(low, high) if low - tolerance <= t <= high + tolerance]
+    step = ticks[1] - ticks[0] if len(ticks) > 1 else 1.0
+    decimals = 0
+    while decimals < 6 and abs(step * 10 ** decimals - round(step * 10 ** decimals)) > 1e-6:
+        decimals += 1
+    return [round(t, decimals) for t in ticks], decimals
+
+def _format_tick(value: float, decimals: int) -> str:
+    # 与 matplotlib 相同使用 Unicode 负号，并避免出现 "-0.0"
+    value = round(value, decimals) or 0.0
+    return f"{value:,.{decimals}f}".replace("-", "−")
+
+def _draw_dashed_hline(draw, x0: float, x1: float, y: float, color: str, width: int, dash: float, gap: float):
+    x = x0
+    while x < x1:
+        draw.line([(x, y), (min(x + dash, x1), y)], fill=color, width=width)
+        x += dash + gap
+
+def _draw_depth(draw, template: Dict, box: Tuple, market_type: str, market: Dict):
+    """市场深度图：横向柱状图，价格为类别轴（高价在上），附当前价格虚线"""
+    left, top, right, bottom = box
+    pt, line = template["pt"], _line_width(template, 0.8)
+    mid_price = market["mid_price"]
+    all_orders = market["bids"] + market["asks"]
+    prices = sorted({p for p, q in all_orders} | {mid_price}, reverse=True)
+    row = (bottom - top) / len(prices)
+    y_of = {price: top + (i + 0.5) * row for i, price in enumerate(prices)}
+    x_max = max((q for p, q in all_orders), default=0) * 1.05 or 1.0
+    x_ticks, decimals = _axis_ticks(0, x_max, 7)
+
+    def x_of(quantity: float) -> float:
+        return left + quantity / x_max * (right - left)
+
+    for x in x_ticks:
+        draw.line([(x_of(x), top), (x_of(x), bottom + 3.5 * pt)], fill=GRID_COLOR, width=line)
+        _text(draw, template, (x_of(x), bottom + 7 * pt), _format_tick(x, decimals), 9, TEXT_COLOR, anchor="ma")
+    for price, y in y_of.items():
+        draw.line([(left - 3.5 * pt, y), (right, y)], fill=GRID_COLOR, width=line)
+        _text(draw, template, (left - 7 * pt, y), f"${price:,.2f}", 9, TEXT_COLOR, anchor="rm")
+
+    palette = COLOR_PALETTES[market_type]
+    for (price, qty), width in zip(all_orders, _bar_widths(all_orders)):
+        half = width * row / 2
+        color = _rgba(palette["asks" if price > mid_price else "bids"], 0.8)
+        draw.rectangle([left, y_of[price] - half, x_of(qty), y_of[price] + half], fill=color)
+
+    draw.line([(left, top), (left, bottom)], fill=TEXT_COLOR, width=line)
+    mid_y = y_of[mid_price]
+    _draw_dashed_hline(draw, left, right, mid_y, TEXT_COLOR, _line_width(template, 1), 3.7 * pt, 1.6 * pt)
+    label_xy = (left + 0.98 * (right - left), mid_y - 2 * pt)
+    label = f"Current: ${mid_price:,.2f}"
+    x0, y0, x1, y1 = draw.textbbox(label_xy, label, font=_font(template, 9), anchor="rd")
+    draw.rectangle([x0 - 2 * pt, y0 - 2 * pt, x1 + 2 * pt, y1 + 2 * pt], fill=(0, 0, 0, 128))
+    _text(draw, template, label_xy, label, 9, TEXT_COLOR, anchor="rd")
+
+    _text(draw, template, ((left + right) / 2, top - 6 * pt), f"Binance {market['symbol']} {market_type} Market Depth",
+          12, TEXT_COLOR, bold=True, anchor="md")
+
+def _draw_ratio(draw, template: Dict, box: Tuple, market_type: str, market: Dict):
+    """买卖比率柱状图，柱内标注数值"""
+    left, top, right, bottom = box
+    pt, line = template["pt"], _line_width(template, 0.8)
+    ranges, ratios = market["ratio"]["ranges"], market["ratio"]["ratios"]
+    # 坐标范围与 matplotlib 自动缩放一致：柱从 0 开始，远离 0 的一端留 5% 边距
+    low, high = min([0.0, *ratios]), max([0.0, *ratios])
+    margin = (high - low) * 0.05
+    low, high = (low - margin if low < 0 else low), (high + margin if high > 0 else high)
+    if low == high:
+        low, high = -0.055, 0.055
+    y_ticks, decimals = _axis_ticks(low, high, 5)
+    x_margin = (len(ranges) - 0.2) * 0.05
+    x_low, x_high = -0.4 - x_margin, len(ranges) - 0.6 + x_margin
+
+    def x_of(position: float) -> float:
+        return left + (position - x_low) / (x_high - x_low) * (right - left)
+
+    def y_of(value: float) -> float:
+        return bottom - (value - low) / (high - low) * (bottom - top)
+
+    for i, label in enumerate(ranges):
+        draw.line([(x_of(i), top), (x_of(i), bottom + 3.5 * pt)], fill=GRID_COLOR, width=line)
+        _text(draw, template, (x_of(i), bottom + 7 * pt), label, 9, TEXT_COLOR, anchor="ma")
+    for value in y_ticks:
+        draw.line([(left - 3.5 * pt, y_of(value)), (right, y_of(value))], fill=GRID_COLOR, width=line)
+        _text(draw, template, (left - 7 * pt, y_of(value)), _format_tick(value, decimals), 9, TEXT_COLOR, anchor="rm")
+
+    for i, (ratio, color) in enumerate(zip(ratios, ratio_colors(market_type, ratios))):
+        y0, y1 = sorted((y_of(0), y_of(ratio)))
+        draw.rectangle([x_of(i - 0.4), y0, x_of(i + 0.4), y1], fill=color)
+        _text(draw, template, (x_of(i), (y0 + y1) / 2), f"{ratio:.3f}", 8, "white", anchor="mm")
+    draw.line([(left, y_of(0)), (right, y_of(0))], fill="white", width=_line_width(template, 1))
+
+def _draw_table(draw, template: Dict, box: Tuple, orders: List[Tuple[float, float]], color: str, display_order_count: int = 10):
+    """掛单列表：表头 + 价格/数量两列，按价格从高到低"""
+    left, top, right, bottom = box
+    width = right - left
+    rows = sorted(orders, key=lambda x: x[0], reverse=True)
+    # 行高按配置的显示条数计算，掛单更多时也不会画出表格区域
+    row_height = (bottom - top) / (max(len(rows), display_order_count) + 1)
+    body_bottom = top + row_height * (len(rows) + 1)
+    draw.rectangle([left, top, right, top + row_height], fill=HEADER_COLOR)
+    if rows:
+        draw.rectangle([left, top + row_height, right, body_bottom], fill=PLOT_COLOR)
+    draw.line([(left + width / 2, top), (left + width / 2, body_bottom)], fill=GRID_COLOR, width=_line_width(template, 1))
+
+    cells = [("Price (USDT)", "Quantity")] + [(f"${price:,.2f}", f"{qty:.3f}") for price, qty in rows]
+    for i, (price, qty) in enumerate(cells):
+        y = top + row_height * (i + 0.5)
+        cell_color = TEXT_COLOR if i == 0 else color
+        _text(draw, template, (left + 0.04 * width, y), price, 9, cell_color, bold=True, anchor="lm")
+        _text(draw, template, (left + 0.54 * width, y), qty, 9, cell_color, bold=True, anchor="lm")
+
+def _draw_oi_funding(draw, template: Dict, box: Tuple, oi_value, funding_rate, freshness: str = ""):
+    """OI 与资金费率标注，位于合约比率图下方，资金费率按正负着色，下方附更新时间"""
+    if oi_value is None and funding_rate is None:
+        return
+    left, top, right, bottom = box
+    center, y = (left + right) / 2, bottom + 0.22 * (bottom - top)
+    if freshness:
+        _text(draw, template, (center, bottom + 0.36 * (bottom - top)), freshness, 9, "#aaaaaa", anchor="ma")
+    oi_text = f"OI: {oi_value:,.0f}" if oi_value is not None else ""
+    if funding_rate is None:
+        _text(draw, template, (center, y), oi_text, 13, TEXT_COLOR, bold=True, anchor="ma")
+        return
+    rate_color = COLOR_PALETTES["FundingRate"]["positive"] if funding_rate >= 0 else COLOR_PALETTES["FundingRate"]["negative"]
+    if not oi_text:
+        _text(draw, template, (center, y), f"Funding: {funding_rate:+.4f}%", 13, rate_color, bold=True, anchor="ma")
+        return
+    _text(draw, template, (center, y), f"{oi_text} | Funding: ", 13, TEXT_COLOR, bold=True, anchor="ra")
+    _text(draw, template, (center, y), f"{funding_rate:+.4f}%", 13, rate_color, bold=True, anchor="la")
+
+def render_matplotlib(data: Dict, image_format: str = "png", width: int = 1200, height: int = 1600, scale: float = 1) -> bytes:
+    """
+    绘制与 Plotly 版本相同的布局（深度图、比率图、四个掛单列表、OI/资金费率）
+
+    静态背景由 matplotlib 绘制并按尺寸缓存，每次只复制背景并用 Pillow 绘制数据部分
+
+    Args:
+        data: 图表数据字典
+        image_format: 图片格式（位图格式，如 png、jpg）
+        width, height: 图片尺寸（像素，scale 之前）
+        scale: 缩放倍数
+
+    Returns:
+        bytes: 图片字节
+    """
+    from PIL import Image, ImageDraw
+
+    pil_format = Image.registered_extensions().get(f".{image_format.lower()}")
+    if pil_format is None:
+        raise ValueError(f"matplotlib 后端不支持的图片格式: {image_format}")
+
+    with _template_lock:
+        template = _get_matplotlib_template(width, height, scale)
+        boxes = template["boxes"]
+        image = template["background"].copy()
+        draw = ImageDraw.Draw(image, "RGBA")
+        _text(draw, template, (image.width / 2, 0.005 * image.height), data["title"], 16, TEXT_COLOR, bold=True, anchor="ma")
+
+        for market_type in ("Spot", "Futures"):
+            market = data["markets"][market_type]
+            _draw_depth(draw, template, boxes[f"{market_type}_depth"], market_type, market)
+            _draw_ratio(draw, template, boxes[f"{market_type}_ratio"], market_type, market)
+            for side in ("asks", "bids"):
+                _draw_table(draw, template, boxes[f"{market_type}_{side}"], market[side], COLOR_PALETTES[market_type][side],
+                            data.get("display_order_count", 10))
+        _draw_oi_funding(draw, template, boxes["Futures_ratio"], data["oi_value"], data["funding_rate"], freshness_text(data))
+
+    buffer = io.BytesIO()
+    # PNG 使用低压缩等级：图片体积略增，但编码耗时大幅下降
+    image.save(buffer, format=pil_format, **({"compress_level": 1} if pil_format == "PNG" else {}))
+    return buffer.getvalue()
+
+def warm_up(backend: str = "plotly"):
+    """渲染一张极小的图片，使渲染器（Kaleido 或 matplotlib）在第一个真实任务前完成启动"""
+    if backend == "matplotlib":
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=(0.5, 0.5))
+        FigureCanvasAgg(fig)
+        fig.savefig(io.BytesIO(), format="png")
+        return
+    render_spec({"figure": {"data": [{"type": "bar", "x": [1], "y": [1]}], "layout": {}},
+                 "format": "png", "width": 50, "height": 50})
+
+def worker_main(fd: int, backend: str = "plotly"):
+    """
+    工作进程主循环：从管道接收渲染规格，返回 (成功标志, 图片字节或错误信息)，收到 None 时退出
+
+    Args:
+        fd: 父进程传入的管道文件描述符
+        backend: 需要预热的图表后端
+    """
+    from multiprocessing.connection import Connection
+
+    conn = Connection(fd)
+    try:
+        warm_up(backend)
+    except Exception as e:
+        print(f"渲染进程预热失败: {e}", file=sys.stderr)
+
+    while True:
+        try:
+            spec = conn.recv()
+        except EOFError:
+            break
+        if spec is None:
+            break
+        try:
+            conn.send((True, render_spec(spec)))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+    conn.close()
+
+if __name__ == "__main__":
+    worker_main(int(sys.argv[1]), sys.argv[2] if len(sys.argv) > 2 else "plotly")
@@ -83,6 +83,14 @@ class Config:
         }
     }
     
+    # Exchange endpoint configuration (base URLs, can be pointed at the local mock exchange)
+    ENDPOINTS = {
+        "spot_rest": "https://api.binance.com",             # Spot REST API base URL
+        "futures_rest": "https://fapi.binance.com",         # Futures REST API base URL
+        "spot_ws": "wss://stream.binance.com:9443/stream",  # Spot combined-stream WebSocket URL
+        "futures_ws": "wss://fstream.binance.com/stream",   # Futures combined-stream WebSocket URL
+    }
+    
     # Send interval configuration (seconds)
     SEND_INTERVALS = {
         "text_output": 300,  # Text analysis sent every 5 minutes
@@ -140,8 +148,86 @@ class Config:
         "chart_height": 800,        # Chart height
         "theme": "dark",         # Chart theme
         "format": "png",          # Chart format
-        "send_delay": 3,          # Discord send interval delay (seconds) to avoid message loss
-        "webhook_delay": 2,       # Delay between multiple webhooks of same currency (seconds)
+        "backend": "plotly",      # Chart renderer: "plotly" (Kaleido) or "matplotlib" (cached Agg background + Pillow, ~4x faster, no headless browser)
+        "render_workers": 2,      # Long-lived image render worker processes (0 = render on a background thread)
+        "render_timeout": 60,     # Per-chart render timeout (seconds); the worker is restarted on timeout
+        "render_max_jobs_per_worker": 50,  # Recycle a render worker after this many charts
+        "skip_unchanged": True,   # Skip the render when the chart inputs fingerprint matches the last send
+        "unchanged_action": "skip",  # "skip" sends nothing, "notice" sends a short "unchanged" text instead
+        "fingerprint_quantity_digits": 2,  # Significant digits of level quantities in the fingerprint
+        "fingerprint_ratio_decimals": 2,   # Decimals of band ratios in the fingerprint
+        "fingerprint_oi_digits": 3,        # Significant digits of open interest in the fingerprint
+        "early_render_ratio_delta": None,  # Render before the interval when a band ratio moves this much (None = off)
+        "early_render_level_changes": None,  # Render early when this many top-N levels appear/disappear (None = off)
+        "fingerprint_check_interval": 5,   # Minimum seconds between early-render fingerprint checks per symbol
+        "early_render_min_interval": 30,   # Minimum seconds between two charts of the same symbol
+    }
+    
+    # Shared HTTP client configuration
+    HTTP_CLIENT_CONFIG = {
+        "limit": 100,              # Maximum open connections in total
+        "limit_per_host": 10,      # Maximum open connections per host
+        "keepalive_timeout": 60,   # Idle keep-alive time of pooled connections (seconds)
+        "dns_cache_ttl": 300,      # DNS cache lifetime (seconds)
+        "total_timeout": 30,       # Total request timeout (seconds)
+        "connect_timeout": 10,     # Connection timeout (seconds)
+    }
+    
+    # Discord webhook delivery configuration (pacing follows the X-RateLimit-* headers)
+    WEBHOOK_CONFIG = {
+        "max_retries": 3,          # Retries of a message answered with 429
+        "max_retry_after": 60,     # Give up instead of waiting when retry_after exceeds this (seconds)
+        "batch_window": 1.0,       # Merge messages to the same webhook sent within this window (seconds, 0 = off)
+        "max_attachments": 10,     # Discord's attachment limit per message
+        "max_content_length": 2000,  # Discord's content length limit per message
+        "max_batch_bytes": 8 * 1024 * 1024,  # Upload size cap of one merged message (bytes)
+    }
+    
+    # Disk-backed outbound delivery spool (rendered charts and notices waiting to be sent)
+    DELIVERY_SPOOL_CONFIG = {
+        "directory": "spool",      # Spool directory, one subdirectory per output (payload + metadata JSON per message)
+        "max_entries": 100,        # Maximum spooled messages; the oldest are dropped beyond this
+        "max_per_symbol": 1,       # Messages kept per symbol and kind; older ones are dropped in a backlog
+        "retry_base_delay": 2,     # First retry delay (seconds), doubled on each failure
+        "retry_max_delay": 300,    # Maximum retry delay (seconds)
+        "max_attempts": 20,        # Drop a message after this many failed delivery attempts
+    }
+    
+    # Graceful shutdown configuration
+    SHUTDOWN_CONFIG = {
+        "deadline": 25,            # Seconds allowed for draining outputs on stop (keep below systemd's TimeoutStopSec)
+        "checkpoint_file": "spool/checkpoint.json",  # Warmup state saved on stop and restored on the next start
+        "checkpoint_max_age": 300, # Ignore a checkpoint older than this on start (seconds)
+    }
+    
+    # Open interest / funding rate prefetch configuration
+    OI_FUNDING_CONFIG = {
+        "mark_price_stream": "markPrice@1s",  # Futures stream carrying funding rate and mark price (None = poll premiumIndex)
+        "refresh_interval": 30,    # Open interest polling interval for all symbols (seconds)
+        "oi_batch_size": 10,       # Open interest requests in flight at once during a refresh
+        "cache_timeout": 30,       # Cache lifetime for on-demand reads (seconds)
+        "stale_while_revalidate": 300,  # After cache_timeout, serve the old value this long while refreshing it in the background (seconds); older entries are evicted
+        "max_entries": 500,        # Maximum cached entries; the least recently used are evicted beyond this
+        "stale_after": 120,        # Charts mark OI/funding as stale when older than this (seconds)
+    }
+    
+    # Profiling configuration
+    PROFILING_CONFIG = {
+        "enabled": False,          # Whether to record per-stage timing histograms (can be toggled at runtime)
+        "signal": "SIGUSR1",       # Signal that prints stage timings and starts a stack profile
+        "sample_duration": 30,     # Stack profile duration (seconds)
+        "sample_interval": 0.005,  # Stack sampling interval (seconds)
+        "output_dir": "profiles",  # Directory for stack profiles and stage reports
+    }
+    
+    # Memory report configuration
+    MEMORY_REPORT_CONFIG = {
+        "enabled": True,                     # Whether to emit periodic memory reports
+        "interval": 600,                     # Report interval (seconds)
+        "history_size": 12,                  # Number of reports kept for growth-rate calculation
+        "rss_growth_alert_mb_per_hour": 50,  # Alert when RSS grows faster than this
+        "send_queue_alert": 10,              # Alert when more charts than this are waiting to be sent
+        "output_file": None,                 # Optional JSON Lines file for reports
     }
     
     # Analysis range configuration
@@ -189,6 +275,28 @@ class Config:
             return cls.OUTPUT_OPTIONS["enable_chart_output"]
         return False 
     
+    @classmethod
+    def use_mock_exchange(cls, base_url: str = "http://127.0.0.1:5000"):
+        """
+        Point all exchange endpoints and Discord webhooks at a local mock exchange (market_depth_server.py)
+        
+        Args:
+            base_url: Base URL of the mock exchange HTTP server
+        """
+        base_url = base_url.rstrip("/")
+        ws_base = base_url.replace("https://", "wss://").replace("http://", "ws://")
+        cls.ENDPOINTS.update({
+            "spot_rest": base_url,
+            "futures_rest": base_url,
+            "spot_ws": f"{ws_base}/spot/stream",
+            "futures_ws": f"{ws_base}/futures/stream",
+        })
+        
+        # Keep the webhook id/token paths so webhooks shared between currencies stay shared
+        for webhooks in cls.DISCORD_WEBHOOKS.values():
+            for output_type, urls in webhooks.items():
+                webhooks[output_type] = [url.replace("https://discord.com", base_url) for url in urls]
+    
     @classmethod
     def set_warmup_preset(cls, preset_name: str):
         """Set warmup preset mode"""
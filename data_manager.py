@@ -4,14 +4,70 @@
 负责从币安API获取和维护订单簿数据，提供统一的数据接口
 """
 
-import requests
-import websocket
+import bisect
 import json
-import pandas as pd
+import os
+import sys
 import time
 import threading
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from config import Config
+import profiler
+from memory_report import estimate_float_dict
+from http_client import http_client, REQUEST_ERRORS
+
+def calculate_mid_price(bids: Dict[float, float], asks: Dict[float, float]) -> Optional[float]:
+    """根据买卖盘计算中间价，任一侧为空时返回None"""
+    if not bids or not asks:
+        return None
+    return (max(bids) + min(asks)) / 2
+
+@profiler.timed("analytics.filtered_orders")
+def filter_orders(bids: Dict[float, float], asks: Dict[float, float], min_quantity: float, limit: int = 10) -> Tuple[List[Tuple], List[Tuple]]:
+    """
+    过滤小额挂单并排序（纯函数）
+
+    Returns:
+        Tuple: (买单按价格降序前limit档, 卖单按价格升序前limit档)
+    """
+    filtered_bids = sorted(((price, qty) for price, qty in bids.items() if qty >= min_quantity), reverse=True)
+    filtered_asks = sorted((price, qty) for price, qty in asks.items() if qty >= min_quantity)
+    return filtered_bids[:limit], filtered_asks[:limit]
+
+def _volume_ratio(bids_volume: float, asks_volume: float) -> Tuple:
+    delta = bids_volume - asks_volume
+    total = bids_volume + asks_volume
+    ratio = delta / total if total > 0 else 0
+    return ratio, bids_volume, asks_volume, delta
+
+@profiler.timed("analytics.depth_ratio")
+def calculate_depth_ratio(bids: Dict[float, float], asks: Dict[float, float], mid_price: Optional[float], price_range_percent: float = 1.0) -> Tuple:
+    """
+    计算距离中间价一定百分比范围内的买卖比率（纯函数）
+
+    Returns:
+        Tuple: (比率, 买单量, 卖单量, 差值)，中间价为None时比率为None
+    """
+    if mid_price is None:
+        return None, 0, 0, 0
+    lower_bound = mid_price * (1 - price_range_percent / 100)
+    upper_bound = mid_price * (1 + price_range_percent / 100)
+    bids_volume = sum(qty for price, qty in bids.items() if price >= lower_bound)
+    asks_volume = sum(qty for price, qty in asks.items() if price <= upper_bound)
+    return _volume_ratio(bids_volume, asks_volume)
+
+@profiler.timed("analytics.depth_ratio")
+def calculate_depth_ratio_range(bids: Dict[float, float], asks: Dict[float, float], mid_price: Optional[float], lower_percent: float, upper_percent: float) -> Tuple:
+    """计算距离中间价 lower_percent% ~ upper_percent% 区间内的买卖比率（纯函数）"""
+    if mid_price is None:
+        return None, 0, 0, 0
+    lower_bound = mid_price * (1 - upper_percent / 100)
+    upper_bound = mid_price * (1 + upper_percent / 100)
+    inner_lower_bound = mid_price * (1 - lower_percent / 100)
+    inner_upper_bound = mid_price * (1 + lower_percent / 100)
+    bids_volume = sum(qty for price, qty in bids.items() if lower_bound <= price < inner_lower_bound)
+    asks_volume = sum(qty for price, qty in asks.items() if inner_upper_bound < price <= upper_bound)
+    return _volume_ratio(bids_volume, asks_volume)
 
 class OrderBookManager:
     """订单簿管理器"""
@@ -20,6 +76,8 @@ class OrderBookManager:
         self.symbol = symbol.upper()
         self.is_futures = is_futures
         self.order_book = {"bids": {}, "asks": {}}
+        # 每侧价格的升序索引，与 order_book 同步维护，用于直接读取最优的若干档
+        self.sorted_prices = {"bids": [], "asks": []}
         self.order_changes = {"bids": {}, "asks": {}}
         self.removed_orders = {"bids": {}, "asks": {}}
         self.last_update_id = 0
@@ -36,11 +94,11 @@ class OrderBookManager:
     def get_initial_snapshot(self, limit: int = 1000):
         """获取初始订单簿快照"""
         if self.is_futures:
-            base_url = "https://fapi.binance.com"
+            base_url = Config.ENDPOINTS["futures_rest"]
             endpoint = "/fapi/v1/depth"
             params = {"symbol": self.symbol, "limit": limit}
         else:
-            base_url = "https://api.binance.com"
+            base_url = Config.ENDPOINTS["spot_rest"]
             endpoint = "/api/v3/depth"
             params = {"symbol": self.symbol, "limit": limit}
             
@@ -55,7 +113,7 @@ class OrderBookManager:
                 'Accept': 'application/json'
             }
             
-            response = requests.get(url, params=params, headers=headers)
+            response = http_client.get(url, params=params, headers=headers)
             
             if response.status_code != 200:
                 error_msg = f"REST API请求失败 - URL: {url}, 参数: {params}, 状态码: {response.status_code}"
@@ -64,33 +122,39 @@ class OrderBookManager:
                 raise Exception(error_msg)
             
             data = response.json()
-            
-            with self._lock:
-                # 合约市场使用不同的lastUpdateId字段名
-                if self.is_futures:
-                    self.last_update_id = data.get("E", 0)
-                else:
-                    self.last_update_id = data["lastUpdateId"]
-                
-                # 初始化订单簿
-                self.order_book["bids"].clear()
-                self.order_book["asks"].clear()
-                
-                for price, qty in data["bids"]:
-                    self.order_book["bids"][float(price)] = float(qty)
-                for price, qty in data["asks"]:
-                    self.order_book["asks"][float(price)] = float(qty)
+            self.load_snapshot(data)
             
             if Config.OUTPUT_OPTIONS["enable_console_output"]:
                 print(f"{self.symbol} {'合约' if self.is_futures else '现货'}初始快照加载完成，lastUpdateId: {self.last_update_id}")
             
-        except requests.exceptions.RequestException as e:
+        except REQUEST_ERRORS as e:
             raise Exception(f"网络请求错误: {str(e)}")
         except json.JSONDecodeError as e:
             raise Exception(f"JSON解析错误: {str(e)}, 响应内容: {response.text}")
         except Exception as e:
             raise Exception(f"获取{self.symbol}{'合约' if self.is_futures else '现货'}数据时出错: {str(e)}")
 
+    def load_snapshot(self, data: Dict):
+        """从REST深度快照数据初始化订单簿"""
+        with self._lock:
+            # 合约市场使用不同的lastUpdateId字段名
+            if self.is_futures:
+                self.last_update_id = data.get("E", 0)
+            else:
+                self.last_update_id = data["lastUpdateId"]
+            
+            # 初始化订单簿
+            self.order_book["bids"].clear()
+            self.order_book["asks"].clear()
+            
+            for price, qty in data["bids"]:
+                self.order_book["bids"][float(price)] = float(qty)
+            for price, qty in data["asks"]:
+                self.order_book["asks"][float(price)] = float(qty)
+            for side in ("bids", "asks"):
+                self.sorted_prices[side] = sorted(self.order_book[side])
+
+    @profiler.timed("apply_update")
     def apply_update(self, bids_updates: List, asks_updates: List):
         """应用增量更新到订单簿"""
         with self._lock:
@@ -100,19 +164,24 @@ class OrderBookManager:
                 self.first_update_time = time.time()
             
             def update_side(updates: List, side: str):
+                book = self.order_book[side]
+                prices = self.sorted_prices[side]
                 for price, qty in updates:
                     price = float(price)
                     qty = float(qty)
-                    old_qty = self.order_book[side].get(price, 0)
+                    old_qty = book.get(price, 0)
                     change = qty - old_qty
                     
                     if qty == 0:
-                        self.order_book[side].pop(price, None)
+                        if book.pop(price, None) is not None:
+                            del prices[bisect.bisect_left(prices, price)]
                         if old_qty > self.min_quantity:
                             self.order_changes[side][price] = -old_qty
                             self.removed_orders[side][price] = old_qty
                     else:
-                        self.order_book[side][price] = qty
+                        if price not in book:
+                            bisect.insort(prices, price)
+                        book[price] = qty
                         if abs(change) > self.min_quantity:
                             self.order_changes[side][price] = change
 
@@ -121,7 +190,8 @@ class OrderBookManager:
             
             # 检查是否完成预热
             if not self.is_warmed_up:
-                self._check_warmup_status()
+                with profiler.stage("warmup_check"):
+                    self._check_warmup_status()
 
     def _check_warmup_status(self):
         """检查数据预热状态"""
@@ -186,72 +256,126 @@ class OrderBookManager:
                 "min_quantity": self.min_quantity
             }
 
+    def _top_levels(self, side: str, min_quantity: float, limit: int) -> List[Tuple[float, float]]:
+        """从有序价格索引由最优价向外读取数量大于阈值的前limit档（调用方持有锁）"""
+        book = self.order_book[side]
+        prices = reversed(self.sorted_prices[side]) if side == "bids" else self.sorted_prices[side]
+        levels = []
+        for price in prices:
+            qty = book[price]
+            if qty > min_quantity:
+                levels.append((price, qty))
+                if len(levels) >= limit:
+                    break
+        return levels
+
+    def capture_snapshot(self, include_changes: bool = False, clear_changes: bool = False,
+                         top_levels: int = 0) -> Optional[Dict]:
+        """
+        在一次加锁内复制订单簿，返回一致的普通数据快照（之后的计算无需持锁）
+
+        Args:
+            include_changes: 同时复制订单变化和移除记录（文本报告使用）
+            clear_changes: 复制后在同一次加锁内清空变化记录，两次报告之间的变化不会遗漏
+            top_levels: 大于0时同时从有序价格索引读取每侧前N个数量大于本管理器阈值的档位
+
+        Returns:
+            Dict: {"symbol", "is_futures", "min_quantity", "bids", "asks", "mid_price", "timestamp"}，
+                  include_changes 时另含 "order_changes" 和 "removed_orders"，
+                  top_levels 时另含 "top_levels"（{"bids": 价格降序, "asks": 价格升序}）；订单簿为空时返回None
+        """
+        with self._lock:
+            if not self.order_book["bids"] or not self.order_book["asks"]:
+                return None
+            bids = self.order_book["bids"].copy()
+            asks = self.order_book["asks"].copy()
+            mid_price = (self.sorted_prices["bids"][-1] + self.sorted_prices["asks"][0]) / 2
+            if top_levels:
+                levels = {side: self._top_levels(side, self.min_quantity, top_levels) for side in ("bids", "asks")}
+            if include_changes:
+                order_changes = {side: changes.copy() for side, changes in self.order_changes.items()}
+                removed_orders = {side: removed.copy() for side, removed in self.removed_orders.items()}
+                if clear_changes:
+                    for side in ("bids", "asks"):
+                        self.order_changes[side].clear()
+                        self.removed_orders[side].clear()
+        snapshot = {
+            "symbol": self.symbol,
+            "is_futures": self.is_futures,
+            "min_quantity": self.min_quantity,
+            "bids": bids,
+            "asks": asks,
+            "mid_price": mid_price,
+            "timestamp": time.time()
+        }
+        if include_changes:
+            snapshot["order_changes"] = order_changes
+            snapshot["removed_orders"] = removed_orders
+        if top_levels:
+            snapshot["top_levels"] = levels
+        return snapshot
+
     def get_filtered_orders(self, limit: int = 10) -> Tuple[List[Tuple], List[Tuple]]:
         """获取过滤后的订单数据（用于图表显示）"""
         with self._lock:
-            # 过滤并排序买单 - 买单按价格从高到低排序（降序）
-            bids = [(price, qty) for price, qty in self.order_book["bids"].items() if qty >= self.min_quantity]
-            bids = sorted(bids, reverse=True)
-            
-            # 过滤并排序卖单 - 卖单按价格从低到高排序（升序）
-            asks = [(price, qty) for price, qty in self.order_book["asks"].items() if qty >= self.min_quantity]
-            asks = sorted(asks, reverse=False)
-            
-            return bids[:limit], asks[:limit]
+            return filter_orders(self.order_book["bids"], self.order_book["asks"], self.min_quantity, limit)
 
     def calculate_depth_ratio(self, price_range_percent: float = 1.0) -> Tuple:
         """计算距离当前价格一定百分比范围内的买卖比率"""
         with self._lock:
-            if not self.order_book["bids"] or not self.order_book["asks"]:
-                return None, 0, 0, 0
-            
-            highest_bid = max(self.order_book["bids"].keys())
-            lowest_ask = min(self.order_book["asks"].keys())
-            mid_price = (highest_bid + lowest_ask) / 2
-            
-            lower_bound = mid_price * (1 - price_range_percent / 100)
-            upper_bound = mid_price * (1 + price_range_percent / 100)
-            
-            bids_in_range = {price: qty for price, qty in self.order_book["bids"].items() if price >= lower_bound}
-            bids_volume = sum(bids_in_range.values())
-            
-            asks_in_range = {price: qty for price, qty in self.order_book["asks"].items() if price <= upper_bound}
-            asks_volume = sum(asks_in_range.values())
-            
-            delta = bids_volume - asks_volume
-            total = bids_volume + asks_volume
-            ratio = delta / total if total > 0 else 0
-            
-            return ratio, bids_volume, asks_volume, delta
+            bids, asks = self.order_book["bids"], self.order_book["asks"]
+            return calculate_depth_ratio(bids, asks, calculate_mid_price(bids, asks), price_range_percent)
 
     def calculate_depth_ratio_range(self, lower_percent: float, upper_percent: float) -> Tuple:
         """计算指定价格范围内的买卖比率"""
         with self._lock:
-            if not self.order_book["bids"] or not self.order_book["asks"]:
-                return None, 0, 0, 0
-            
-            highest_bid = max(self.order_book["bids"].keys())
-            lowest_ask = min(self.order_book["asks"].keys())
-            mid_price = (highest_bid + lowest_ask) / 2
-            
-            lower_bound = mid_price * (1 - upper_percent / 100)
-            upper_bound = mid_price * (1 + upper_percent / 100)
-            inner_lower_bound = mid_price * (1 - lower_percent / 100)
-            inner_upper_bound = mid_price * (1 + lower_percent / 100)
-            
-            bids_in_range = {price: qty for price, qty in self.order_book["bids"].items() 
-                            if price >= lower_bound and price < inner_lower_bound}
-            bids_volume = sum(bids_in_range.values())
-            
-            asks_in_range = {price: qty for price, qty in self.order_book["asks"].items() 
-                            if price <= upper_bound and price > inner_upper_bound}
-            asks_volume = sum(asks_in_range.values())
-            
-            delta = bids_volume - asks_volume
-            total = bids_volume + asks_volume
-            ratio = delta / total if total > 0 else 0
-            
-            return ratio, bids_volume, asks_volume, delta
+            bids, asks = self.order_book["bids"], self.order_book["asks"]
+            return calculate_depth_ratio_range(bids, asks, calculate_mid_price(bids, asks), lower_percent, upper_percent)
+
+    def get_memory_usage(self) -> Dict:
+        """估算订单簿及变化记录占用的内存（字节）"""
+        with self._lock:
+            bid_levels = len(self.order_book["bids"])
+            ask_levels = len(self.order_book["asks"])
+            order_book_bytes = sum(estimate_float_dict(self.order_book[side]) for side in ("bids", "asks"))
+            # 价格索引与订单簿共享价格对象，只计算列表本身
+            price_index_bytes = sum(sys.getsizeof(self.sorted_prices[side]) for side in ("bids", "asks"))
+            order_changes_bytes = sum(estimate_float_dict(self.order_changes[side]) for side in ("bids", "asks"))
+            removed_orders_bytes = sum(estimate_float_dict(self.removed_orders[side]) for side in ("bids", "asks"))
+        
+        return {
+            "bid_levels": bid_levels,
+            "ask_levels": ask_levels,
+            "order_book_bytes": order_book_bytes,
+            "price_index_bytes": price_index_bytes,
+            "order_changes_bytes": order_changes_bytes,
+            "removed_orders_bytes": removed_orders_bytes,
+            "total_bytes": order_book_bytes + price_index_bytes + order_changes_bytes + removed_orders_bytes
+        }
+
+    def get_checkpoint(self) -> Dict:
+        """导出预热状态（订单簿本身不保存：增量流中断后必须重新获取REST快照）"""
+        with self._lock:
+            return {
+                "update_count": self.update_count,
+                "is_warmed_up": self.is_warmed_up,
+                "warmup_elapsed": time.time() - self.first_update_time if self.first_update_time else None,
+            }
+
+    def restore_checkpoint(self, state: Dict):
+        """恢复预热状态，重启后无需再次等待预热"""
+        with self._lock:
+            self.update_count = state.get("update_count", 0)
+            self.is_warmed_up = bool(state.get("is_warmed_up"))
+            if state.get("warmup_elapsed") is not None:
+                self.first_update_time = time.time() - state["warmup_elapsed"]
+
+    def clear_book(self):
+        """清空订单簿及价格索引（数据不连续、重新获取快照之前调用）"""
+        with self._lock:
+            for side in ("bids", "asks"):
+                self.order_book[side].clear()
+                self.sorted_prices[side].clear()
 
     def clear_changes(self):
         """清空订单变化记录"""
@@ -267,6 +391,8 @@ class DataManager:
     def __init__(self):
         self.spot_managers = {}
         self.futures_managers = {}
+        # 深度以外的组合流（如 markPrice）按流类型转发给注册的处理函数
+        self.stream_handlers: Dict[str, Callable[[Dict], None]] = {}
         self._init_managers()
 
     def _init_managers(self):
@@ -305,6 +431,7 @@ class DataManager:
             "futures": self.futures_managers
         }
 
+    @profiler.timed("warmup_check")
     def is_system_ready_for_output(self) -> bool:
         """检查整个系统是否准备好输出"""
         if not Config.DATA_WARMUP_CONFIG["enable_warmup_check"]:
@@ -347,31 +474,88 @@ class DataManager:
         
         return status
 
+    def save_checkpoint(self, path: str):
+        """把所有订单簿的预热状态写入检查点文件（先写临时文件再原子替换）"""
+        state = {"saved_at": time.time(), "markets": {}}
+        for market, managers in (("spot", self.spot_managers), ("futures", self.futures_managers)):
+            for symbol, manager in managers.items():
+                state["markets"][f"{market}:{symbol}"] = manager.get_checkpoint()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+    def load_checkpoint(self, path: str, max_age: float) -> int:
+        """
+        从检查点文件恢复预热状态
+
+        Args:
+            path: 检查点文件
+            max_age: 检查点的最长有效时间（秒），过期则忽略
+
+        Returns:
+            int: 恢复了状态的订单簿数量
+        """
+        try:
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            print(f"读取检查点失败: {e}")
+            return 0
+        if time.time() - state.get("saved_at", 0) > max_age:
+            return 0
+        restored = 0
+        for market, managers in (("spot", self.spot_managers), ("futures", self.futures_managers)):
+            for symbol, manager in managers.items():
+                if f"{market}:{symbol}" in state.get("markets", {}):
+                    manager.restore_checkpoint(state["markets"][f"{market}:{symbol}"])
+                    restored += 1
+        if restored and Config.OUTPUT_OPTIONS["enable_console_output"]:
+            print(f"已从检查点恢复 {restored} 个订单簿的预热状态（{time.time() - state['saved_at']:.0f}秒前保存）")
+        return restored
+
+    def register_stream_handler(self, kind: str, handler: Callable[[Dict], None]):
+        """
+        注册深度以外的组合流的处理函数
+
+        Args:
+            kind: 流类型，即流名称中交易对之后的部分（不区分大小写，忽略 @1s 等后缀），如 "markPrice"
+            handler: 处理函数，参数为消息中的 data 字段
+        """
+        self.stream_handlers[kind.lower()] = handler
+
     def process_websocket_message(self, message: str, is_futures: bool = None):
         """处理WebSocket消息"""
         try:
-            data = json.loads(message)
+            with profiler.stage("decode"):
+                data = json.loads(message)
             
             if "result" in data and "id" in data:
                 if Config.OUTPUT_OPTIONS["enable_console_output"]:
                     print(f"订阅确认: {message}")
                 return
             
-            # 从stream名称中提取symbol和市场类型
-            stream = data.get("stream", "")
-            if "@depth" not in stream:
-                return
+            with profiler.stage("routing"):
+                # 从stream名称中提取symbol和市场类型
+                stream = data.get("stream", "")
+                if "@depth" not in stream:
+                    handler = self.stream_handlers.get(stream.split("@")[1].lower()) if "@" in stream else None
+                    if handler is not None and "data" in data:
+                        handler(data["data"])
+                    return
+                    
+                symbol = stream.split("@")[0].upper()
                 
-            symbol = stream.split("@")[0].upper()
-            
-            # 使用传入的参数来判断市场类型
-            if is_futures is None:
-                # 如果没有传入参数，尝试从stream中判断（这个逻辑可能需要调整）
-                is_futures = "fstream" in message.lower()
-            
-            manager = self.get_manager(symbol, is_futures)
-            if not manager:
-                return
+                # 使用传入的参数来判断市场类型
+                if is_futures is None:
+                    # 如果没有传入参数，尝试从stream中判断（这个逻辑可能需要调整）
+                    is_futures = "fstream" in message.lower()
+                
+                manager = self.get_manager(symbol, is_futures)
+                if not manager:
+                    return
             
             # 合约市场和现货市场的数据格式不同
             if is_futures:
@@ -404,8 +588,7 @@ class DataManager:
                 elif first_update_id > manager.last_update_id + 1:
                     if Config.OUTPUT_OPTIONS["enable_console_output"]:
                         print(f"{symbol} {'合约' if is_futures else '现货'}数据不连续，需重新获取快照！")
-                    manager.order_book["bids"].clear()
-                    manager.order_book["asks"].clear()
+                    manager.clear_book()
                     manager.get_initial_snapshot()
                 
         except Exception as e:
@@ -413,5 +596,20 @@ class DataManager:
                 print(f"处理消息时出错: {e}")
                 print(f"原始消息: {message}")
 
-# 全局数据管理器实例
-data_manager = DataManager() 
\ No newline at end of file
+# 全局数据管理器实例：首次访问时才创建（通常由 main.create_app 创建），导入本模块不会读取交易对配置
+_data_manager: Optional[DataManager] = None
+_instance_lock = threading.Lock()
+
+def get_data_manager() -> DataManager:
+    """获取全局数据管理器（首次调用时按当前配置创建）"""
+    global _data_manager
+    with _instance_lock:
+        if _data_manager is None:
+            _data_manager = DataManager()
+        return _data_manager
+
+def __getattr__(name: str):
+    # 兼容 from data_manager import data_manager
+    if name == "data_manager":
+        return get_data_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}") 
\ No newline at end of file
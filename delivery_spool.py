@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+出站发送队列模块
+把已渲染的消息（图片字节 + 元数据JSON）持久化到磁盘，后台线程按指数退避重试发送，
+每个键（如 交易对/消息类型）只保留最新的若干条，总条数有上限；重启后从磁盘恢复未发送的消息
+"""
+
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from config import Config
+from http_client import http_client
+from memory_report import estimate_size
+
+class DeliverySpool:
+    """磁盘持久化的有界发送队列"""
+
+    def __init__(self, directory: str, deliver: Callable, max_entries: int = 100, max_per_key: int = 1):
+        """
+        Args:
+            directory: 队列目录
+            deliver: 发送协程 deliver(entry, payload, urls) -> 已完成（成功或无需重试）的地址列表，
+                     在共享HTTP客户端的事件循环中执行
+            max_entries: 队列总条数上限，超出时丢弃最旧的消息
+            max_per_key: 每个键保留的条数，超出时丢弃该键最旧的消息
+        """
+        self.directory = directory
+        self.deliver = deliver
+        self.max_entries = max_entries
+        self.max_per_key = max_per_key
+        # 内存中只保留元数据，图片数据发送时再从磁盘读取
+        self.entries: Dict[str, Dict] = {}
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stats = {"spooled": 0, "delivered": 0, "dropped": 0, "retries": 0, "replayed": 0}
+        self._sequence = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def _path(self, entry_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{entry_id}.{suffix}")
+
+    def _write_meta(self, entry: Dict):
+        # 先写临时文件再原子替换，崩溃时不会留下半个元数据文件
+        path = self._path(entry["id"], "json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(path + ".tmp", path)
+
+    def _remove_files(self, entry_id: str):
+        for suffix in ("json", "bin"):
+            try:
+                os.remove(self._path(entry_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _load(self):
+        """从磁盘恢复上次未发送完的消息"""
+        os.makedirs(self.directory, exist_ok=True)
+        names = set(os.listdir(self.directory))
+        for name in sorted(names):
+            entry_id, _, suffix = name.rpartition(".")
+            if suffix == "tmp" or (suffix == "bin" and f"{entry_id}.json" not in names):
+                os.remove(os.path.join(self.directory, name))
+                continue
+            if suffix != "json":
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self._remove_files(entry_id)
+                continue
+            if entry.get("has_payload") and f"{entry_id}.bin" not in names:
+                self._remove_files(entry_id)
+                continue
+            entry["next_attempt"] = 0
+            self.entries[entry_id] = entry
+        self.stats["replayed"] = len(self.entries)
+        self._enforce_limits()
+        if self.entries and Config.OUTPUT_OPTIONS["enable_console_output"]:
+            print(f"Delivery spool: replaying {len(self.entries)} pending message(s) from {self.directory}")
+
+    def start(self):
+        """恢复磁盘上的消息并启动发送线程（重复调用无副作用）"""
+        self._stopped = False
+        with self.lock:
+            if self._thread is not None:
+                return
+            self._load()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="delivery-spool")
+            self._thread.start()
+
+    def put(self, key: str, entry: Dict, payload: Optional[bytes] = None) -> str:
+        """
+        写入一条待发送消息（未启动时自动启动；已停止时只写入磁盘，下次启动时发送）
+
+        Args:
+            key: 丢弃策略的分组键，如 "chart:BTCUSDT"
+            entry: 元数据，至少包含 webhooks（地址列表）
+            payload: 附件数据（可选）
+
+        Returns:
+            str: 消息ID
+        """
+        if not self._stopped:
+            self.start()
+        entry_id = f"{time.time_ns():020d}_{next(self._sequence):06d}"
+        entry = dict(entry, id=entry_id, key=key, has_payload=payload is not None, created=time.time(),
+                     attempts=0, next_attempt=0, delivered=[])
+        os.makedirs(self.directory, exist_ok=True)
+        if payload is not None:
+            with open(self._path(entry_id, "bin"), "wb") as f:
+                f.write(payload)
+        self._write_meta(entry)
+        if self._stopped:
+            return entry_id
+        with self.lock:
+            self.entries[entry_id] = entry
+            self.stats["spooled"] += 1
+            self._enforce_limits()
+        self.wakeup.set()
+        return entry_id
+
+    def _drop(self, entry_id: str, reason: str):
+        entry = self.entries.pop(entry_id)
+        self._remove_files(entry_id)
+        self.stats["dropped"] += 1
+        if Config.OUTPUT_OPTIONS["enable_console_output"]:
+            print(f"Delivery spool: dropped {entry['key']} message ({reason})")
+
+    def _enforce_limits(self):
+        # 调用方持有 self.lock；正在发送的消息不丢弃，等发送结束后再处理
+        by_key: Dict[str, List[str]] = {}
+        for entry_id in sorted(self.entries):
+            by_key.setdefault(self.entries[entry_id]["key"], []).append(entry_id)
+        for key, ids in by_key.items():
+            for entry_id in ids[:-self.max_per_key]:
+                if entry_id not in self.in_flight:
+                    self._drop(entry_id, "superseded by a newer one")
+        for entry_id in sorted(self.entries):
+            if len(self.entries) <= self.max_entries:
+                break
+            if entry_id not in self.in_flight:
+                self._drop(entry_id, "spool full")
+
+    def _run(self):
+        while not self._stopped:
+            now = time.time()
+            with self.lock:
+                due = [entry for entry_id, entry in sorted(self.entries.items())
+                       if entry_id not in self.in_flight and entry["next_attempt"] <= now]
+                waiting = [entry["next_attempt"] for entry_id, entry in self.entries.items()
+                           if entry_id not in self.in_flight and entry["next_attempt"] > now]
+                self.in_flight.update(entry["id"] for entry in due)
+            for entry in due:
+                self._dispatch(entry)
+            self.wakeup.wait(min([1.0] + [t - now for t in waiting]))
+            self.wakeup.clear()
+
+    def _dispatch(self, entry: Dict):
+        coroutine = None
+        try:
+            payload = None
+            if entry["has_payload"]:
+                with open(self._path(entry["id"], "bin"), "rb") as f:
+                    payload = f.read()
+            urls = [url for url in entry["webhooks"] if url not in entry["delivered"]]
+            coroutine = self.deliver(entry, payload, urls)
+            future = http_client.submit(coroutine)
+        except Exception as e:
+            if coroutine is not None:
+                coroutine.close()
+            self._finish(entry, [], e)
+            return
+        future.add_done_callback(lambda f: self._on_done(entry, f))
+
+    def _on_done(self, entry: Dict, future):
+        if future.cancelled():
+            # 事件循环停止时被取消：消息留在磁盘上，下次启动时重发
+            with self.lock:
+                self.in_flight.discard(entry["id"])
+            return
+        error = future.exception()
+        self._finish(entry, future.result() if error is None else [], error)
+
+    def _finish(self, entry: Dict, finished: List[str], error: Optional[BaseException]):
+        """记录一次发送结果：全部完成则删除，否则按指数退避安排重试"""
+        cfg = Config.DELIVERY_SPOOL_CONFIG
+        with self.lock:
+            self.in_flight.discard(entry["id"])
+            if entry["id"] not in self.entries:
+                return
+            entry["delivered"].extend(url for url in finished if url not in entry["delivered"])
+            if all(url in entry["delivered"] for url in entry["webhooks"]):
+                self.entries.pop(entry["id"])
+                self._remove_files(entry["id"])
+                self.stats["delivered"] += 1
+            elif entry["attempts"] + 1 >= cfg["max_attempts"]:
+                self._drop(entry["id"], f"gave up after {cfg['max_attempts']} attempts")
+            else:
+                entry["attempts"] += 1
+                delay = min(cfg["retry_max_delay"], cfg["retry_base_delay"] * 2 ** (entry["attempts"] - 1))
+                entry["next_attempt"] = time.time() + delay * random.uniform(0.8, 1.2)
+                self.stats["retries"] += 1
+                try:
+                    self._write_meta(entry)
+                except OSError as e:
+                    print(f"Delivery spool: failed to persist retry state: {e}")
+                if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                    reason = f": {error}" if error else ""
+                    print(f"Delivery spool: {entry['key']} delivery incomplete{reason}, retry {entry['attempts']} in {delay:.0f}s")
+            # 发送期间可能有同键的新消息到达，现在补做丢弃
+            self._enforce_limits()
+        self.wakeup.set()
+
+    def get_metrics(self) -> Dict:
+        """获取队列长度、磁盘占用、内存中元数据占用以及发送/丢弃/重试计数"""
+        with self.lock:
+            entries = list(self.entries.values())
+            metrics = dict(self.stats, pending=len(entries), in_flight=len(self.in_flight))
+        disk_bytes = 0
+        for entry in entries:
+            for suffix in ("json", "bin"):
+                try:
+                    disk_bytes += os.path.getsize(self._path(entry["id"], suffix))
+                except OSError:
+                    pass
+        metrics["disk_bytes"] = disk_bytes
+        metrics["memory_bytes"] = estimate_size(entries)
+        return metrics
+
+    def drain(self, timeout: float) -> bool:
+        """
+        等待已到期的消息发送完毕（处于退避等待中的消息不等待）
+
+        Returns:
+            bool: 超时前是否已没有待发送的消息
+        """
+        deadline = time.monotonic() + timeout
+        self.wakeup.set()
+        while True:
+            now = time.time()
+            with self.lock:
+                busy = bool(self.in_flight) or any(entry["next_attempt"] <= now for entry in self.entries.values())
+            if not busy or self._thread is None:
+                return not busy
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+    def stop(self, timeout: float = 5.0):
+        """停止发送线程，未发送的消息留在磁盘上，下次启动时恢复"""
+        self._stopped = True
+        self.wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+共享HTTP客户端模块
+全应用共用一个 aiohttp 会话（按主机的连接池、长连接、DNS缓存、统一超时），运行在共享异步运行时的事件循环中，
+任意线程或事件循环都可以通过异步或同步接口发起请求，并统计连接复用情况
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import threading
+from collections import defaultdict
+from typing import Dict
+from config import Config
+from async_runtime import AsyncRuntime, async_runtime
+
+class HttpRequestError(Exception):
+    """网络层请求失败（连接失败、超时等），调用方无需依赖 aiohttp 的异常类型"""
+
+# 网络层异常
+REQUEST_ERRORS = (HttpRequestError,)
+
+class HttpResponse:
+    """已读取完毕的HTTP响应（与事件循环无关，可跨线程传递）"""
+
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes, url: str):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.url = url
+
+    @property
+    def status_code(self) -> int:
+        return self.status
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.body)
+
+class HttpClient:
+    """共享HTTP客户端"""
+
+    def __init__(self, runtime: AsyncRuntime = async_runtime):
+        self.runtime = runtime
+        self._session = None  # aiohttp.ClientSession，首次请求时创建
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = defaultdict(int)
+        self.closed = False
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """返回共享运行时的事件循环（首次使用时启动）"""
+        if self.closed:
+            raise RuntimeError("HTTP客户端已关闭")
+        return self.runtime.loop
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _trace_config(self):
+        import aiohttp
+
+        trace = aiohttp.TraceConfig()
+
+        async def on_connection_create_end(session, context, params):
+            self._count("connections_created")
+
+        async def on_connection_reuseconn(session, context, params):
+            self._count("connections_reused")
+
+        async def on_dns_cache_hit(session, context, params):
+            self._count("dns_cache_hits")
+
+        async def on_dns_cache_miss(session, context, params):
+            self._count("dns_cache_misses")
+
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace
+
+    def _get_session(self):
+        # 只在客户端事件循环线程内调用；aiohttp 在首次请求时才导入
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            cfg = Config.HTTP_CLIENT_CONFIG
+            connector = aiohttp.TCPConnector(
+                limit=cfg["limit"],
+                limit_per_host=cfg["limit_per_host"],
+                keepalive_timeout=cfg["keepalive_timeout"],
+                ttl_dns_cache=cfg["dns_cache_ttl"],
+            )
+            timeout = aiohttp.ClientTimeout(total=cfg["total_timeout"], connect=cfg["connect_timeout"])
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                                  trace_configs=[self._trace_config()])
+        return self._session
+
+    async def _request(self, method: str, url: str, **kwargs) -> HttpResponse:
+        session = self._get_session()
+        self._count("requests")
+        import aiohttp
+
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                body = await response.read()
+                return HttpResponse(response.status, dict(response.headers), body, str(response.url))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._count("errors")
+            raise HttpRequestError(str(e) or type(e).__name__) from e
+        except Exception:
+            self._count("errors")
+            raise
+
+    def submit(self, coroutine) -> concurrent.futures.Future:
+        """把协程提交到共享会话所在的事件循环执行，返回线程安全的 Future"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_started())
+
+    def in_client_loop(self) -> bool:
+        """当前是否运行在客户端事件循环线程中"""
+        return self.runtime.in_loop()
+
+    async def request(self, method: str, url: str, **kwargs) -> HttpResponse:
+        """
+        异步请求，可在任意事件循环中调用（请求实际在共享会话所在的循环中执行）
+
+        Args:
+            method: HTTP方法
+            url: 请求地址
+            **kwargs: 传给 aiohttp 的参数（params、json、data、headers、timeout 等）
+
+        Returns:
+            HttpResponse: 已读取完毕的响应
+        """
+        loop = self._ensure_started()
+        coroutine = self._request(method, url, **kwargs)
+        if asyncio.get_running_loop() is loop:
+            return await coroutine
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, loop))
+
+    def request_sync(self, method: str, url: str, **kwargs) -> HttpResponse:
+        """同步请求（阻塞当前线程），不能在客户端事件循环线程中调用"""
+        loop = self._ensure_started()
+        if self.in_client_loop():
+            raise RuntimeError("不能在HTTP客户端事件循环线程中发起同步请求")
+        return asyncio.run_coroutine_threadsafe(self._request(method, url, **kwargs), loop).result()
+
+    def get(self, url: str, **kwargs) -> HttpResponse:
+        return self.request_sync("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> HttpResponse:
+        return self.request_sync("POST", url, **kwargs)
+
+    def get_stats(self) -> Dict:
+        """获取请求数、新建连接数、复用连接数、DNS缓存命中等统计"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        for key in ("requests", "errors", "connections_created", "connections_reused", "dns_cache_hits", "dns_cache_misses"):
+            stats.setdefault(key, 0)
+        connections = stats["connections_created"] + stats["connections_reused"]
+        stats["reuse_ratio"] = stats["connections_reused"] / connections if connections else 0.0
+        return stats
+
+    def close(self, timeout: float = 5.0):
+        """关闭会话（事件循环属于共享运行时，由 async_runtime.stop() 停止）"""
+        with self._start_lock:
+            if self.closed:
+                return
+            self.closed = True
+        if self._session is None or self.runtime.stopped:
+            return
+        loop = self.runtime.loop
+
+        async def close_session():
+            if self._session is not None:
+                await self._session.close()
+
+        try:
+            asyncio.run_coroutine_threadsafe(close_session(), loop).result(timeout)
+        except Exception as e:
+            if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                print(f"关闭HTTP客户端时出错: {e}")
+
+# 全局共享HTTP客户端
+http_client = HttpClient()
@@ -4,33 +4,60 @@
 整合所有模块，管理WebSocket连接和数据流
 """
 
-import websocket
+import concurrent.futures
 import json
 import threading
 import time
 import asyncio
 import argparse
-from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
 from config import Config
-from data_manager import data_manager
-from text_output import text_output_manager
-from chart_output import chart_output_manager
+import profiler
+from memory_report import MemoryMonitor
+from data_manager import DataManager, get_data_manager
+from http_client import http_client
+from async_runtime import async_runtime
+from webhook_dispatcher import webhook_dispatcher
 
 class MarketDepthMonitor:
     """市场深度监控主程序"""
     
-    def __init__(self):
+    def __init__(self, data_manager: DataManager, text_output=None, chart_output=None, oi_funding_prefetcher=None):
+        """
+        Args:
+            data_manager: 数据管理器
+            text_output: 文本输出管理器（未启用文本输出时为None）
+            chart_output: 图表输出管理器（未启用图表输出时为None）
+            oi_funding_prefetcher: OI和资金费率后台预取器（随图表输出启用）
+
+        通常通过 create_app() 按配置创建
+        """
         self.running = False
         self.websockets = []
+        self.websocket_threads = []
+        self._stop_lock = threading.Lock()
+        self._stopped = False
         self.data_manager = data_manager
-        self.text_output = text_output_manager
-        self.chart_output = chart_output_manager
-        # 创建线程池用于处理图表输出
-        self.chart_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chart-")
+        self.text_output = text_output
+        self.chart_output = chart_output
+        # 每个交易对正在共享事件循环中执行的图表任务（同一交易对同时只提交一个）
+        self.chart_jobs = {}
+        self.oi_funding_prefetcher = oi_funding_prefetcher
+        # 资金费率和标记价格来自合约连接上的 @markPrice 流
+        self.mark_price_stream = Config.OI_FUNDING_CONFIG["mark_price_stream"] if oi_funding_prefetcher is not None else None
+        if self.mark_price_stream:
+            self.data_manager.register_stream_handler(self.mark_price_stream.split("@")[0],
+                                                      oi_funding_prefetcher.manager.update_mark_price)
+        # 内存统计与增长告警
+        self.memory_monitor = MemoryMonitor(
+            self.data_manager, chart_output=self.chart_output,
+            oi_funding=oi_funding_prefetcher.manager if oi_funding_prefetcher is not None else None
+        )
 
     def on_message_spot(self, ws, message):
         """处理现货WebSocket消息"""
+        if not self.running:
+            return
         try:
             # 将消息传递给数据管理器处理（标记为现货）
             self.data_manager.process_websocket_message(message, is_futures=False)
@@ -44,6 +71,8 @@ class MarketDepthMonitor:
 
     def on_message_futures(self, ws, message):
         """处理合约WebSocket消息"""
+        if not self.running:
+            return
         try:
             # 将消息传递给数据管理器处理（标记为合约）
             self.data_manager.process_websocket_message(message, is_futures=True)
@@ -70,19 +99,20 @@ class MarketDepthMonitor:
         if Config.OUTPUT_OPTIONS["enable_console_output"]:
             print("WebSocket连接已建立")
 
-    def _run_chart_async(self, spot_manager, futures_manager):
-        """在新的事件循环中运行异步图表输出"""
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            loop.run_until_complete(
-                self.chart_output.process_and_send(spot_manager, futures_manager)
-            )
-        except Exception as e:
-            if Config.OUTPUT_OPTIONS["enable_console_output"]:
-                print(f"图表输出处理时出错: {e}")
-        finally:
-            loop.close()
+    def _submit_chart(self, spot_manager, futures_manager):
+        """把图表输出提交到共享事件循环；该交易对上一个任务未完成时跳过"""
+        symbol = spot_manager.symbol
+        job = self.chart_jobs.get(symbol)
+        if job is not None and not job.done():
+            return
+        job = async_runtime.submit(self.chart_output.process_and_send(spot_manager, futures_manager))
+        job.add_done_callback(self._on_chart_done)
+        self.chart_jobs[symbol] = job
+
+    @staticmethod
+    def _on_chart_done(job):
+        if not job.cancelled() and job.exception() is not None and Config.OUTPUT_OPTIONS["enable_console_output"]:
+            print(f"图表输出处理时出错: {job.exception()}")
 
     def _check_and_send_outputs(self):
         """检查并发送输出"""
@@ -103,13 +133,13 @@ class MarketDepthMonitor:
                 if not (spot_manager.is_ready_for_output() and futures_manager.is_ready_for_output()):
                     continue
                 
-                # 处理文本输出（同步）
-                if Config.is_output_enabled("text_output"):
+                # 处理文本输出（只在此处复制订单簿，生成和发送在后台进行）
+                if self.text_output is not None and Config.is_output_enabled("text_output"):
                     self.text_output.process_and_send(spot_manager, futures_manager)
                 
-                # 处理图表输出（使用线程池异步处理）
-                if Config.is_output_enabled("chart_output"):
-                    self.chart_executor.submit(self._run_chart_async, spot_manager, futures_manager)
+                # 处理图表输出（在共享事件循环中异步处理）
+                if self.chart_output is not None and Config.is_output_enabled("chart_output"):
+                    self._submit_chart(spot_manager, futures_manager)
                 
         except Exception as e:
             if Config.OUTPUT_OPTIONS["enable_console_output"]:
@@ -117,18 +147,21 @@ class MarketDepthMonitor:
 
     def create_websocket(self, url: str, streams: List[str], message_handler=None):
         """创建WebSocket连接"""
-        def run_websocket():
-            ws = websocket.WebSocketApp(
-                url,
-                on_message=message_handler or self.on_message,
-                on_error=self.on_error,
-                on_close=self.on_close,
-                on_open=lambda ws: self._subscribe_streams(ws, streams)
-            )
-            ws.run_forever()
+        import websocket
+
+        ws = websocket.WebSocketApp(
+            url,
+            on_message=message_handler or self.on_message,
+            on_error=self.on_error,
+            on_close=self.on_close,
+            on_open=lambda ws: self._subscribe_streams(ws, streams)
+        )
+        # 保存连接对象，停止时主动关闭
+        self.websockets.append(ws)
         
-        thread = threading.Thread(target=run_websocket, daemon=True)
+        thread = threading.Thread(target=ws.run_forever, daemon=True)
         thread.start()
+        self.websocket_threads.append(thread)
         return thread
 
     def _subscribe_streams(self, ws, streams: List[str]):
@@ -146,6 +179,8 @@ class MarketDepthMonitor:
     async def start_async_loop(self):
         """启动异步事件循环"""
         while self.running:
+            self.memory_monitor.check()
+            profiler.poll_requests()
             await asyncio.sleep(1)
 
     def start(self):
@@ -164,6 +199,21 @@ class MarketDepthMonitor:
                 print(f"图表输出: {'启用' if Config.is_output_enabled('chart_output') else '禁用'}")
                 print("=" * 60)
 
+            # 提前启动渲染进程（在数据预热期间完成Kaleido预热）并恢复上次未发送的消息
+            if self.chart_output is not None:
+                self.chart_output.start()
+            # 后台预取OI和资金费率，图表只读取缓存
+            if self.oi_funding_prefetcher is not None:
+                self.oi_funding_prefetcher.start()
+
+            # 恢复上次未发送的文本报告
+            if self.text_output is not None:
+                self.text_output.start()
+
+            # 恢复上次停止时保存的预热状态（订单簿仍从REST快照重新获取）
+            shutdown_cfg = Config.SHUTDOWN_CONFIG
+            self.data_manager.load_checkpoint(shutdown_cfg["checkpoint_file"], shutdown_cfg["checkpoint_max_age"])
+
             # 初始化数据管理器
             self.data_manager.get_initial_snapshots()
 
@@ -173,7 +223,7 @@ class MarketDepthMonitor:
             # 现货WebSocket
             if Config.SYMBOLS:
                 spot_streams = [f"{symbol.lower()}@depth" for symbol in Config.SYMBOLS]
-                spot_url = "wss://stream.binance.com:9443/stream"
+                spot_url = Config.ENDPOINTS["spot_ws"]
                 spot_thread = self.create_websocket(spot_url, spot_streams, self.on_message_spot)
                 websocket_threads.append(spot_thread)
                 
@@ -183,7 +233,9 @@ class MarketDepthMonitor:
             # 合约WebSocket  
             if Config.SYMBOLS:
                 futures_streams = [f"{symbol.lower()}@depth" for symbol in Config.SYMBOLS]
-                futures_url = "wss://fstream.binance.com/stream"
+                if self.mark_price_stream:
+                    futures_streams += [f"{symbol.lower()}@{self.mark_price_stream}" for symbol in Config.SYMBOLS]
+                futures_url = Config.ENDPOINTS["futures_ws"]
                 futures_thread = self.create_websocket(futures_url, futures_streams, self.on_message_futures)
                 websocket_threads.append(futures_thread)
                 
@@ -209,20 +261,102 @@ class MarketDepthMonitor:
         finally:
             self.stop()
 
-    def stop(self):
-        """停止监控"""
+    def request_stop(self):
+        """请求停止（可在信号处理器中调用）：主循环在1秒内退出并执行 stop()"""
         self.running = False
+
+    def stop(self, deadline: float = None):
+        """
+        有序停止监控（重复调用无副作用）：停止接收数据，保存检查点，
+        在期限内发出或写入发送队列所有待发送的输出，最后关闭连接
+
+        Args:
+            deadline: 整个停止过程的时间上限（秒），默认使用 SHUTDOWN_CONFIG["deadline"]
+        """
+        with self._stop_lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        self.running = False
+        shutdown_cfg = Config.SHUTDOWN_CONFIG
+        stop_started = time.monotonic()
+        deadline_at = stop_started + (deadline if deadline is not None else shutdown_cfg["deadline"])
+
+        def remaining() -> float:
+            return max(0.0, deadline_at - time.monotonic())
         
-        # 停止图表输出管理器
-        if hasattr(self, 'chart_output'):
-            self.chart_output.stop()
+        # 1. 停止接收：关闭WebSocket连接和OI/资金费率预取
+        for ws in self.websockets:
+            try:
+                ws.close()
+            except Exception as e:
+                if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                    print(f"关闭WebSocket时出错: {e}")
+        for thread in self.websocket_threads:
+            thread.join(min(1.0, remaining()))
+        if self.oi_funding_prefetcher is not None:
+            self.oi_funding_prefetcher.stop(timeout=remaining())
         
-        # 关闭线程池
-        if hasattr(self, 'chart_executor'):
-            self.chart_executor.shutdown(wait=True)
+        # 2. 保存预热状态检查点，重启后无需再次预热
+        try:
+            self.data_manager.save_checkpoint(shutdown_cfg["checkpoint_file"])
+        except OSError as e:
+            print(f"保存检查点失败: {e}")
+        
+        # 3. 在期限内发出待发送的输出，未发出的留在磁盘发送队列中，下次启动时继续发送
+        chart_jobs = [job for job in self.chart_jobs.values() if not job.done()]
+        if chart_jobs:
+            concurrent.futures.wait(chart_jobs, timeout=remaining())
+        if self.text_output is not None:
+            self.text_output.stop(timeout=remaining())
+        if self.chart_output is not None:
+            self.chart_output.stop(timeout=remaining())
+        
+        # 4. 关闭共享HTTP客户端和事件循环（所有出站请求完成之后）
+        oi_funding_metrics = self.oi_funding_prefetcher.manager.get_metrics() if self.oi_funding_prefetcher is not None else None
+        http_stats = http_client.get_stats()
+        webhook_stats = webhook_dispatcher.get_stats()
+        http_client.close(timeout=remaining())
+        async_runtime.stop(timeout=remaining())
             
         if Config.OUTPUT_OPTIONS["enable_console_output"]:
-            print("市场深度监控系统已停止")
+            if profiler.is_enabled():
+                print(profiler.format_report())
+            print(f"HTTP连接统计: 请求 {http_stats['requests']}, 新建连接 {http_stats['connections_created']}, "
+                  f"复用连接 {http_stats['connections_reused']} ({http_stats['reuse_ratio']:.0%}), 错误 {http_stats['errors']}")
+            print(f"Webhook统计: 请求 {webhook_stats['requests']:.0f}, 限流(429) {webhook_stats['rate_limited']:.0f}, "
+                  f"限流等待 {webhook_stats['wait_seconds']:.1f}秒, 合并 {webhook_stats['batched_messages']:.0f}条消息为"
+                  f"{webhook_stats['batches']:.0f}次发送, 去重 {webhook_stats['deduplicated']:.0f}条")
+            if oi_funding_metrics is not None:
+                print(f"OI/资金费率缓存统计: 命中 {oi_funding_metrics['hits']}, 过期命中 {oi_funding_metrics['stale_hits']}, "
+                      f"未命中 {oi_funding_metrics['misses']}, 预取 {oi_funding_metrics['refreshes']}, 合并请求 {oi_funding_metrics['coalesced']}, "
+                      f"请求 {oi_funding_metrics['fetches']} (失败 {oi_funding_metrics['fetch_errors']}), "
+                      f"淘汰 {oi_funding_metrics['evictions']}")
+            render_metrics = self.chart_output.get_render_metrics() if self.chart_output is not None else {}
+            if render_metrics:
+                print(f"渲染进程池统计: 完成 {render_metrics['completed']}, 失败 {render_metrics['failed']}, "
+                      f"超时 {render_metrics['timeouts']}, 回收 {render_metrics['recycled']}, "
+                      f"平均耗时 {render_metrics['avg_render_ms']:.0f}ms")
+            print(f"市场深度监控系统已停止（用时 {time.monotonic() - stop_started:.1f}秒）")
+
+def create_app() -> MarketDepthMonitor:
+    """
+    应用工厂：按当前配置创建各组件并返回监控器
+
+    只导入和创建已启用的输出所需的模块（仅文本输出时不会加载图表渲染和OI/资金费率模块），
+    须在修改完 Config（交易对、模拟交易所等）之后调用
+    """
+    text_output = chart_output = oi_funding_prefetcher = None
+    if Config.is_output_enabled("text_output"):
+        from text_output import get_text_output_manager
+        text_output = get_text_output_manager()
+    if Config.is_output_enabled("chart_output"):
+        from chart_output import get_chart_output_manager
+        from oi_funding_data import get_oi_funding_prefetcher
+        chart_output = get_chart_output_manager()
+        oi_funding_prefetcher = get_oi_funding_prefetcher()
+    return MarketDepthMonitor(get_data_manager(), text_output=text_output, chart_output=chart_output,
+                              oi_funding_prefetcher=oi_funding_prefetcher)
 
 def print_system_info():
     """打印系统信息"""
@@ -235,6 +369,8 @@ def print_system_info():
     print(f"  - 图表输出: {'启用' if Config.is_output_enabled('chart_output') else '禁用'}")
     print(f"  - 控制台输出: {'启用' if Config.OUTPUT_OPTIONS['enable_console_output'] else '禁用'}")
     print(f"  - 保存图表到本地: {'是' if Config.OUTPUT_OPTIONS['save_charts_locally'] else '否'}")
+    print(f"  - 现货接口: {Config.ENDPOINTS['spot_rest']}")
+    print(f"  - 合约接口: {Config.ENDPOINTS['futures_rest']}")
     
     print("\n发送间隔:")
     print(f"  - 文本分析: {Config.SEND_INTERVALS['text_output']}秒")
@@ -258,7 +394,7 @@ def print_system_info():
     print(f"  - 显示订单数量: {Config.CHART_CONFIG['display_order_count']}档")
     print(f"  - 图表尺寸: {Config.CHART_CONFIG['chart_width']}x{Config.CHART_CONFIG['chart_height']}")
     print(f"  - 图表格式: {Config.CHART_CONFIG['format']}")
-    print(f"  - 发送延迟: {Config.CHART_CONFIG['send_delay']}秒")
+    print(f"  - 发送节奏: 按Discord限流头调度, 429最多重试{Config.WEBHOOK_CONFIG['max_retries']}次")
     
     print("\n数据预热设置:")
     print(f"  - 启用预热检查: {'是' if Config.DATA_WARMUP_CONFIG['enable_warmup_check'] else '否'}")
@@ -276,8 +412,18 @@ if __name__ == "__main__":
                           help='跳过交互确认，直接启动监控（用于服务器部署）')
         parser.add_argument('--quiet', action='store_true',
                           help='静默模式，不显示系统信息')
+        parser.add_argument('--mock-exchange', metavar='URL', nargs='?', const='http://127.0.0.1:5000',
+                          help='连接本地模拟交易所（market_depth_server.py），默认 http://127.0.0.1:5000')
+        parser.add_argument('--profile', action='store_true',
+                          help='开启分阶段耗时统计（运行中可通过 SIGUSR1 触发栈采样）')
         args = parser.parse_args()
         
+        if args.mock_exchange:
+            Config.use_mock_exchange(args.mock_exchange)
+        if args.profile:
+            profiler.enable()
+        profiler.install_signal_handler()
+        
         # 打印系统信息（除非是静默模式）
         if not args.quiet:
             print_system_info()
@@ -289,7 +435,7 @@ if __name__ == "__main__":
             print("\n自动启动模式，开始监控...")
         
         # 创建并启动监控器
-        monitor = MarketDepthMonitor()
+        monitor = create_app()
         monitor.start()
         
     except KeyboardInterrupt:
@@ -1,33 +1,248 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
+from flask_cors import CORS
+from flask_sock import Sock
+from werkzeug.serving import WSGIRequestHandler
+from werkzeug.wsgi import LimitedStream
+import argparse
+import json
+import queue
 import random
+import socket
+import threading
 import time
-from flask_cors import CORS
+from collections import defaultdict, deque
+from mock_market import SyntheticMarket
 
 app = Flask(__name__)
 CORS(app)
+sock = Sock(app)
+
+class MockExchange:
+    """本地模拟币安交易所：合成订单簿、组合流推送和Discord webhook接收端"""
+
+    def __init__(self, update_rate=1.0, webhook_rate_limit=5, webhook_rate_window=2.0,
+                 webhook_429_rate=0.0, **market_kwargs):
+        self.update_rate = update_rate
+        self.market_kwargs = market_kwargs
+        self.markets = {}
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+        # Discord webhook 模拟：每个webhook在窗口内允许的请求数，以及随机429的概率
+        self.webhook_rate_limit = webhook_rate_limit
+        self.webhook_rate_window = webhook_rate_window
+        self.webhook_429_rate = webhook_429_rate
+        self.webhook_requests = defaultdict(deque)
+        self.webhook_uploads = deque(maxlen=1000)
+
+        self.stats = defaultdict(int)
+        self._ticker = None
+        # 资金费率按交易对随机游走；@markPrice 流按流名称记录上次推送时间
+        self.funding_rates = {}
+        self.mark_price_sent = {}
+
+    def get_market(self, symbol, is_futures):
+        key = (symbol.upper(), is_futures)
+        with self.lock:
+            if key not in self.markets:
+                self.markets[key] = SyntheticMarket(
+                    symbol, is_futures=is_futures, update_rate=self.update_rate, **self.market_kwargs
+                )
+            return self.markets[key]
+
+    def start(self):
+        if self._ticker is None:
+            self._ticker = threading.Thread(target=self._tick_loop, daemon=True, name="mock-ticker")
+            self._ticker.start()
+
+    def _tick_loop(self):
+        interval = 1.0 / self.update_rate
+        next_tick = time.perf_counter()
+        while True:
+            with self.lock:
+                subscribers = list(self.subscribers)
+                streams = set()
+                for subscriber in subscribers:
+                    streams.update((s, subscriber["is_futures"]) for s in subscriber["streams"])
+                messages = {}
+                for stream, is_futures in streams:
+                    symbol, _, kind = stream.partition("@")
+                    if not kind.startswith("depth") and not (kind.startswith("markprice") and is_futures):
+                        continue
+                    key = (symbol.upper(), is_futures)
+                    if key not in self.markets:
+                        self.markets[key] = SyntheticMarket(
+                            symbol, is_futures=is_futures, update_rate=self.update_rate, **self.market_kwargs
+                        )
+                    if kind.startswith("markprice"):
+                        # 与币安相同：markPrice@1s 每秒推送一次，markPrice 每3秒一次
+                        mark_interval = 1.0 if kind.endswith("@1s") else 3.0
+                        if time.time() - self.mark_price_sent.get(stream, 0) < mark_interval:
+                            continue
+                        self.mark_price_sent[stream] = time.time()
+                        message = {"stream": stream, "data": self._mark_price_event(self.markets[key])}
+                        self.stats["ws_mark_price_updates"] += 1
+                    else:
+                        message = self.markets[key].next_update()
+                        message["stream"] = stream
+                    messages[(stream, is_futures)] = json.dumps(message)
+
+            for subscriber in subscribers:
+                for stream in subscriber["streams"]:
+                    message = messages.get((stream, subscriber["is_futures"]))
+                    if message is None:
+                        continue
+                    try:
+                        subscriber["queue"].put_nowait(message)
+                    except queue.Full:
+                        self.stats["ws_messages_dropped"] += 1
+
+            next_tick += interval
+            time.sleep(max(0, next_tick - time.perf_counter()))
+
+    def depth_snapshot(self, is_futures):
+        symbol = request.args.get("symbol", "BTCUSDT")
+        limit = int(request.args.get("limit", 1000))
+        market = self.get_market(symbol, is_futures)
+        with self.lock:
+            return market.snapshot(limit)
+
+    def open_interest(self, symbol):
+        market = self.get_market(symbol, True)
+        return {
+            "symbol": market.symbol,
+            "openInterest": f"{market.min_quantity * 1000 * random.uniform(0.95, 1.05):.3f}",
+            "time": int(time.time() * 1000),
+        }
+
+    def _funding_rate(self, symbol):
+        rate = self.funding_rates.get(symbol, random.uniform(-0.0003, 0.0003))
+        rate = min(0.0005, max(-0.0005, rate + random.gauss(0, 0.00001)))
+        self.funding_rates[symbol] = rate
+        return rate
+
+    def _mark_price_event(self, market):
+        """markPriceUpdate 事件（调用方持有 self.lock）"""
+        now = int(time.time() * 1000)
+        return {
+            "e": "markPriceUpdate",
+            "E": now,
+            "s": market.symbol,
+            "p": f"{market.mid_price:.8f}",
+            "i": f"{market.mid_price * 0.9999:.8f}",
+            "P": f"{market.mid_price:.8f}",
+            "r": f"{self._funding_rate(market.symbol):.8f}",
+            "T": now - now % 28_800_000 + 28_800_000,
+        }
+
+    def premium_index(self, symbol):
+        market = self.get_market(symbol, True)
+        with self.lock:
+            event = self._mark_price_event(market)
+        return {
+            "symbol": market.symbol,
+            "markPrice": event["p"],
+            "indexPrice": event["i"],
+            "estimatedSettlePrice": event["P"],
+            "lastFundingRate": event["r"],
+            "interestRate": "0.00010000",
+            "nextFundingTime": event["T"],
+            "time": event["E"],
+        }
+
+    def webhook_post(self, webhook_id, token):
+        """记录webhook上传，按窗口限流或随机返回429"""
+        url_key = f"{webhook_id}/{token}"
+        now = time.time()
+        with self.lock:
+            recent = self.webhook_requests[url_key]
+            while recent and now - recent[0] >= self.webhook_rate_window:
+                recent.popleft()
+            reset_after = self.webhook_rate_window - (now - recent[0]) if recent else self.webhook_rate_window
+            limited = len(recent) >= self.webhook_rate_limit or random.random() < self.webhook_429_rate
+            if not limited:
+                recent.append(now)
+            remaining = max(0, self.webhook_rate_limit - len(recent))
+
+        headers = {
+            "X-RateLimit-Limit": str(self.webhook_rate_limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": f"{now + reset_after:.3f}",
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+            "X-RateLimit-Bucket": f"mock-{webhook_id}",
+        }
+
+        if limited:
+            self.stats["webhook_429"] += 1
+            headers["Retry-After"] = f"{reset_after:.3f}"
+            body = {"message": "You are being rate limited.", "retry_after": round(reset_after, 3), "global": False}
+            return jsonify(body), 429, headers
+
+        files = [(name, len(f.read())) for name, f in request.files.items()]
+        content = request.form.get("content") if request.form else (request.get_json(silent=True) or {}).get("content")
+        self.webhook_uploads.append({
+            "time": now,
+            "webhook": url_key,
+            "content_length": len(content or ""),
+            "files": files,
+            "bytes": request.content_length or 0,
+        })
+        self.stats["webhook_uploads"] += 1
+        self.stats["webhook_files"] += len(files)
+
+        if request.args.get("wait") == "true":
+            return jsonify({"id": str(self.stats["webhook_uploads"]), "content": content}), 200, headers
+        return "", 204, headers
+
+    def serve_stream(self, ws, is_futures):
+        """组合流WebSocket：处理SUBSCRIBE/UNSUBSCRIBE并推送订阅流的增量消息"""
+        subscriber = {"streams": set(), "is_futures": is_futures, "queue": queue.Queue(maxsize=100_000)}
+        with self.lock:
+            self.subscribers.append(subscriber)
+        self.stats["ws_connections"] += 1
+        try:
+            while True:
+                incoming = ws.receive(timeout=0)
+                if incoming:
+                    self._handle_ws_request(ws, subscriber, incoming)
+                try:
+                    ws.send(subscriber["queue"].get(timeout=0.05))
+                    self.stats["ws_messages_sent"] += 1
+                    while True:
+                        ws.send(subscriber["queue"].get_nowait())
+                        self.stats["ws_messages_sent"] += 1
+                except queue.Empty:
+                    pass
+        finally:
+            with self.lock:
+                self.subscribers.remove(subscriber)
+
+    def _handle_ws_request(self, ws, subscriber, incoming):
+        try:
+            payload = json.loads(incoming)
+        except ValueError:
+            return
+        method = payload.get("method")
+        params = [p.lower() for p in payload.get("params") or []]
+        result = None
+        with self.lock:
+            if method == "SUBSCRIBE":
+                subscriber["streams"].update(params)
+            elif method == "UNSUBSCRIBE":
+                subscriber["streams"].difference_update(params)
+            elif method == "LIST_SUBSCRIPTIONS":
+                result = sorted(subscriber["streams"])
+        ws.send(json.dumps({"result": result, "id": payload.get("id")}))
+
+exchange = MockExchange()
+
+def generate_mock_order_book(symbol, levels=50):
+    market = SyntheticMarket(symbol, levels=levels)
+    snapshot = market.snapshot(levels)
 
-def generate_mock_order_book(symbol):
-    base_price = 45000 if symbol == "BTCUSDT" else 2500
-    spread = 10 if symbol == "BTCUSDT" else 1
-    
-    bids = []
-    asks = []
-    
-    # Generate bids
-    for i in range(50):
-        price = base_price - (i * spread)
-        quantity = random.random() * 10 + 5
-        bids.append([price, quantity])
-    
-    # Generate asks
-    for i in range(50):
-        price = base_price + (i * spread)
-        quantity = random.random() * 10 + 5
-        asks.append([price, quantity])
-    
     return {
-        "bids": sorted(bids, reverse=True),
-        "asks": sorted(asks)
+        "bids": [[float(price), float(qty)] for price, qty in snapshot["bids"]],
+        "asks": [[float(price), float(qty)] for price, qty in snapshot["asks"]]
     }
 
 def generate_mock_ratio_data():
@@ -35,7 +250,7 @@ def generate_mock_ratio_data():
     buy_volumes = [random.random() * 1000 + 500 for _ in ranges]
     sell_volumes = [random.random() * 1000 + 500 for _ in ranges]
     ratios = [(buy - sell) / (buy + sell) for buy, sell in zip(buy_volumes, sell_volumes)]
-    
+
     return {
         "ranges": ranges,
         "ratios": ratios,
@@ -47,7 +262,7 @@ def generate_mock_ratio_data():
 def get_market_depth(symbol, market_type):
     order_book = generate_mock_order_book(symbol)
     ratio_data = generate_mock_ratio_data()
-    
+
     return jsonify({
         "timestamp": int(time.time() * 1000),
         "symbol": symbol,
@@ -56,5 +271,107 @@ def get_market_depth(symbol, market_type):
         "ratioAnalysis": ratio_data
     })
 
+@app.route('/api/v3/depth')
+def spot_depth():
+    exchange.stats["rest_spot_depth"] += 1
+    return jsonify(exchange.depth_snapshot(is_futures=False))
+
+@app.route('/fapi/v1/depth')
+def futures_depth():
+    exchange.stats["rest_futures_depth"] += 1
+    return jsonify(exchange.depth_snapshot(is_futures=True))
+
+@app.route('/fapi/v1/openInterest')
+def open_interest():
+    exchange.stats["rest_open_interest"] += 1
+    return jsonify(exchange.open_interest(request.args.get("symbol", "BTCUSDT")))
+
+@app.route('/fapi/v1/premiumIndex')
+def premium_index():
+    exchange.stats["rest_premium_index"] += 1
+    symbol = request.args.get("symbol")
+    if symbol:
+        return jsonify(exchange.premium_index(symbol))
+    symbols = sorted({s for s, is_futures in exchange.markets if is_futures}) or ["BTCUSDT"]
+    return jsonify([exchange.premium_index(s) for s in symbols])
+
+@app.route('/api/webhooks/<webhook_id>/<token>', methods=['POST'])
+def webhook(webhook_id, token):
+    return exchange.webhook_post(webhook_id, token)
+
+@sock.route('/spot/stream')
+def spot_stream(ws):
+    exchange.serve_stream(ws, is_futures=False)
+
+@sock.route('/futures/stream')
+def futures_stream(ws):
+    exchange.serve_stream(ws, is_futures=True)
+
+@app.route('/mock/stats')
+def mock_stats():
+    return jsonify({
+        "stats": dict(exchange.stats),
+        "markets": len(exchange.markets),
+        "subscribers": len(exchange.subscribers),
+    })
+
+@app.route('/mock/webhooks')
+def mock_webhooks():
+    return jsonify(list(exchange.webhook_uploads))
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """
+    HTTP/1.1 保持连接的请求处理器，客户端的连接复用在模拟交易所上也能测到
+
+    Werkzeug 开发服务器总是发送 Connection: close，并在响应后清空套接字中的剩余数据（会读走同一连接上的下一个请求），
+    这里改为由处理器读完请求体，清空步骤只在一个永远不可读的套接字上等待；WebSocket 升级和分块请求体仍按原方式关闭连接
+    """
+    protocol_version = "HTTP/1.1"
+    _idle_socket, _idle_peer = socket.socketpair()
+
+    def make_environ(self):
+        environ = super().make_environ()
+        self._request_body = None
+        if environ.get("HTTP_UPGRADE") or environ.get("wsgi.input_terminated"):
+            self.close_connection = True
+        elif not self.close_connection:
+            self._request_body = environ["wsgi.input"] = LimitedStream(environ["wsgi.input"], int(environ.get("CONTENT_LENGTH") or 0))
+            self.connection = self._idle_socket
+        return environ
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == "connection" and value.lower() == "close" and not self.close_connection:
+            return
+        super().send_header(keyword, value)
+
+    def run_wsgi(self):
+        try:
+            super().run_wsgi()
+        finally:
+            self.connection = self.request
+            body, self._request_body = getattr(self, "_request_body", None), None
+            if body is not None and not self.close_connection:
+                body.exhaust()
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='本地模拟币安交易所')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--update-rate', type=float, default=1.0, help='每个订阅流每秒推送的消息数')
+    parser.add_argument('--levels', type=int, default=1000, help='订单簿每侧档位数量')
+    parser.add_argument('--levels-per-message', type=int, default=20, help='每条增量消息修改的档位数量')
+    parser.add_argument('--gap-probability', type=float, default=0.0, help='注入更新ID缺口的概率')
+    parser.add_argument('--webhook-rate-limit', type=int, default=5, help='每个webhook在窗口内允许的请求数')
+    parser.add_argument('--webhook-429-rate', type=float, default=0.0, help='webhook随机返回429的概率')
+    args = parser.parse_args()
+
+    exchange = MockExchange(
+        update_rate=args.update_rate,
+        webhook_rate_limit=args.webhook_rate_limit,
+        webhook_429_rate=args.webhook_429_rate,
+        levels=args.levels,
+        levels_per_message=args.levels_per_message,
+        gap_probability=args.gap_probability,
+    )
+    exchange.start()
+    app.run(host=args.host, port=args.port, threaded=True, request_handler=KeepAliveRequestHandler)
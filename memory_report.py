@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+内存统计模块
+估算各订单簿管理器、图表发送队列和OI/资金费率缓存占用的内存，周期性输出报告并在增长过快时告警
+"""
+
+import json
+import sys
+import time
+from collections import deque
+from typing import Dict, Optional
+from config import Config
+
+# 一个 float 对象的大小（字节）
+FLOAT_SIZE = sys.getsizeof(0.0)
+
+def estimate_float_dict(d: Dict) -> int:
+    """估算 {float: float} 字典的内存占用（字典本身 + 键值对象）"""
+    return sys.getsizeof(d) + len(d) * 2 * FLOAT_SIZE
+
+def estimate_size(obj, max_depth: int = 12) -> int:
+    """
+    递归估算对象的内存占用（字节），共享对象只计算一次
+
+    Args:
+        obj: 待估算的对象
+        max_depth: 最大递归深度
+
+    Returns:
+        int: 估算字节数
+    """
+    seen = set()
+
+    def sizeof(o, depth):
+        if id(o) in seen or depth > max_depth:
+            return 0
+        seen.add(id(o))
+        size = sys.getsizeof(o)
+        if isinstance(o, dict):
+            size += sum(sizeof(k, depth + 1) + sizeof(v, depth + 1) for k, v in o.items())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            size += sum(sizeof(item, depth + 1) for item in o)
+        elif hasattr(o, "to_plotly_json"):
+            size += sizeof(o.to_plotly_json(), depth + 1)
+        elif hasattr(o, "__dict__"):
+            size += sizeof(vars(o), depth + 1)
+        return size
+
+    return sizeof(obj, 0)
+
+def get_rss_bytes() -> int:
+    """
+    获取当前进程的常驻内存（RSS）：Linux 读取 /proc，其他 Unix 退化为峰值RSS，
+    Windows 使用 psutil（未安装时返回0）
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return 0
+        return psutil.Process().memory_info().rss
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class MemoryMonitor:
+    """内存统计与增长告警"""
+
+    def __init__(self, data_manager, chart_output=None, oi_funding=None):
+        self.data_manager = data_manager
+        self.chart_output = chart_output
+        self.oi_funding = oi_funding
+        self.history = deque(maxlen=Config.MEMORY_REPORT_CONFIG["history_size"])
+        self.last_report_time = 0.0
+        self.latest_report: Optional[Dict] = None
+
+    def collect(self) -> Dict:
+        """采集一次内存报告"""
+        books = {}
+        books_total = 0
+        for market_type, managers in self.data_manager.get_all_managers().items():
+            for symbol, manager in managers.items():
+                usage = manager.get_memory_usage()
+                books[f"{symbol}_{market_type}"] = usage
+                books_total += usage["total_bytes"]
+
+        report = {
+            "timestamp": time.time(),
+            "rss_bytes": get_rss_bytes(),
+            "order_books": books,
+            "order_books_total_bytes": books_total,
+        }
+        estimated_total = books_total
+
+        if self.chart_output is not None:
+            report["chart_output"] = self.chart_output.get_memory_usage()
+            estimated_total += report["chart_output"]["total_bytes"]
+        if self.oi_funding is not None:
+            report["oi_funding_cache"] = self.oi_funding.get_memory_usage()
+            estimated_total += report["oi_funding_cache"]["total_bytes"]
+
+        report["estimated_total_bytes"] = estimated_total
+        return report
+
+    def _growth_rates(self, report: Dict) -> Dict:
+        """根据历史记录计算增长速率（字节/小时）"""
+        if not self.history:
+            return {}
+        oldest = self.history[0]
+        elapsed = report["timestamp"] - oldest["timestamp"]
+        # 至少间隔一个完整报告周期才计算，避免短时间抖动被放大
+        if elapsed < Config.MEMORY_REPORT_CONFIG["interval"]:
+            return {}
+        hours = elapsed / 3600
+        return {
+            "rss_bytes_per_hour": (report["rss_bytes"] - oldest["rss_bytes"]) / hours,
+            "estimated_bytes_per_hour": (report["estimated_total_bytes"] - oldest["estimated_total_bytes"]) / hours,
+        }
+
+    def _alerts(self, report: Dict) -> list:
+        cfg = Config.MEMORY_REPORT_CONFIG
+        alerts = []
+        growth = report.get("growth", {})
+        rss_growth_mb = growth.get("rss_bytes_per_hour", 0) / 1024 / 1024
+        if rss_growth_mb > cfg["rss_growth_alert_mb_per_hour"]:
+            alerts.append(f"RSS growing at {rss_growth_mb:.1f} MB/h (threshold {cfg['rss_growth_alert_mb_per_hour']} MB/h)")
+        queued = report.get("chart_output", {}).get("queued_charts", 0)
+        if queued > cfg["send_queue_alert"]:
+            alerts.append(f"Chart send queue backlog: {queued} charts "
+                          f"({report['chart_output']['queue_bytes'] / 1024 / 1024:.1f} MB)")
+        return alerts
+
+    def check(self, now: Optional[float] = None) -> Optional[Dict]:
+        """到达报告间隔时采集并输出报告，否则返回None"""
+        cfg = Config.MEMORY_REPORT_CONFIG
+        now = now or time.time()
+        if not cfg["enabled"] or now - self.last_report_time < cfg["interval"]:
+            return None
+        self.last_report_time = now
+
+        report = self.collect()
+        report["growth"] = self._growth_rates(report)
+        self.history.append(report)
+        report["alerts"] = self._alerts(report)
+        self.latest_report = report
+        self.emit(report)
+        return report
+
+    def emit(self, report: Dict):
+        """输出报告到控制台和（可选的）JSON Lines文件"""
+        if Config.OUTPUT_OPTIONS["enable_console_output"]:
+            print(self.format_report(report))
+        output_file = Config.MEMORY_REPORT_CONFIG.get("output_file")
+        if output_file:
+            try:
+                with open(output_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(report) + "\n")
+            except OSError as e:
+                print(f"写入内存报告失败: {e}")
+
+    @staticmethod
+    def format_report(report: Dict) -> str:
+        mb = 1024 * 1024
+        lines = [f"📦 内存报告: RSS {report['rss_bytes'] / mb:.1f} MB, "
+                 f"估算数据占用 {report['estimated_total_bytes'] / mb:.2f} MB"]
+        for name, usage in report["order_books"].items():
+            lines.append(f"   {name}: 买{usage['bid_levels']}档/卖{usage['ask_levels']}档, "
+                         f"订单簿 {usage['order_book_bytes'] / 1024:.0f} KB, "
+                         f"价格索引 {usage.get('price_index_bytes', 0) / 1024:.0f} KB, "
+                         f"变化记录 {usage['order_changes_bytes'] / 1024:.0f} KB, "
+                         f"移除记录 {usage['removed_orders_bytes'] / 1024:.0f} KB")
+        if "chart_output" in report:
+            chart = report["chart_output"]
+            lines.append(f"   图表发送队列: {chart['queued_charts']}个, {chart['queue_bytes'] / mb:.2f} MB, "
+                         f"磁盘 {chart.get('spool_disk_bytes', 0) / mb:.2f} MB, 待渲染 {chart.get('render_queue_depth', 0)}个")
+        if "oi_funding_cache" in report:
+            cache = report["oi_funding_cache"]
+            lines.append(f"   OI/资金费率缓存: {cache['entries']}条, {cache['total_bytes'] / 1024:.1f} KB")
+        growth = report.get("growth", {})
+        if growth:
+            lines.append(f"   增长速率: RSS {growth['rss_bytes_per_hour'] / mb:+.1f} MB/h, "
+                         f"数据 {growth['estimated_bytes_per_hour'] / mb:+.2f} MB/h")
+        for alert in report.get("alerts", []):
+            lines.append(f"   ⚠️ {alert}")
+        return "\n".join(lines)
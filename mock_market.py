@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+合成市场数据生成器
+生成逼真的订单簿快照以及币安格式的增量深度消息（现货 U/u，合约 U/u/pu），
+用于对 OrderBookManager 进行压力测试和本地模拟交易所
+"""
+
+import json
+import math
+import random
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from config import Config
+
+# 各币种的默认基准价格（未配置的币种使用DEFAULT）
+DEFAULT_BASE_PRICES = {
+    "BTC": 65000.0,
+    "ETH": 3500.0,
+    "SOL": 150.0,
+    "BNB": 600.0,
+    "DEFAULT": 100.0,
+}
+
+# 币安 @depth 流的默认推送频率（每秒消息数）
+PRODUCTION_UPDATE_RATE = 1.0
+
+class SyntheticMarket:
+    """单个交易对、单个市场的合成订单簿"""
+
+    def __init__(self, symbol: str, is_futures: bool = False, levels: int = 1000,
+                 base_price: Optional[float] = None, price_step: Optional[float] = None,
+                 price_precision: int = 2, update_rate: float = PRODUCTION_UPDATE_RATE,
+                 levels_per_message: int = 20, wall_count: int = 4,
+                 wall_multiplier: float = 3.0, wall_positions: Optional[List[int]] = None,
+                 gap_probability: float = 0.0, volatility: float = 0.0002,
+                 delete_probability: float = 0.1, seed: Optional[int] = None):
+        """
+        Args:
+            symbol: 交易对符号 (e.g., 'BTCUSDT')
+            is_futures: 是否为合约市场
+            levels: 每一侧的价格档位数量
+            base_price: 初始中间价，默认按币种取 DEFAULT_BASE_PRICES
+            price_step: 相邻档位的价格间隔，默认为基准价格的 1bp（1000档约覆盖10%）
+            price_precision: 价格保留的小数位数
+            update_rate: 每秒消息数，用于推进消息中的事件时间
+            levels_per_message: 每条增量消息修改的档位数量（不含价格移动带来的变化）
+            wall_count: 每一侧的大单墙数量
+            wall_multiplier: 大单墙数量相对最小数量阈值的倍数
+            wall_positions: 大单墙距离最优价的档位序号，默认随机分布在前5%的档位中
+            gap_probability: 每条消息注入更新ID缺口的概率
+            volatility: 每条消息中间价随机游走的标准差（相对值）
+            delete_probability: 被修改的档位被撤单（数量为0）的概率
+            seed: 随机种子，便于复现
+        """
+        self.symbol = symbol.upper()
+        self.is_futures = is_futures
+        self.levels = levels
+        self.price_precision = price_precision
+        self.update_rate = update_rate
+        self.levels_per_message = levels_per_message
+        self.wall_count = wall_count
+        self.wall_multiplier = wall_multiplier
+        self.gap_probability = gap_probability
+        self.volatility = volatility
+        self.delete_probability = delete_probability
+        self.rng = random.Random(seed)
+
+        base_currency = self.symbol.replace("USDT", "")
+        self.mid_price = base_price or DEFAULT_BASE_PRICES.get(base_currency, DEFAULT_BASE_PRICES["DEFAULT"])
+        self.price_step = price_step or self.mid_price * 0.0001
+        self.min_quantity = Config.get_min_quantity(self.symbol, "futures" if is_futures else "spot")
+        # 普通档位的平均数量，保证绝大多数档位低于最小数量阈值
+        self.base_quantity = self.min_quantity * 0.05
+
+        # 订单簿以网格序号为键：价格 = 序号 * price_step
+        self.book = {"bids": {}, "asks": {}}
+        self.walls = {"bids": set(), "asks": set()}
+
+        self.last_update_id = self.rng.randint(1_000_000, 9_000_000)
+        self.event_time = int(time.time() * 1000)
+        self.messages_generated = 0
+        self.gaps_injected = 0
+
+        self._build_initial_book(wall_count, wall_positions)
+
+    # ------------------------------------------------------------------
+    # 订单簿构建
+    # ------------------------------------------------------------------
+
+    def _mid_index(self) -> float:
+        return self.mid_price / self.price_step
+
+    def _price(self, index: int) -> float:
+        return round(index * self.price_step, self.price_precision)
+
+    def _random_quantity(self) -> float:
+        return round(self.rng.expovariate(1.0 / self.base_quantity), 4)
+
+    def _wall_quantity(self) -> float:
+        return round(self.min_quantity * self.wall_multiplier * self.rng.uniform(1.0, 2.0), 4)
+
+    def _build_initial_book(self, wall_count: int, wall_positions: Optional[List[int]]):
+        mid_index = self._mid_index()
+        best_bid = math.floor(mid_index)
+        best_ask = best_bid + 1
+
+        for offset in range(self.levels):
+            self.book["bids"][best_bid - offset] = self._random_quantity()
+            self.book["asks"][best_ask + offset] = self._random_quantity()
+
+        if wall_positions is None:
+            max_offset = max(1, self.levels // 20)
+            wall_positions = [self.rng.randrange(max_offset) for _ in range(wall_count)]
+
+        for offset in wall_positions[:wall_count]:
+            if offset >= self.levels:
+                continue
+            self.walls["bids"].add(best_bid - offset)
+            self.walls["asks"].add(best_ask + offset)
+            self.book["bids"][best_bid - offset] = self._wall_quantity()
+            self.book["asks"][best_ask + offset] = self._wall_quantity()
+        self.wall_count = min(self.wall_count, len(self.walls["bids"]))
+
+    def _touch_index(self, side: str) -> int:
+        """按深度加权选择一个档位：越靠近最优价越容易被修改"""
+        mid_index = self._mid_index()
+        depth = min(int(self.rng.expovariate(1.0 / max(1, self.levels / 10))), self.levels - 1)
+        if side == "bids":
+            return math.floor(mid_index) - depth
+        return math.floor(mid_index) + 1 + depth
+
+    def _move_mid(self, changes: Dict[str, Dict[int, float]]):
+        """中间价随机游走，撤掉被穿越的档位并在另一侧补齐"""
+        self.mid_price *= 1 + self.rng.gauss(0, self.volatility)
+        mid_index = self._mid_index()
+        best_bid = math.floor(mid_index)
+        best_ask = best_bid + 1
+
+        for index in [i for i in self.book["bids"] if i > best_bid]:
+            del self.book["bids"][index]
+            self.walls["bids"].discard(index)
+            changes["bids"][index] = 0.0
+        for index in [i for i in self.book["asks"] if i < best_ask]:
+            del self.book["asks"][index]
+            self.walls["asks"].discard(index)
+            changes["asks"][index] = 0.0
+
+        # 补齐最优价附近的空档，并裁剪远端档位以保持档位数量稳定
+        for side, near, step in (("bids", best_bid, -1), ("asks", best_ask, 1)):
+            book = self.book[side]
+            for offset in range(self.levels):
+                index = near + step * offset
+                if index in book:
+                    break
+                qty = self._random_quantity()
+                book[index] = qty
+                changes[side][index] = qty
+            while len(book) > self.levels:
+                far = min(book) if side == "bids" else max(book)
+                del book[far]
+                self.walls[side].discard(far)
+                changes[side][far] = 0.0
+            while len(book) < self.levels:
+                far = min(book) - 1 if side == "bids" else max(book) + 1
+                qty = self._random_quantity()
+                book[far] = qty
+                changes[side][far] = qty
+
+            # 被穿越的大单墙在最优价附近重新挂出
+            while len(self.walls[side]) < self.wall_count:
+                index = near + step * self.rng.randrange(max(1, self.levels // 20))
+                qty = self._wall_quantity()
+                book[index] = qty
+                self.walls[side].add(index)
+                changes[side][index] = qty
+
+    # ------------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------------
+
+    def snapshot(self, limit: int = 1000) -> Dict:
+        """生成 REST 深度快照（/api/v3/depth 或 /fapi/v1/depth 格式）"""
+        bids = sorted(self.book["bids"].items(), reverse=True)[:limit]
+        asks = sorted(self.book["asks"].items())[:limit]
+        snapshot = {
+            "lastUpdateId": self.last_update_id,
+            "bids": [[f"{self._price(i):.{self.price_precision}f}", f"{q:.4f}"] for i, q in bids],
+            "asks": [[f"{self._price(i):.{self.price_precision}f}", f"{q:.4f}"] for i, q in asks],
+        }
+        if self.is_futures:
+            snapshot["E"] = self.event_time
+            snapshot["T"] = self.event_time
+        return snapshot
+
+    def next_update(self) -> Dict:
+        """推进一步并生成一条增量深度消息（组合流格式）"""
+        changes = {"bids": {}, "asks": {}}
+        self._move_mid(changes)
+
+        for _ in range(self.levels_per_message):
+            side = "bids" if self.rng.random() < 0.5 else "asks"
+            index = self._touch_index(side)
+            if index in self.walls[side]:
+                qty = self._wall_quantity()
+            elif index in self.book[side] and self.rng.random() < self.delete_probability:
+                qty = 0.0
+            else:
+                qty = self._random_quantity()
+
+            if qty == 0:
+                self.book[side].pop(index, None)
+            else:
+                self.book[side][index] = qty
+            changes[side][index] = qty
+
+        previous_final_id = self.last_update_id
+        if self.gap_probability and self.rng.random() < self.gap_probability:
+            self.last_update_id += self.rng.randint(2, 100)
+            self.gaps_injected += 1
+
+        change_count = max(1, len(changes["bids"]) + len(changes["asks"]))
+        first_update_id = self.last_update_id + 1
+        final_update_id = self.last_update_id + change_count
+        self.last_update_id = final_update_id
+        self.event_time += max(1, int(1000 / self.update_rate))
+        self.messages_generated += 1
+
+        data = {
+            "e": "depthUpdate",
+            "E": self.event_time,
+            "s": self.symbol,
+            "U": first_update_id,
+            "u": final_update_id,
+            "b": [[f"{self._price(i):.{self.price_precision}f}", f"{q:.4f}"]
+                  for i, q in sorted(changes["bids"].items(), reverse=True)],
+            "a": [[f"{self._price(i):.{self.price_precision}f}", f"{q:.4f}"]
+                  for i, q in sorted(changes["asks"].items())],
+        }
+        if self.is_futures:
+            data["T"] = self.event_time
+            data["pu"] = previous_final_id
+
+        return {"stream": f"{self.symbol.lower()}@depth", "data": data}
+
+    def next_message(self) -> str:
+        """生成一条 JSON 编码的增量消息（与 WebSocket 收到的原始文本一致）"""
+        return json.dumps(self.next_update())
+
+class SyntheticWorkload:
+    """多交易对、现货+合约的合成负载"""
+
+    def __init__(self, symbols: Optional[List[str]] = None, seed: Optional[int] = None, **market_kwargs):
+        """
+        Args:
+            symbols: 交易对列表，默认使用 Config.SYMBOLS
+            seed: 随机种子，每个市场在此基础上派生独立种子
+            market_kwargs: 传递给 SyntheticMarket 的参数（levels、update_rate 等）
+        """
+        self.symbols = [s.upper() for s in (symbols or Config.SYMBOLS)]
+        self.markets: Dict[Tuple[str, bool], SyntheticMarket] = {}
+        for i, symbol in enumerate(self.symbols):
+            for is_futures in (False, True):
+                market_seed = None if seed is None else seed * 1000 + i * 2 + int(is_futures)
+                self.markets[(symbol, is_futures)] = SyntheticMarket(
+                    symbol, is_futures=is_futures, seed=market_seed, **market_kwargs
+                )
+
+    @classmethod
+    def with_symbol_count(cls, count: int, **kwargs) -> "SyntheticWorkload":
+        """生成指定数量的虚拟交易对（SYM0USDT, SYM1USDT, ...）"""
+        return cls([f"SYM{i}USDT" for i in range(count)], **kwargs)
+
+    def get_market(self, symbol: str, is_futures: bool = False) -> Optional[SyntheticMarket]:
+        return self.markets.get((symbol.upper(), is_futures))
+
+    def snapshot(self, symbol: str, is_futures: bool = False, limit: int = 1000) -> Dict:
+        return self.markets[(symbol.upper(), is_futures)].snapshot(limit)
+
+    def messages(self, count: Optional[int] = None) -> Iterator[Tuple[bool, str]]:
+        """
+        轮询所有市场生成增量消息
+
+        Yields:
+            Tuple[bool, str]: (是否为合约, JSON消息文本)
+        """
+        generated = 0
+        markets = list(self.markets.items())
+        while count is None or generated < count:
+            for (symbol, is_futures), market in markets:
+                if count is not None and generated >= count:
+                    return
+                yield is_futures, market.next_message()
+                generated += 1
+
+    def pace(self, handler: Callable[[str, bool], None], duration: float,
+             rate_multiplier: float = 1.0) -> int:
+        """
+        以生产速率的 rate_multiplier 倍向 handler 推送消息，持续 duration 秒
+
+        Args:
+            handler: 消息处理函数，签名与 DataManager.process_websocket_message 一致
+            duration: 持续时间（秒）
+            rate_multiplier: 相对于每个市场 update_rate 的倍数
+
+        Returns:
+            int: 实际推送的消息数量
+        """
+        total_rate = sum(m.update_rate for m in self.markets.values()) * rate_multiplier
+        interval = 1.0 / total_rate if total_rate > 0 else 0
+        start = time.perf_counter()
+        sent = 0
+        for is_futures, message in self.messages():
+            now = time.perf_counter()
+            if now - start >= duration:
+                break
+            target = start + sent * interval
+            if target > now:
+                time.sleep(target - now)
+            handler(message, is_futures)
+            sent += 1
+        return sent
@@ -4,126 +4,236 @@ OI and Funding Rate Data Module
 负责获取币安合约的持仓量(OI)数据和资金费率数据
 """
 
-import requests
-import aiohttp
 import asyncio
+import concurrent.futures
+import threading
 import time
-from typing import Dict, Optional, Tuple
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
 from config import Config
+from memory_report import estimate_size
+from http_client import http_client
+from async_runtime import async_runtime
 
 class OIFundingDataManager:
-    """OI和资金费率数据管理器"""
+    """
+    OI和资金费率数据管理器
+    缓存按键合并并发请求（同一键同时只有一个请求，其余调用方等待它的结果）；过期不久的值先直接返回，
+    同时在后台刷新；缓存条数有上限（最久未使用的先淘汰），长时间未更新的条目自动淘汰
+    """
     
-    def __init__(self):
-        self.cache = {}
-        self.cache_timeout = 30  # 缓存30秒
+    def __init__(self, runtime=async_runtime):
+        # 键 -> (值, 更新时间)，按最近使用排序
+        self.cache: "OrderedDict[str, Tuple]" = OrderedDict()
+        self.cache_timeout = Config.OI_FUNDING_CONFIG["cache_timeout"]
+        self.runtime = runtime
+        # 键 -> 正在进行的请求（共享异步运行时中的 concurrent.futures.Future）
+        self.in_flight: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "coalesced": 0,
+                      "fetches": 0, "fetch_errors": 0, "evictions": 0}
+    
+    def _store(self, key: str, value, timestamp: float):
+        """写入缓存并淘汰过期条目和超出上限的最久未使用条目（调用方持有锁）"""
+        cfg = Config.OI_FUNDING_CONFIG
+        self.cache[key] = (value, timestamp)
+        self.cache.move_to_end(key)
+        expire_before = timestamp - self.cache_timeout - cfg["stale_while_revalidate"]
+        for old_key in [k for k, (_, updated) in self.cache.items() if updated < expire_before]:
+            del self.cache[old_key]
+            self.stats["evictions"] += 1
+        while len(self.cache) > cfg["max_entries"]:
+            self.cache.popitem(last=False)
+            self.stats["evictions"] += 1
+    
+    async def _get(self, key: str, fetch: Callable[[], Awaitable], force_refresh: bool = False):
+        """
+        读取缓存，未命中时发起请求（同一键的并发请求合并为一次）
         
-    async def get_open_interest(self, symbol: str) -> Optional[float]:
+        Args:
+            key: 缓存键
+            fetch: 无参数的协程函数，返回新值，失败时返回None
+            force_refresh: 是否忽略缓存直接请求（已有相同请求在进行时等待它）
+        """
+        current_time = time.time()
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry is not None and not force_refresh:
+                self.cache.move_to_end(key)
+                age = current_time - entry[1]
+                if age < self.cache_timeout:
+                    self.stats["hits"] += 1
+                    return entry[0]
+                if age < self.cache_timeout + Config.OI_FUNDING_CONFIG["stale_while_revalidate"]:
+                    # 先返回旧值，后台刷新
+                    self.stats["stale_hits"] += 1
+                    self._refresh(key, fetch)
+                    return entry[0]
+            # 强制刷新（后台预取）单独计数，不计入未命中
+            self.stats["refreshes" if force_refresh else "misses"] += 1
+            future = self._refresh(key, fetch)
+        # 请求由多个调用方共享：某个调用方被取消时不能取消请求本身
+        return await asyncio.shield(asyncio.wrap_future(future))
+    
+    def _refresh(self, key: str, fetch: Callable[[], Awaitable], store: Callable = None) -> concurrent.futures.Future:
+        """
+        在共享异步运行时中请求并写入缓存；该键已有请求在进行时直接返回它（调用方持有锁）
+        
+        Args:
+            key: 请求键（合并并发请求用）
+            fetch: 无参数的协程函数，返回新值，失败时返回None
+            store: 写入缓存的函数 store(值, 时间)，在持有锁时调用；默认把值写入 key
+        """
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return future
+        self.stats["fetches"] += 1
+        future = self.runtime.submit(self._fetch(key, fetch, store))
+        self.in_flight[key] = future
+        return future
+    
+    async def _fetch(self, key: str, fetch: Callable[[], Awaitable], store: Callable = None):
+        value = None
+        try:
+            value = await fetch()
+            return value
+        finally:
+            # 写入缓存与移除进行中的请求在同一次加锁内完成，其间到达的调用方不会重复请求
+            with self._lock:
+                self.in_flight.pop(key, None)
+                if value is None:
+                    self.stats["fetch_errors"] += 1
+                elif store is not None:
+                    store(value, time.time())
+                else:
+                    self._store(key, value, time.time())
+    
+    async def get_open_interest(self, symbol: str, force_refresh: bool = False) -> Optional[float]:
         """
         获取指定合约的持仓量(OI)数据
         
         Args:
             symbol: 交易对符号 (e.g., 'BTCUSDT')
+            force_refresh: 是否忽略缓存直接请求
             
         Returns:
             float: 持仓量数值，获取失败返回None
         """
-        cache_key = f"oi_{symbol}"
-        current_time = time.time()
-        
-        # 检查缓存
-        if cache_key in self.cache:
-            cached_data, timestamp = self.cache[cache_key]
-            if current_time - timestamp < self.cache_timeout:
-                return cached_data
-        
+        return await self._get(f"oi_{symbol}", lambda: self._fetch_open_interest(symbol), force_refresh)
+    
+    async def _fetch_open_interest(self, symbol: str) -> Optional[float]:
         try:
-            url = "https://fapi.binance.com/fapi/v1/openInterest"
+            url = f"{Config.ENDPOINTS['futures_rest']}/fapi/v1/openInterest"
             params = {"symbol": symbol.upper()}
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        oi_value = float(data.get("openInterest", 0))
-                        
-                        # 更新缓存
-                        self.cache[cache_key] = (oi_value, current_time)
-                        
-                        if Config.OUTPUT_OPTIONS["enable_console_output"]:
-                            print(f"获取{symbol}持仓量: {oi_value:,.2f}")
-                            
-                        return oi_value
-                    else:
-                        if Config.OUTPUT_OPTIONS["enable_console_output"]:
-                            print(f"获取{symbol}持仓量失败，状态码: {response.status}")
-                        return None
+            response = await http_client.request("GET", url, params=params)
+            if response.status == 200:
+                data = response.json()
+                oi_value = float(data.get("openInterest", 0))
+                
+                if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                    print(f"获取{symbol}持仓量: {oi_value:,.2f}")
+                    
+                return oi_value
+            else:
+                if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                    print(f"获取{symbol}持仓量失败，状态码: {response.status}")
+                return None
                         
         except Exception as e:
             if Config.OUTPUT_OPTIONS["enable_console_output"]:
                 print(f"获取{symbol}持仓量时出错: {e}")
             return None
     
-    async def get_funding_rate(self, symbol: str) -> Optional[float]:
+    async def get_funding_rate(self, symbol: str, force_refresh: bool = False) -> Optional[float]:
         """
-        获取指定合约的资金费率数据
+        获取指定合约的资金费率数据（缓存未命中时一次请求刷新所有监控交易对）
         
         Args:
             symbol: 交易对符号 (e.g., 'BTCUSDT')
+            force_refresh: 是否忽略缓存直接请求
             
         Returns:
             float: 资金费率数值(百分比)，获取失败返回None
         """
-        cache_key = f"funding_{symbol}"
-        current_time = time.time()
-        
-        # 检查缓存
-        if cache_key in self.cache:
-            cached_data, timestamp = self.cache[cache_key]
-            if current_time - timestamp < self.cache_timeout:
-                return cached_data
+        return await self._get(f"funding_{symbol}", lambda: self._funding_from_premium_index(symbol), force_refresh)
+    
+    async def _funding_from_premium_index(self, symbol: str) -> Optional[float]:
+        premium_index = await self.refresh_premium_index()
+        if premium_index is None:
+            return None
+        if symbol.upper() not in premium_index:
+            if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                print(f"premiumIndex 中没有{symbol}的资金费率")
+            return None
+        return premium_index[symbol.upper()][0]
+    
+    async def refresh_premium_index(self) -> Optional[Dict[str, Tuple]]:
+        """
+        一次请求获取全部合约的 premiumIndex（不带 symbol 参数），
+        把所有监控交易对的资金费率和标记价格写入缓存；同时进行的调用共用一次请求
         
+        Returns:
+            Dict[str, Tuple]: {交易对: (资金费率百分比, 标记价格, 下次结算时间)}，获取失败返回None
+        """
+        with self._lock:
+            future = self._refresh("premium_index", self._fetch_premium_index, store=self._store_premium_index)
+        return await asyncio.shield(asyncio.wrap_future(future))
+    
+    def _store_premium_index(self, premium_index: Dict[str, Tuple], timestamp: float):
+        # 只缓存监控中的交易对，全部合约的数据不常驻内存
+        for symbol in Config.SYMBOLS:
+            if symbol in premium_index:
+                funding_rate, mark_price, next_funding_time = premium_index[symbol]
+                self._store(f"funding_{symbol}", funding_rate, timestamp)
+                self._store(f"mark_{symbol}", (mark_price, next_funding_time), timestamp)
+    
+    async def _fetch_premium_index(self) -> Optional[Dict[str, Tuple]]:
         try:
-            url = "https://fapi.binance.com/fapi/v1/premiumIndex"
-            params = {"symbol": symbol.upper()}
+            url = f"{Config.ENDPOINTS['futures_rest']}/fapi/v1/premiumIndex"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        funding_rate = float(data.get("lastFundingRate", 0)) * 100  # 转换为百分比
-                        
-                        # 更新缓存
-                        self.cache[cache_key] = (funding_rate, current_time)
-                        
-                        if Config.OUTPUT_OPTIONS["enable_console_output"]:
-                            print(f"获取{symbol}资金费率: {funding_rate:.4f}%")
-                            
-                        return funding_rate
-                    else:
-                        if Config.OUTPUT_OPTIONS["enable_console_output"]:
-                            print(f"获取{symbol}资金费率失败，状态码: {response.status}")
-                        return None
+            response = await http_client.request("GET", url)
+            if response.status == 200:
+                premium_index = {}
+                for item in response.json():
+                    try:
+                        premium_index[item["symbol"]] = (float(item["lastFundingRate"]) * 100,  # 转换为百分比
+                                                         float(item["markPrice"]), item.get("nextFundingTime"))
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                
+                if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                    rates = ", ".join(f"{symbol} {premium_index[symbol][0]:.4f}%"
+                                      for symbol in Config.SYMBOLS if symbol in premium_index)
+                    print(f"获取资金费率: {rates}")
+                    
+                return premium_index
+            else:
+                if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                    print(f"获取资金费率失败，状态码: {response.status}")
+                return None
                         
         except Exception as e:
             if Config.OUTPUT_OPTIONS["enable_console_output"]:
-                print(f"获取{symbol}资金费率时出错: {e}")
+                print(f"获取资金费率时出错: {e}")
             return None
     
-    async def get_oi_and_funding(self, symbol: str) -> Tuple[Optional[float], Optional[float]]:
+    async def get_oi_and_funding(self, symbol: str, force_refresh: bool = False) -> Tuple[Optional[float], Optional[float]]:
         """
         同时获取持仓量和资金费率数据
         
         Args:
             symbol: 交易对符号 (e.g., 'BTCUSDT')
+            force_refresh: 是否忽略缓存直接请求
             
         Returns:
             Tuple[Optional[float], Optional[float]]: (持仓量, 资金费率百分比)
         """
         try:
             # 并发获取两个数据
-            oi_task = self.get_open_interest(symbol)
-            funding_task = self.get_funding_rate(symbol)
+            oi_task = self.get_open_interest(symbol, force_refresh)
+            funding_task = self.get_funding_rate(symbol, force_refresh)
             
             oi_value, funding_rate = await asyncio.gather(oi_task, funding_task)
             
@@ -145,18 +255,165 @@ class OIFundingDataManager:
             Tuple[Optional[float], Optional[float]]: (持仓量, 资金费率百分比)
         """
         try:
-            # 创建新的事件循环来运行异步方法
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                return loop.run_until_complete(self.get_oi_and_funding(symbol))
-            finally:
-                loop.close()
+            # 在共享异步运行时中执行，不再为每次调用创建事件循环
+            return async_runtime.run(self.get_oi_and_funding(symbol))
         except Exception as e:
             if Config.OUTPUT_OPTIONS["enable_console_output"]:
                 print(f"同步获取{symbol}的OI和资金费率时出错: {e}")
             return None, None
     
+    def update_mark_price(self, event: Dict):
+        """
+        处理 @markPrice 流推送的 markPriceUpdate 事件，更新资金费率、标记价格和下次结算时间（不发起请求）
+        
+        Args:
+            event: 事件数据 {"s": 交易对, "p": 标记价格, "r": 资金费率, "T": 下次结算时间(毫秒), ...}
+        """
+        try:
+            symbol = event["s"]
+            funding_rate = float(event["r"]) * 100  # 转换为百分比
+            mark_price = float(event["p"])
+        except (KeyError, TypeError, ValueError):
+            return
+        current_time = time.time()
+        with self._lock:
+            self._store(f"funding_{symbol}", funding_rate, current_time)
+            self._store(f"mark_{symbol}", (mark_price, event.get("T")), current_time)
+    
+    def has_fresh(self, kind: str, symbol: str) -> bool:
+        """缓存中是否有未过期（cache_timeout 内）的数据，kind 为 oi / funding / mark"""
+        with self._lock:
+            entry = self.cache.get(f"{kind}_{symbol}")
+        return entry is not None and time.time() - entry[1] < self.cache_timeout
+    
+    def get_cached(self, symbol: str) -> Dict:
+        """
+        只读取缓存（不发起请求，不检查过期），供图表等对延迟敏感的路径使用
+        
+        Args:
+            symbol: 交易对符号 (e.g., 'BTCUSDT')
+            
+        Returns:
+            Dict: {"oi_value", "funding_rate", "mark_price", "next_funding_time", "updated_at"}，
+                  updated_at 为OI和资金费率中较旧的更新时间，无数据时为None
+        """
+        with self._lock:
+            oi_entry = self.cache.get(f"oi_{symbol}")
+            funding_entry = self.cache.get(f"funding_{symbol}")
+            mark_entry = self.cache.get(f"mark_{symbol}")
+        timestamps = [entry[1] for entry in (oi_entry, funding_entry) if entry is not None]
+        return {
+            "oi_value": oi_entry[0] if oi_entry else None,
+            "funding_rate": funding_entry[0] if funding_entry else None,
+            "mark_price": mark_entry[0][0] if mark_entry else None,
+            "next_funding_time": mark_entry[0][1] if mark_entry else None,
+            "updated_at": min(timestamps) if timestamps else None
+        }
+    
+    def get_metrics(self) -> Dict:
+        """获取缓存命中/过期命中/未命中、强制刷新、合并的请求数、请求失败和淘汰次数"""
+        with self._lock:
+            metrics = dict(self.stats, entries=len(self.cache), in_flight=len(self.in_flight))
+        lookups = metrics["hits"] + metrics["stale_hits"] + metrics["misses"]
+        metrics["hit_ratio"] = (metrics["hits"] + metrics["stale_hits"]) / lookups if lookups else 0.0
+        return metrics
+    
+    def get_memory_usage(self) -> Dict:
+        """估算缓存占用的内存（字节）"""
+        with self._lock:
+            cache_bytes = estimate_size(dict(self.cache))
+            entries = len(self.cache)
+        return {
+            "entries": entries,
+            "total_bytes": cache_bytes
+        }
+    
     def clear_cache(self):
         """清空缓存"""
-        self.cache.clear() 
\ No newline at end of file
+        with self._lock:
+            self.cache.clear()
+
+class OIFundingPrefetcher:
+    """
+    OI和资金费率后台预取器：在共享异步运行时中用一个定时器按固定间隔批量刷新所有交易对的持仓量；
+    资金费率由合约 @markPrice 流推送，只有未启用该流或某交易对近期没有收到推送时才用REST补取
+    """
+    
+    def __init__(self, manager: OIFundingDataManager, symbols=None, interval: float = None, runtime=async_runtime):
+        self.manager = manager
+        self.symbols = symbols
+        self.interval = interval
+        self.runtime = runtime
+        self._future = None
+    
+    def start(self):
+        """启动后台预取任务（重复调用无副作用）"""
+        if self._future is not None and not self._future.done():
+            return
+        self._future = self.runtime.submit(self._run())
+    
+    async def _run(self):
+        while True:
+            started = time.time()
+            await self.refresh_all()
+            interval = self.interval or Config.OI_FUNDING_CONFIG["refresh_interval"]
+            await asyncio.sleep(max(0.0, interval - (time.time() - started)))
+    
+    async def refresh_all(self):
+        """刷新所有交易对的OI（同时进行的请求数不超过 oi_batch_size），有交易对缺少推送时一次补取全部资金费率"""
+        cfg = Config.OI_FUNDING_CONFIG
+        symbols = self.symbols or Config.SYMBOLS
+        semaphore = asyncio.Semaphore(cfg["oi_batch_size"])
+        
+        async def limited(coroutine):
+            async with semaphore:
+                return await coroutine
+        
+        # 资金费率用一次 premiumIndex 请求刷新所有交易对
+        refresh_funding = any(not cfg["mark_price_stream"] or not self.manager.has_fresh("funding", symbol)
+                              for symbol in symbols)
+        await asyncio.gather(
+            *(limited(self.manager.get_open_interest(symbol, force_refresh=True)) for symbol in symbols),
+            *([self.manager.refresh_premium_index()] if refresh_funding else [])
+        )
+    
+    def stop(self, timeout: float = 5.0):
+        """停止后台预取任务（取消正在进行的刷新）"""
+        if self._future is None:
+            return
+        self._future.cancel()
+        try:
+            self._future.exception(timeout)
+        except (concurrent.futures.CancelledError, concurrent.futures.TimeoutError):
+            pass
+        self._future = None
+
+# 全局OI和资金费率数据管理器与后台预取器：首次访问时才创建
+_oi_funding_manager: Optional[OIFundingDataManager] = None
+_oi_funding_prefetcher: Optional[OIFundingPrefetcher] = None
+_instance_lock = threading.Lock()
+
+def get_oi_funding_manager() -> OIFundingDataManager:
+    """获取全局OI和资金费率数据管理器"""
+    global _oi_funding_manager
+    with _instance_lock:
+        if _oi_funding_manager is None:
+            _oi_funding_manager = OIFundingDataManager()
+        return _oi_funding_manager
+
+def get_oi_funding_prefetcher() -> OIFundingPrefetcher:
+    """获取刷新全局数据管理器的后台预取器"""
+    global _oi_funding_prefetcher
+    manager = get_oi_funding_manager()
+    with _instance_lock:
+        if _oi_funding_prefetcher is None:
+            _oi_funding_prefetcher = OIFundingPrefetcher(manager)
+        return _oi_funding_prefetcher
+
+def __getattr__(name: str):
+    # 兼容 from oi_funding_data import oi_funding_manager / oi_funding_prefetcher
+    if name == "oi_funding_manager":
+        return get_oi_funding_manager()
+    if name == "oi_funding_prefetcher":
+        return get_oi_funding_prefetcher()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
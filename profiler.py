@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+性能分析模块
+提供分阶段耗时直方图（关闭时为空操作）以及运行中按需触发的线程栈采样分析
+"""
+
+import bisect
+import functools
+import math
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+from config import Config
+
+# 直方图桶上界（微秒），按 2^(1/4) 几何递增（相对误差约19%），覆盖 1µs ~ 67s
+_BUCKET_BOUNDS_US = [2 ** (i / 4) for i in range(4 * 26 + 1)]
+
+_enabled = Config.PROFILING_CONFIG["enabled"]
+_histograms: Dict[str, "StageHistogram"] = {}
+_histograms_lock = threading.Lock()
+_sampler: Optional["StackSampler"] = None
+# 信号处理器只设置此标志，由 poll_requests() 在监控主循环中启动采样
+_profile_requested = False
+
+class StageHistogram:
+    """单个阶段的耗时直方图"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = [0] * (len(_BUCKET_BOUNDS_US) + 1)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        index = bisect.bisect_left(_BUCKET_BOUNDS_US, seconds * 1e6)
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.min = min(self.min, seconds)
+            self.max = max(self.max, seconds)
+            self.buckets[index] += 1
+
+    def percentile(self, percent: float) -> float:
+        """按桶估算分位数（秒），返回所在桶的上界"""
+        if not self.count:
+            return 0.0
+        target = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                if index >= len(_BUCKET_BOUNDS_US):
+                    return self.max
+                return min(_BUCKET_BOUNDS_US[index] / 1e6, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "min_ms": self.min * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p90_ms": self.percentile(90) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+def _get_histogram(name: str) -> StageHistogram:
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, StageHistogram(name))
+    return histogram
+
+class _StageTimer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _get_histogram(self.name).record(time.perf_counter() - self.start)
+        return False
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+def enable():
+    """开启分阶段计时"""
+    global _enabled
+    _enabled = True
+
+def disable():
+    """关闭分阶段计时（已记录的数据保留）"""
+    global _enabled
+    _enabled = False
+
+def is_enabled() -> bool:
+    return _enabled
+
+def stage(name: str):
+    """
+    分阶段计时上下文，关闭时返回共享的空上下文
+
+    用法:
+        with profiler.stage("decode"):
+            data = json.loads(message)
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _StageTimer(name)
+
+def timed(name: str) -> Callable:
+    """分阶段计时装饰器，关闭时仅多一次布尔判断"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _get_histogram(name).record(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def get_stage_stats() -> Dict[str, Dict]:
+    """获取所有阶段的耗时统计"""
+    with _histograms_lock:
+        histograms = list(_histograms.values())
+    return {h.name: h.to_dict() for h in sorted(histograms, key=lambda h: h.name)}
+
+def reset():
+    """清空所有阶段统计"""
+    with _histograms_lock:
+        _histograms.clear()
+
+def format_report() -> str:
+    """生成可读的阶段耗时报告"""
+    stats = get_stage_stats()
+    if not stats:
+        return "No stage timings recorded (profiling disabled or no activity)"
+    lines = [f"{'Stage':<28}{'Count':>10}{'Mean ms':>11}{'p50 ms':>11}{'p99 ms':>11}{'Max ms':>11}{'Total s':>10}"]
+    for name, s in stats.items():
+        lines.append(f"{name:<28}{s['count']:>10}{s['mean_ms']:>11.3f}{s['p50_ms']:>11.3f}"
+                     f"{s['p99_ms']:>11.3f}{s['max_ms']:>11.3f}{s['total_ms'] / 1000:>10.2f}")
+    return "\n".join(lines)
+
+class StackSampler:
+    """线程栈采样器：周期性读取所有线程的调用栈并聚合为折叠栈（flamegraph格式）"""
+
+    def __init__(self, duration: float, interval: float, output_dir: str):
+        self.duration = duration
+        self.interval = interval
+        self.output_dir = output_dir
+        self.stacks = Counter()
+        self.samples = 0
+        self._thread = threading.Thread(target=self._run, daemon=True, name="stack-sampler")
+
+    def start(self):
+        self._thread.start()
+
+    def is_running(self) -> bool:
+        return self._thread.is_alive()
+
+    def _run(self):
+        if Config.OUTPUT_OPTIONS["enable_console_output"]:
+            print(format_report())
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + self.duration
+        while time.monotonic() < deadline:
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+        self._write_report()
+
+    def _write_report(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.output_dir, f"stacks_{timestamp}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        stats_path = os.path.join(self.output_dir, f"stages_{timestamp}.txt")
+        with open(stats_path, "w", encoding="utf-8") as f:
+            f.write(format_report() + "\n")
+
+        if Config.OUTPUT_OPTIONS["enable_console_output"]:
+            print(f"Stack profile finished: {self.samples} samples written to {path}")
+            leaf_counts = Counter()
+            for stack, count in self.stacks.items():
+                leaf_counts[stack.rsplit(";", 1)[-1]] += count
+            for leaf, count in leaf_counts.most_common(10):
+                print(f"  {count / max(1, self.samples):6.1%}  {leaf}")
+
+def request_profile(duration: Optional[float] = None) -> bool:
+    """
+    按需启动一次线程栈采样（无需重启），完成后写入 Config.PROFILING_CONFIG["output_dir"]
+
+    Args:
+        duration: 采样时长（秒），默认使用配置值
+
+    Returns:
+        bool: 是否成功启动（已有采样在运行时返回False）
+    """
+    global _sampler
+    if _sampler is not None and _sampler.is_running():
+        return False
+    _sampler = StackSampler(
+        duration or Config.PROFILING_CONFIG["sample_duration"],
+        Config.PROFILING_CONFIG["sample_interval"],
+        Config.PROFILING_CONFIG["output_dir"],
+    )
+    _sampler.start()
+    if Config.OUTPUT_OPTIONS["enable_console_output"]:
+        print(f"Stack profile started for {_sampler.duration}s")
+    return True
+
+def poll_requests() -> bool:
+    """
+    处理信号请求的栈采样（在监控主循环的定时检查中调用，不在信号处理器中执行）
+
+    Returns:
+        bool: 是否启动了一次采样
+    """
+    global _profile_requested
+    if not _profile_requested:
+        return False
+    _profile_requested = False
+    return request_profile()
+
+def install_signal_handler(signum: Optional[int] = None) -> bool:
+    """
+    注册信号处理器：收到信号时只记录请求，由 poll_requests() 启动栈采样，
+    采样线程开始时打印阶段统计（须在主线程调用）
+
+    用法: kill -USR1 <pid>
+    """
+    signum = signum or getattr(signal, Config.PROFILING_CONFIG["signal"], None)
+    if signum is None:
+        return False
+
+    def handler(sig, frame):
+        global _profile_requested
+        _profile_requested = True
+
+    signal.signal(signum, handler)
+    return True
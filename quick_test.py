@@ -6,7 +6,7 @@
 
 import time
 import threading
-from main import MarketDepthMonitor
+from main import create_app
 from config import Config
 
 def run_test():
@@ -21,7 +21,7 @@ def run_test():
     print("=" * 60)
     
     # 创建监控器
-    monitor = MarketDepthMonitor()
+    monitor = create_app()
     
     # 在单独线程中启动监控
     def start_monitor():
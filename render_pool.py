@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+渲染进程池模块
+维护若干常驻的图表渲染工作进程（渲染器保持预热），接收普通字典形式的渲染规格并返回图片字节，
+支持单任务超时、按任务数回收工作进程以及队列深度统计
+"""
+
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import Pipe
+from typing import Dict, Optional
+from config import Config
+
+_WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chart_render.py")
+
+class RenderTimeoutError(Exception):
+    """渲染任务超时"""
+
+class RenderWorkerError(Exception):
+    """渲染工作进程异常退出或渲染失败"""
+
+class _WorkerProcess:
+    """单个渲染工作进程及其通信管道"""
+
+    def __init__(self, backend: str):
+        self.conn, child_conn = Pipe()
+        child_fd = child_conn.fileno()
+        # 以独立解释器启动工作进程，不会重新导入主程序及其全局单例
+        self.process = subprocess.Popen(
+            [sys.executable, _WORKER_SCRIPT, str(child_fd), backend],
+            pass_fds=(child_fd,), cwd=os.path.dirname(_WORKER_SCRIPT)
+        )
+        child_conn.close()
+        self.jobs_done = 0
+
+    def render(self, spec: Dict, timeout: float) -> bytes:
+        self.conn.send(spec)
+        if not self.conn.poll(timeout):
+            raise RenderTimeoutError(f"渲染超过 {timeout} 秒未完成")
+        ok, payload = self.conn.recv()
+        self.jobs_done += 1
+        if not ok:
+            raise RenderWorkerError(payload)
+        return payload
+
+    def stop(self, graceful: bool = True):
+        try:
+            if graceful:
+                self.conn.send(None)
+                self.process.wait(timeout=5)
+        except (OSError, EOFError, subprocess.TimeoutExpired):
+            pass
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.conn.close()
+
+class RenderPool:
+    """常驻渲染进程池，每个工作进程由一个调度线程独占驱动"""
+
+    def __init__(self, workers: int = 2, job_timeout: float = 60, max_jobs_per_worker: int = 50, backend: str = "plotly"):
+        self.workers = workers
+        self.backend = backend
+        self.job_timeout = job_timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.jobs: "queue.Queue" = queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "timeouts": 0,
+                      "recycled": 0, "restarted": 0, "render_seconds": 0.0, "max_queue_depth": 0}
+        self.started = False
+        self.closed = False
+        # 关闭时唤醒处于启动失败退避中的调度线程
+        self._closed_event = threading.Event()
+
+    def start(self):
+        """启动调度线程和工作进程（重复调用无副作用）"""
+        with self.lock:
+            if self.started or self.closed:
+                return
+            self.started = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._dispatch_loop, daemon=True, name=f"render-{i}")
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, spec: Dict) -> Future:
+        """
+        提交渲染任务
+
+        Args:
+            spec: 渲染规格（普通字典，见 chart_render.py）
+
+        Returns:
+            Future: 结果为图片字节
+        """
+        if self.closed:
+            raise RuntimeError("渲染进程池已关闭")
+        self.start()
+        future = Future()
+        self.jobs.put((future, spec))
+        with self.lock:
+            self.stats["submitted"] += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.jobs.qsize())
+        return future
+
+    def render(self, spec: Dict, timeout: Optional[float] = None) -> bytes:
+        """同步渲染，阻塞直到得到图片字节"""
+        return self.submit(spec).result(timeout)
+
+    def _spawn_worker(self) -> _WorkerProcess:
+        try:
+            return _WorkerProcess(self.backend)
+        except Exception as e:
+            raise RenderWorkerError(f"无法启动渲染进程: {e}") from e
+
+    def _fail_queued(self, error: Exception):
+        """工作进程无法启动时，让队列中等待的任务立即失败（保留关闭信号）"""
+        sentinels = 0
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                sentinels += 1
+                continue
+            future, _ = job
+            if future.set_running_or_notify_cancel():
+                future.set_exception(error)
+                with self.lock:
+                    self.stats["failed"] += 1
+        for _ in range(sentinels):
+            self.jobs.put(None)
+
+    def _dispatch_loop(self):
+        worker = None
+        spawn_failures = 0
+        try:
+            # 提前启动工作进程完成渲染器预热；失败时在下一个任务时重试
+            try:
+                worker = self._spawn_worker()
+            except RenderWorkerError as e:
+                if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                    print(f"渲染进程启动失败: {e}")
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    break
+                future, spec = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                with self.lock:
+                    self.in_flight += 1
+                start = time.perf_counter()
+                if worker is None:
+                    try:
+                        worker = self._spawn_worker()
+                    except RenderWorkerError as e:
+                        self._finish(future, start, error=e)
+                        self._fail_queued(e)
+                        # 启动失败时指数退避，期间到达的任务在退避结束后再处理
+                        spawn_failures += 1
+                        delay = min(30.0, 2.0 ** (spawn_failures - 1))
+                        if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                            print(f"{e}，{delay:.0f}秒后重试")
+                        self._closed_event.wait(delay)
+                        continue
+                    spawn_failures = 0
+                    with self.lock:
+                        self.stats["restarted"] += 1
+
+                try:
+                    image_bytes = worker.render(spec, self.job_timeout)
+                except RenderTimeoutError as e:
+                    # 超时的工作进程状态未知，直接终止并在下一个任务时重建
+                    worker.stop(graceful=False)
+                    worker = None
+                    self._finish(future, start, error=e, counter="timeouts")
+                except RenderWorkerError as e:
+                    self._finish(future, start, error=e)
+                except Exception as e:
+                    # 管道断开、规格无法序列化等：工作进程状态未知，终止并在下一个任务时重建
+                    worker.stop(graceful=False)
+                    worker = None
+                    self._finish(future, start, error=RenderWorkerError(f"渲染进程异常: {e}"))
+                else:
+                    self._finish(future, start, result=image_bytes)
+
+                # 定期回收工作进程，释放渲染器累积的内存；重建失败时在下一个任务时重试
+                if worker is not None and worker.jobs_done >= self.max_jobs_per_worker:
+                    worker.stop()
+                    worker = None
+                    with self.lock:
+                        self.stats["recycled"] += 1
+                    try:
+                        worker = self._spawn_worker()
+                    except RenderWorkerError as e:
+                        if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                            print(f"渲染进程回收后重建失败: {e}")
+        except Exception as e:
+            if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                print(f"渲染调度线程出错: {e}")
+        finally:
+            if worker is not None:
+                worker.stop()
+
+    def _finish(self, future: Future, start: float, result: bytes = None, error: Exception = None, counter: str = "failed"):
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.in_flight -= 1
+            self.stats["render_seconds"] += elapsed
+            if error is None:
+                self.stats["completed"] += 1
+            else:
+                self.stats[counter] += 1
+                if counter != "failed":
+                    self.stats["failed"] += 1
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def get_metrics(self) -> Dict:
+        """获取进程池统计（队列深度、执行中任务数、完成/失败/超时/回收次数、平均渲染耗时）"""
+        with self.lock:
+            metrics = dict(self.stats)
+            metrics["in_flight"] = self.in_flight
+        metrics["queue_depth"] = self.jobs.qsize()
+        metrics["workers"] = sum(1 for t in self.threads if t.is_alive())
+        finished = metrics["completed"] + metrics["failed"]
+        metrics["avg_render_ms"] = metrics.pop("render_seconds") / finished * 1000 if finished else 0.0
+        return metrics
+
+    def shutdown(self, wait: bool = True):
+        """关闭进程池，未开始的任务将被取消"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self._closed_event.set()
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job[0].cancel()
+        for _ in self.threads:
+            self.jobs.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join(timeout=self.job_timeout + 5)
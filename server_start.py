@@ -9,19 +9,29 @@ import sys
 import os
 import signal
 import time
-from main import MarketDepthMonitor, print_system_info
+from main import create_app, print_system_info
+from config import Config
+import profiler
+
+# 当前运行的监控器（供信号处理器请求停止）
+monitor = None
 
 def signal_handler(sig, frame):
-    """处理信号，优雅关闭"""
+    """处理信号，优雅关闭：只请求停止，由主循环退出后在期限内完成有序停止"""
     print(f'\n收到信号 {sig}，正在关闭监控系统...')
-    sys.exit(0)
+    if monitor is not None:
+        monitor.request_stop()
+    else:
+        raise KeyboardInterrupt
 
 def main():
     """主函数"""
+    global monitor
     try:
         # 注册信号处理器
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
+        profiler.install_signal_handler()
         
         print("=" * 60)
         print("币安市场深度监控系统 - 服务器模式启动")
@@ -31,11 +41,12 @@ def main():
         print_system_info()
         
         print("\n服务器模式：自动启动，无需确认")
-        print("提示：使用 Ctrl+C 或发送 SIGTERM 信号来停止程序")
+        print(f"提示：使用 Ctrl+C 或发送 SIGTERM 信号来停止程序（{Config.SHUTDOWN_CONFIG['deadline']}秒内完成有序停止）")
+        print("提示：发送 SIGUSR1 信号可打印分阶段耗时并启动一次栈采样")
         print("=" * 60)
         
         # 创建并启动监控器
-        monitor = MarketDepthMonitor()
+        monitor = create_app()
         monitor.start()
         
     except KeyboardInterrupt:
@@ -56,11 +56,13 @@ async def test_chart_generation():
                 fig.write_image(test_filename, engine="kaleido")
                 print(f"📊 测试图表已保存: {test_filename}")
                 
-                # 发送到Discord
-                webhooks = Config.get_webhooks('BTCUSDT', '图表输出')
+                # 发送到Discord：与主程序相同，渲染后写入发送队列，由队列经webhook发送器发送
+                webhooks = Config.get_webhooks('BTCUSDT', 'chart_output')
                 if webhooks:
                     print("正在发送到Discord...")
-                    await chart_output_manager.send_chart_to_discord(fig, 'BTCUSDT', webhooks)
+                    chart_output_manager.start()
+                    await chart_output_manager.process_and_send(btc_spot, btc_futures)
+                    await asyncio.to_thread(chart_output_manager.stop, 30)
                     print("✅ 发送完成")
                 else:
                     print("⚠️ 未配置webhook")
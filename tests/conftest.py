@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""pytest 公共夹具：项目模块位于仓库根目录，测试期间关闭控制台输出"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+
+def _market(symbol: str, mid_price: float, levels: int = 10) -> dict:
+    return {
+        "symbol": symbol,
+        "mid_price": mid_price,
+        "bids": [(mid_price - i, 1.0 + i) for i in range(1, levels + 1)],
+        "asks": [(mid_price + i, 2.0 + i) for i in range(1, levels + 1)],
+        "ratio": {"ranges": ["0-1%", "1-2.5%", "2.5-5%"], "ratios": [0.12, -0.3, 0.05]},
+    }
+
+@pytest.fixture(autouse=True)
+def quiet_console(monkeypatch):
+    monkeypatch.setitem(Config.OUTPUT_OPTIONS, "enable_console_output", False)
+
+@pytest.fixture
+def chart_data() -> dict:
+    """与 ChartOutputManager._collect_chart_data 输出结构相同的固定图表数据"""
+    return {
+        "title": "Market Depth & Order Book Analysis - test",
+        "display_order_count": 10,
+        "markets": {"Spot": _market("BTCUSDT", 50000.0), "Futures": _market("BTCUSDT", 50010.0)},
+        "oi_value": 81234.5,
+        "funding_rate": 0.0100,
+        "oi_funding_updated": 1700000000.0,
+        "oi_funding_stale": False,
+    }
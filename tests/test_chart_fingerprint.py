@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""图表输入指纹：相同输入稳定，影响图表的变化能被识别"""
+
+import copy
+
+import pytest
+
+from chart_output import ChartOutputManager
+
+@pytest.fixture
+def manager():
+    return ChartOutputManager(oi_funding_manager=object())
+
+def test_fingerprint_is_stable_for_equal_inputs(manager, chart_data):
+    assert manager.chart_fingerprint(chart_data) == manager.chart_fingerprint(copy.deepcopy(chart_data))
+
+def test_fingerprint_ignores_title_and_noise_below_precision(manager, chart_data):
+    changed = copy.deepcopy(chart_data)
+    changed["title"] = "another timestamp"
+    price, qty = changed["markets"]["Spot"]["bids"][0]
+    changed["markets"]["Spot"]["bids"][0] = (price, qty * 1.0001)
+    changed["markets"]["Futures"]["ratio"]["ratios"][0] += 0.0001
+    assert manager.chart_fingerprint(changed) == manager.chart_fingerprint(chart_data)
+
+@pytest.mark.parametrize("change", [
+    lambda d: d["markets"]["Spot"]["bids"].__setitem__(0, (d["markets"]["Spot"]["bids"][0][0], 50.0)),
+    lambda d: d["markets"]["Futures"]["asks"].__setitem__(0, (1.0, 2.0)),
+    lambda d: d["markets"]["Spot"]["ratio"]["ratios"].__setitem__(1, 0.4),
+    lambda d: d.__setitem__("oi_value", 90000.0),
+    lambda d: d.__setitem__("funding_rate", -0.0050),
+    lambda d: d.__setitem__("funding_rate", None),
+])
+def test_fingerprint_detects_chart_changes(manager, chart_data, change):
+    changed = copy.deepcopy(chart_data)
+    change(changed)
+    assert manager.chart_fingerprint(changed) != manager.chart_fingerprint(chart_data)
+
+def test_fingerprint_moved_thresholds(manager, chart_data, monkeypatch):
+    from config import Config
+
+    old = manager.chart_fingerprint(chart_data)
+    changed = copy.deepcopy(chart_data)
+    changed["markets"]["Spot"]["ratio"]["ratios"][0] += 0.2
+    new = manager.chart_fingerprint(changed)
+
+    monkeypatch.setitem(Config.CHART_CONFIG, "early_render_ratio_delta", None)
+    monkeypatch.setitem(Config.CHART_CONFIG, "early_render_level_changes", None)
+    assert not manager._fingerprint_moved(old, new)
+    monkeypatch.setitem(Config.CHART_CONFIG, "early_render_ratio_delta", 0.1)
+    assert manager._fingerprint_moved(old, new)
+    assert not manager._fingerprint_moved(None, new)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""从固定图表数据渲染图片（两种后端），不依赖订单簿和网络"""
+
+import pytest
+
+import chart_render
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+@pytest.mark.parametrize("backend", ["matplotlib", "plotly"])
+def test_render_spec_from_chart_data(backend, chart_data):
+    if backend == "plotly":
+        pytest.importorskip("kaleido")
+    image = chart_render.render_spec({"backend": backend, "data": chart_data, "format": "png",
+                                      "width": 600, "height": 800, "scale": 1})
+    assert image.startswith(PNG_SIGNATURE)
+
+def test_matplotlib_renders_more_levels_than_display_count(chart_data):
+    for market in chart_data["markets"].values():
+        market["bids"] += [(market["mid_price"] - 100 - i, 1.0) for i in range(5)]
+    image = chart_render.render_matplotlib(chart_data, width=600, height=800)
+    assert image.startswith(PNG_SIGNATURE)
+
+def test_plotly_figure_reflects_chart_data(chart_data):
+    pytest.importorskip("plotly")
+    chart_render.clear_figure_templates()
+    fig = chart_render.build_plotly_figure(chart_data)
+    assert chart_data["title"] in fig.layout.title.text
+    assert "81,234" in "".join(annotation.text or "" for annotation in fig.layout.annotations)
+
+def test_freshness_text():
+    assert chart_render.freshness_text({"oi_funding_updated": None}) == ""
+    text = chart_render.freshness_text({"oi_funding_updated": 1700000000.0, "oi_funding_stale": True})
+    assert text.startswith("stale, updated ")
+
+def test_matplotlib_background_is_reused_across_renders(chart_data):
+    chart_render.clear_figure_templates()
+    first = chart_render.render_matplotlib(chart_data, width=600, height=800)
+    assert chart_render.render_matplotlib(chart_data, width=600, height=800) == first
+    chart_data["markets"]["Spot"]["mid_price"] += 1
+    assert chart_render.render_matplotlib(chart_data, width=600, height=800) != first
+    assert len(chart_render._figure_templates) == 1
+
+def test_matplotlib_rejects_vector_formats(chart_data):
+    with pytest.raises(ValueError):
+        chart_render.render_matplotlib(chart_data, image_format="svg", width=600, height=800)
+
+def test_axis_ticks_follow_matplotlib_steps():
+    assert chart_render._axis_ticks(0, 12.6, 7) == ([0.0, 2.0, 4.0, 6.0, 8.0, 10.0, 12.0], 0)
+    assert chart_render._axis_ticks(-0.32, 0.14, 5) == ([-0.3, -0.2, -0.1, 0.0, 0.1], 1)
+    assert chart_render._format_tick(-0.3, 1) == "−0.3"
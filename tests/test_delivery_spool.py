@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""磁盘发送队列：同键丢弃旧消息、指数退避、4xx不重试以及重启后从磁盘恢复"""
+
+import asyncio
+import os
+
+import pytest
+
+import delivery_spool
+from config import Config
+from delivery_spool import DeliverySpool
+from http_client import HttpResponse
+
+@pytest.fixture
+def spool_config(monkeypatch):
+    monkeypatch.setitem(Config.DELIVERY_SPOOL_CONFIG, "retry_base_delay", 2)
+    monkeypatch.setitem(Config.DELIVERY_SPOOL_CONFIG, "retry_max_delay", 10)
+    monkeypatch.setitem(Config.DELIVERY_SPOOL_CONFIG, "max_attempts", 5)
+    monkeypatch.setattr(delivery_spool.random, "uniform", lambda a, b: 1.0)
+
+def _files(directory) -> list:
+    return sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+
+def test_newer_message_supersedes_older_one_per_key(tmp_path, spool_config, monkeypatch):
+    monkeypatch.setitem(Config.DELIVERY_SPOOL_CONFIG, "retry_base_delay", 100)
+
+    async def fail(entry, payload, urls):
+        return []
+
+    spool = DeliverySpool(str(tmp_path), fail, max_per_key=1)
+    try:
+        ids = [spool.put("chart:BTCUSDT", {"webhooks": ["https://hook/1"]}, b"png") for _ in range(3)]
+        other = spool.put("chart:ETHUSDT", {"webhooks": ["https://hook/1"]})
+        assert spool.drain(5)
+        assert sorted(spool.entries) == sorted([ids[-1], other])
+        assert _files(tmp_path) == sorted(f"{entry_id}.json" for entry_id in (ids[-1], other))
+        assert spool.stats["dropped"] == 2
+    finally:
+        spool.stop()
+
+def test_total_limit_drops_oldest(tmp_path):
+    spool = DeliverySpool(str(tmp_path), None, max_entries=2, max_per_key=5)
+    spool.stop()
+    for i in range(3):
+        spool.entries[f"{i:03d}"] = {"id": f"{i:03d}", "key": f"text:{i}"}
+    spool._enforce_limits()
+    assert sorted(spool.entries) == ["001", "002"]
+
+def test_failed_delivery_backs_off_exponentially(tmp_path, spool_config, monkeypatch):
+    monkeypatch.setitem(Config.DELIVERY_SPOOL_CONFIG, "max_attempts", 10)
+    monkeypatch.setattr(delivery_spool.time, "time", lambda: 1000.0)
+    spool = DeliverySpool(str(tmp_path), None)
+    entry = {"id": "0001", "key": "text:BTCUSDT", "webhooks": ["https://hook/1", "https://hook/2"],
+             "delivered": [], "attempts": 0, "next_attempt": 0}
+    spool.entries[entry["id"]] = entry
+
+    delays = []
+    for _ in range(4):
+        spool._finish(entry, [], None)
+        delays.append(entry["next_attempt"] - 1000.0)
+    assert delays == [2, 4, 8, 10]
+
+    # 已完成的地址不再重发，全部完成后删除
+    spool._finish(entry, ["https://hook/1"], None)
+    assert entry["delivered"] == ["https://hook/1"]
+    spool._finish(entry, ["https://hook/2"], None)
+    assert entry["id"] not in spool.entries
+    assert spool.stats["delivered"] == 1
+
+def test_gives_up_after_max_attempts(tmp_path, spool_config):
+    spool = DeliverySpool(str(tmp_path), None)
+    entry = {"id": "0001", "key": "text:BTCUSDT", "webhooks": ["https://hook/1"],
+             "delivered": [], "attempts": 0, "next_attempt": 0}
+    spool.entries[entry["id"]] = entry
+    for _ in range(5):
+        spool._finish(entry, [], RuntimeError("boom"))
+    assert not spool.entries
+    assert spool.stats["dropped"] == 1
+
+def test_client_errors_are_not_retried(monkeypatch):
+    import text_output
+    from text_output import TextOutputManager
+
+    statuses = {"https://hook/ok": 204, "https://hook/gone": 404, "https://hook/limited": 429, "https://hook/down": 500}
+
+    async def post(url, content=None, files=None):
+        return HttpResponse(statuses[url], {}, b"", url)
+
+    monkeypatch.setattr(text_output.webhook_dispatcher, "post", post)
+    manager = TextOutputManager()
+    try:
+        finished = asyncio.run(manager._deliver_entry({"content": ["report"]}, None, list(statuses)))
+    finally:
+        manager.executor.shutdown()
+    assert finished == ["https://hook/ok", "https://hook/gone"]
+
+def test_pending_messages_are_replayed_after_restart(tmp_path, spool_config):
+    stopped = DeliverySpool(str(tmp_path), None)
+    stopped.stop()
+    entry_id = stopped.put("chart:BTCUSDT", {"webhooks": ["https://hook/1"], "kind": "chart"}, b"image-bytes")
+    assert _files(tmp_path) == [f"{entry_id}.json"]
+
+    delivered = []
+
+    async def deliver(entry, payload, urls):
+        delivered.append((entry["id"], payload, urls))
+        return urls
+
+    spool = DeliverySpool(str(tmp_path), deliver)
+    try:
+        spool.start()
+        assert spool.drain(5)
+    finally:
+        spool.stop()
+    assert delivered == [(entry_id, b"image-bytes", ["https://hook/1"])]
+    assert spool.stats["replayed"] == 1
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""订单过滤与深度比率（纯函数）"""
+
+import pytest
+
+from data_manager import calculate_depth_ratio, calculate_depth_ratio_range, calculate_mid_price, filter_orders
+
+BIDS = {99.5: 2.0, 99.0: 0.05, 98.0: 3.0, 90.0: 10.0}
+ASKS = {100.5: 1.0, 101.0: 0.01, 102.0: 4.0, 110.0: 20.0}
+
+def test_mid_price():
+    assert calculate_mid_price(BIDS, ASKS) == 100.0
+    assert calculate_mid_price({}, ASKS) is None
+
+def test_filter_orders_drops_small_levels_and_sorts_from_best():
+    bids, asks = filter_orders(BIDS, ASKS, min_quantity=0.1)
+    assert bids == [(99.5, 2.0), (98.0, 3.0), (90.0, 10.0)]
+    assert asks == [(100.5, 1.0), (102.0, 4.0), (110.0, 20.0)]
+
+def test_filter_orders_limit():
+    bids, asks = filter_orders(BIDS, ASKS, min_quantity=0, limit=2)
+    assert bids == [(99.5, 2.0), (99.0, 0.05)]
+    assert asks == [(100.5, 1.0), (101.0, 0.01)]
+
+def test_depth_ratio_within_range():
+    ratio, bids_volume, asks_volume, delta = calculate_depth_ratio(BIDS, ASKS, 100.0, 1.0)
+    assert (bids_volume, asks_volume) == (pytest.approx(2.05), pytest.approx(1.01))
+    assert delta == pytest.approx(1.04)
+    assert ratio == pytest.approx(1.04 / 3.06)
+
+def test_depth_ratio_range_excludes_inner_band():
+    ratio, bids_volume, asks_volume, _ = calculate_depth_ratio_range(BIDS, ASKS, 100.0, 1.0, 2.5)
+    assert (bids_volume, asks_volume) == (3.0, 4.0)
+    assert ratio == pytest.approx(-1 / 7)
+
+def test_depth_ratio_without_mid_price_or_volume():
+    assert calculate_depth_ratio(BIDS, ASKS, None) == (None, 0, 0, 0)
+    assert calculate_depth_ratio_range(BIDS, ASKS, None, 1, 2) == (None, 0, 0, 0)
+    assert calculate_depth_ratio({}, {}, 100.0)[0] == 0
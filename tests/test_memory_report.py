@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""RSS 读取在没有 /proc 和 resource 模块的平台（Windows）上退化而不报错"""
+
+import sys
+
+import memory_report
+
+def _no_proc(*args, **kwargs):
+    raise OSError("no /proc")
+
+def test_rss_on_linux_is_positive():
+    assert memory_report.get_rss_bytes() > 0
+
+def test_rss_without_proc_uses_resource(monkeypatch):
+    monkeypatch.setattr(memory_report, "open", _no_proc, raising=False)
+    assert memory_report.get_rss_bytes() > 0
+
+def test_rss_without_resource_or_psutil_is_zero(monkeypatch):
+    monkeypatch.setattr(memory_report, "open", _no_proc, raising=False)
+    monkeypatch.setitem(sys.modules, "resource", None)
+    monkeypatch.setitem(sys.modules, "psutil", None)
+    assert memory_report.get_rss_bytes() == 0
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""OI/资金费率缓存：并发请求合并、过期后先返回旧值再刷新、过期与LRU淘汰、一次 premiumIndex 请求填充全部交易对（不发起网络请求）"""
+
+import asyncio
+import time
+
+import pytest
+
+from async_runtime import AsyncRuntime
+from config import Config
+from oi_funding_data import OIFundingDataManager
+
+@pytest.fixture
+def runtime():
+    runtime = AsyncRuntime("test-runtime")
+    yield runtime
+    runtime.stop()
+
+@pytest.fixture
+def manager(runtime, monkeypatch):
+    monkeypatch.setitem(Config.OI_FUNDING_CONFIG, "cache_timeout", 30)
+    monkeypatch.setitem(Config.OI_FUNDING_CONFIG, "stale_while_revalidate", 300)
+    monkeypatch.setitem(Config.OI_FUNDING_CONFIG, "max_entries", 500)
+    manager = OIFundingDataManager(runtime=runtime)
+    manager.calls = []
+
+    async def fetch_open_interest(symbol):
+        manager.calls.append(symbol)
+        await asyncio.sleep(0.05)
+        return 1000.0 + len(manager.calls)
+
+    manager._fetch_open_interest = fetch_open_interest
+    return manager
+
+def _wait_idle(manager, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while manager.in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not manager.in_flight
+
+def test_concurrent_misses_share_one_fetch(manager):
+    async def read_all():
+        return await asyncio.gather(*(manager.get_open_interest("BTCUSDT") for _ in range(5)))
+
+    assert asyncio.run(read_all()) == [1001.0] * 5
+    assert manager.calls == ["BTCUSDT"]
+    assert (manager.stats["misses"], manager.stats["fetches"], manager.stats["coalesced"]) == (5, 1, 4)
+    assert asyncio.run(manager.get_open_interest("BTCUSDT")) == 1001.0
+    assert manager.stats["hits"] == 1
+
+def test_cancelled_caller_does_not_cancel_shared_fetch(manager):
+    async def read_with_cancel():
+        cancelled = asyncio.ensure_future(manager.get_open_interest("BTCUSDT"))
+        waiting = asyncio.ensure_future(manager.get_open_interest("BTCUSDT"))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        return await waiting, cancelled.cancelled()
+
+    assert asyncio.run(read_with_cancel()) == (1001.0, True)
+    assert manager.cache["oi_BTCUSDT"][0] == 1001.0
+
+def test_cancelled_caller_does_not_cancel_premium_index_refresh(premium_index):
+    manager = premium_index
+
+    async def read_with_cancel():
+        cancelled = asyncio.ensure_future(manager.get_funding_rate("BTCUSDT"))
+        waiting = asyncio.ensure_future(manager.get_funding_rate("ETHUSDT"))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        return await waiting
+
+    assert asyncio.run(read_with_cancel()) == -0.005
+    assert manager.premium_calls == 1
+    _wait_idle(manager)
+    assert manager.cache["funding_BTCUSDT"][0] == 0.01
+
+def test_stale_value_is_served_while_revalidating(manager):
+    with manager._lock:
+        manager._store("oi_BTCUSDT", 500.0, time.time() - 60)
+
+    assert asyncio.run(manager.get_open_interest("BTCUSDT")) == 500.0
+    assert manager.stats["stale_hits"] == 1
+    _wait_idle(manager)
+    assert manager.cache["oi_BTCUSDT"][0] == 1001.0
+    assert asyncio.run(manager.get_open_interest("BTCUSDT")) == 1001.0
+
+def test_value_past_the_stale_window_is_refetched(manager):
+    with manager._lock:
+        manager._store("oi_BTCUSDT", 500.0, time.time() - 400)
+
+    assert asyncio.run(manager.get_open_interest("BTCUSDT")) == 1001.0
+    assert manager.stats["misses"] == 1
+
+def test_failed_fetch_is_not_cached(manager):
+    async def fail(symbol):
+        return None
+
+    manager._fetch_open_interest = fail
+    assert asyncio.run(manager.get_open_interest("BTCUSDT")) is None
+    assert "oi_BTCUSDT" not in manager.cache
+    assert manager.stats["fetch_errors"] == 1
+
+def test_least_recently_used_entry_is_evicted(manager, monkeypatch):
+    monkeypatch.setitem(Config.OI_FUNDING_CONFIG, "max_entries", 3)
+    now = time.time()
+    with manager._lock:
+        for key in ("oi_A", "oi_B", "oi_C"):
+            manager._store(key, 1.0, now)
+    assert asyncio.run(manager.get_open_interest("A")) == 1.0
+    with manager._lock:
+        manager._store("oi_D", 1.0, now)
+    assert list(manager.cache) == ["oi_C", "oi_A", "oi_D"]
+    assert manager.stats["evictions"] == 1
+
+def test_entries_past_ttl_are_evicted(manager):
+    now = time.time()
+    with manager._lock:
+        manager._store("oi_OLD", 1.0, now - 1000)
+        manager._store("oi_NEW", 2.0, now)
+    assert list(manager.cache) == ["oi_NEW"]
+    assert manager.stats["evictions"] == 1
+
+@pytest.fixture
+def premium_index(manager, monkeypatch):
+    monkeypatch.setattr(Config, "SYMBOLS", ["BTCUSDT", "ETHUSDT"])
+    manager.premium_calls = 0
+
+    async def fetch_premium_index():
+        manager.premium_calls += 1
+        await asyncio.sleep(0.05)
+        return {"BTCUSDT": (0.01, 50000.0, 1700000000000),
+                "ETHUSDT": (-0.005, 3000.0, 1700000000000),
+                "XRPUSDT": (0.02, 0.5, 1700000000000)}
+
+    manager._fetch_premium_index = fetch_premium_index
+    return manager
+
+def test_one_premium_index_request_fills_every_symbol(premium_index):
+    manager = premium_index
+
+    async def read_all():
+        return await asyncio.gather(manager.get_funding_rate("BTCUSDT"), manager.get_funding_rate("ETHUSDT"))
+
+    assert asyncio.run(read_all()) == [0.01, -0.005]
+    assert manager.premium_calls == 1
+    # 只缓存监控中的交易对
+    assert sorted(manager.cache) == ["funding_BTCUSDT", "funding_ETHUSDT", "mark_BTCUSDT", "mark_ETHUSDT"]
+    cached = manager.get_cached("ETHUSDT")
+    assert (cached["funding_rate"], cached["mark_price"], cached["next_funding_time"]) == (-0.005, 3000.0, 1700000000000)
+
+def test_funding_for_other_symbols_is_served_from_the_batch(premium_index):
+    manager = premium_index
+    assert asyncio.run(manager.get_funding_rate("BTCUSDT")) == 0.01
+    assert asyncio.run(manager.get_funding_rate("ETHUSDT")) == -0.005
+    assert manager.premium_calls == 1
+    assert manager.stats["hits"] == 1
+
+def test_symbol_missing_from_premium_index(premium_index):
+    manager = premium_index
+    assert asyncio.run(manager.get_funding_rate("DOGEUSDT")) is None
+    assert "funding_DOGEUSDT" not in manager.cache
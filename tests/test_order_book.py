@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""有序价格索引在增量更新后与订单簿保持一致，快照的前N档与全量排序结果相同"""
+
+import random
+
+import pytest
+
+from data_manager import OrderBookManager
+
+def _expected_top(book: dict, min_quantity: float, limit: int, descending: bool) -> list:
+    levels = sorted(((p, q) for p, q in book.items() if q > min_quantity), reverse=descending)
+    return levels[:limit]
+
+@pytest.fixture
+def manager():
+    manager = OrderBookManager("BTCUSDT", is_futures=False)
+    manager.min_quantity = 1.0
+    manager.load_snapshot({
+        "lastUpdateId": 1,
+        "bids": [[str(100 - i), "2.0"] for i in range(1, 6)],
+        "asks": [[str(100 + i), "2.0"] for i in range(1, 6)],
+    })
+    return manager
+
+def test_load_snapshot_builds_sorted_index(manager):
+    assert manager.sorted_prices["bids"] == [95.0, 96.0, 97.0, 98.0, 99.0]
+    assert manager.sorted_prices["asks"] == [101.0, 102.0, 103.0, 104.0, 105.0]
+
+def test_inserts_and_deletes_keep_index_in_sync(manager):
+    manager.apply_update([["99.5", "3"], ["97", "0"], ["90", "1.5"]], [["100.5", "4"], ["101", "0"], ["150", "0"]])
+    assert manager.sorted_prices["bids"] == [90.0, 95.0, 96.0, 98.0, 99.0, 99.5]
+    assert manager.sorted_prices["asks"] == [100.5, 102.0, 103.0, 104.0, 105.0]
+
+    snapshot = manager.capture_snapshot(top_levels=3)
+    assert snapshot["mid_price"] == (99.5 + 100.5) / 2
+    assert snapshot["top_levels"]["bids"] == [(99.5, 3.0), (99.0, 2.0), (98.0, 2.0)]
+    assert snapshot["top_levels"]["asks"] == [(100.5, 4.0), (102.0, 2.0), (103.0, 2.0)]
+
+def test_top_levels_skip_small_quantities(manager):
+    manager.apply_update([["99", "0.5"]], [["101", "1.0"]])
+    snapshot = manager.capture_snapshot(top_levels=2)
+    assert snapshot["top_levels"]["bids"] == [(98.0, 2.0), (97.0, 2.0)]
+    assert snapshot["top_levels"]["asks"] == [(102.0, 2.0), (103.0, 2.0)]
+
+def test_random_updates_match_full_sort(manager):
+    rng = random.Random(7)
+    for _ in range(500):
+        side = rng.choice(["bids", "asks"])
+        price = round(100 - rng.uniform(0.5, 20), 1) if side == "bids" else round(100 + rng.uniform(0.5, 20), 1)
+        qty = 0 if rng.random() < 0.4 else round(rng.uniform(0.1, 5), 2)
+        update = [[str(price), str(qty)]]
+        manager.apply_update(update if side == "bids" else [], update if side == "asks" else [])
+
+        for book_side in ("bids", "asks"):
+            assert manager.sorted_prices[book_side] == sorted(manager.order_book[book_side])
+
+    snapshot = manager.capture_snapshot(top_levels=10)
+    assert snapshot["top_levels"]["bids"] == _expected_top(snapshot["bids"], 1.0, 10, descending=True)
+    assert snapshot["top_levels"]["asks"] == _expected_top(snapshot["asks"], 1.0, 10, descending=False)
+    assert snapshot["mid_price"] == (max(snapshot["bids"]) + min(snapshot["asks"])) / 2
+
+def test_clear_changes_in_same_snapshot(manager):
+    manager.apply_update([["99", "5"]], [])
+    snapshot = manager.capture_snapshot(include_changes=True, clear_changes=True)
+    assert snapshot["order_changes"]["bids"] == {99.0: 3.0}
+    assert manager.order_changes["bids"] == {}
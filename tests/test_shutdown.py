@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""停止过程在给定期限内返回，不会被卡住的后台任务拖住"""
+
+import threading
+import time
+
+from text_output import TextOutputManager
+
+def test_text_output_stop_is_bounded_by_timeout(tmp_path):
+    manager = TextOutputManager()
+    manager.spool.directory = str(tmp_path)
+    release = threading.Event()
+    manager.executor.submit(release.wait)
+    queued = manager.executor.submit(lambda: None)
+    try:
+        started = time.monotonic()
+        manager.stop(timeout=0.3)
+        assert time.monotonic() - started < 1.0
+        assert queued.cancelled()
+    finally:
+        release.set()
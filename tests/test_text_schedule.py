@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""文本报告排程：各交易对/市场在周期内错开发送，错过的时段直接跳过"""
+
+import pytest
+
+from config import Config
+from text_output import TextOutputManager
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(Config, "SYMBOLS", ["BTCUSDT", "ETHUSDT"])
+    monkeypatch.setitem(Config.SEND_INTERVALS, "text_output", 60)
+    manager = TextOutputManager()
+    yield manager
+    manager.executor.shutdown()
+
+def test_slots_are_staggered_across_the_interval(manager):
+    assert [manager._phase_offset(symbol, market, 60) for symbol in ("BTCUSDT", "ETHUSDT")
+            for market in ("Spot", "Futures")] == [0, 15, 30, 45]
+    assert manager._phase_offset("XRPUSDT", "Spot", 60) == 0
+
+def test_due_markets_follow_their_phase(manager):
+    start = 1000.0
+    assert manager.due_markets("BTCUSDT", start) == ["Spot"]
+    assert manager.due_markets("ETHUSDT", start) == []
+    assert manager.due_markets("BTCUSDT", start + 14) == []
+    assert manager.due_markets("BTCUSDT", start + 15) == ["Futures"]
+    assert manager.due_markets("ETHUSDT", start + 30) == ["Spot"]
+    assert manager.due_markets("ETHUSDT", start + 45) == ["Futures"]
+    assert manager.due_markets("BTCUSDT", start + 59) == []
+    assert manager.due_markets("BTCUSDT", start + 60) == ["Spot"]
+
+def test_missed_slots_are_skipped_not_burst(manager):
+    start = 1000.0
+    assert manager.due_markets("BTCUSDT", start) == ["Spot"]
+    # 停顿了三个多周期：只补发一次，下一次仍落在原来的相位上
+    assert manager.due_markets("BTCUSDT", start + 200) == ["Spot", "Futures"]
+    assert manager.due_markets("BTCUSDT", start + 201) == []
+    assert manager.next_send_time[("BTCUSDT", "Spot")] == start + 240
+    assert manager.next_send_time[("BTCUSDT", "Futures")] == start + 255
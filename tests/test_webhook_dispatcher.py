@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""消息拆分、批次合并与窗口内去重（使用假HTTP客户端，不发起网络请求）"""
+
+import asyncio
+
+import pytest
+
+from config import Config
+from http_client import HttpResponse
+from webhook_dispatcher import WebhookDispatcher, _PendingBatch, split_content
+
+class FakeClient:
+    """在调用方的事件循环中直接返回响应，记录每次请求"""
+
+    def __init__(self, status: int = 204):
+        self.status = status
+        self.requests = []
+
+    def in_client_loop(self) -> bool:
+        return True
+
+    async def request(self, method, url, **kwargs):
+        self.requests.append((url, kwargs))
+        return HttpResponse(self.status, {}, b"", url)
+
+def test_split_content_short_and_empty():
+    assert split_content("hello", limit=10) == ["hello"]
+    assert split_content("", limit=10) == []
+    assert split_content(" \n ", limit=10) == []
+
+def test_split_content_by_lines_within_limit():
+    content = "\n".join(f"line {i}" for i in range(10))
+    parts = split_content(content, limit=20)
+    assert all(len(part) <= 20 for part in parts)
+    assert "\n".join(parts) == content
+
+def test_split_content_hard_cuts_long_line():
+    parts = split_content("x" * 25 + "\nend", limit=10)
+    assert parts == ["x" * 10, "x" * 10, "x" * 5 + "\nend"]
+
+def test_pending_batch_fits_limits(monkeypatch):
+    monkeypatch.setitem(Config.WEBHOOK_CONFIG, "max_attachments", 2)
+    monkeypatch.setitem(Config.WEBHOOK_CONFIG, "max_content_length", 10)
+    monkeypatch.setitem(Config.WEBHOOK_CONFIG, "max_batch_bytes", 100)
+    batch = _PendingBatch()
+    batch.items.append(("hello", [("a.png", b"x" * 60, "image/png")], None))
+    assert batch.fits("abcd", [])
+    assert not batch.fits("abcde", [])
+    assert not batch.fits(None, [("b.png", b"x" * 41, "image/png")])
+    assert batch.fits(None, [("b.png", b"x" * 40, "image/png")])
+    assert not batch.fits(None, [("b.png", b"", "image/png"), ("c.png", b"", "image/png")])
+
+def test_pending_batch_find_exact_duplicate():
+    batch = _PendingBatch()
+    marker = object()
+    files = [("a.png", b"data", "image/png")]
+    batch.items.append(("hello", files, marker))
+    assert batch.find("hello", list(files)) is marker
+    assert batch.find("hello", []) is None
+    assert batch.find("other", files) is None
+
+@pytest.fixture
+def batching(monkeypatch):
+    monkeypatch.setitem(Config.WEBHOOK_CONFIG, "batch_window", 0.05)
+
+def test_duplicates_in_window_are_sent_once(batching):
+    client = FakeClient()
+    dispatcher = WebhookDispatcher(client)
+
+    async def send():
+        return await asyncio.gather(dispatcher.post("https://hook/1", "same"), dispatcher.post("https://hook/1", "same"))
+
+    first, second = asyncio.run(send())
+    assert first is second
+    assert len(client.requests) == 1
+    assert dispatcher.get_stats()["deduplicated"] == 1
+
+def test_messages_in_window_are_merged_per_url(batching):
+    client = FakeClient()
+    dispatcher = WebhookDispatcher(client)
+
+    async def send():
+        return await asyncio.gather(dispatcher.post("https://hook/1", "a"), dispatcher.post("https://hook/1", "b"),
+                                    dispatcher.post("https://hook/2", "c"))
+
+    responses = asyncio.run(send())
+    assert [r.status for r in responses] == [204, 204, 204]
+    by_url = {url: kwargs["json"]["content"] for url, kwargs in client.requests}
+    assert by_url == {"https://hook/1": "a\nb", "https://hook/2": "c"}
+    stats = dispatcher.get_stats()
+    assert (stats["batches"], stats["batched_messages"]) == (2, 3)
@@ -4,57 +4,86 @@ Text Output Module
 Responsible for generating and sending text-format market analysis, maintaining original output format
 """
 
-import requests
-import pandas as pd
+import asyncio
+import heapq
+import os
+import threading
 import time
-from typing import Dict, List, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
 from config import Config
-from data_manager import OrderBookManager
+from data_manager import OrderBookManager, calculate_depth_ratio, calculate_depth_ratio_range
+from delivery_spool import DeliverySpool
+from webhook_dispatcher import webhook_dispatcher, split_content
+
+MARKET_TYPES = ("Spot", "Futures")
+# Levels shown per side in a report
+REPORT_LEVELS = 10
+
+# Preformatted line templates
+_LEVEL_TEMPLATE = "Price: ${:.2f}, Quantity: {:.4f}{}\n"
+_CHANGE_TEMPLATE = " ({:+.4f})"
+_REMOVED_TEMPLATE = "Price: ${:.2f}, Original Quantity: {:.4f} (Completely Removed)\n"
 
 class TextOutputManager:
     """Text Output Manager"""
     
     def __init__(self):
-        self.last_send_time = 0
+        # Next report time per (symbol, market), staggered across the interval
+        self.next_send_time = {}
+        self.schedule_lock = threading.Lock()
+        # Reports are built off the WebSocket thread and delivered through a disk-backed spool
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="text-report")
+        spool_cfg = Config.DELIVERY_SPOOL_CONFIG
+        self.spool = DeliverySpool(os.path.join(spool_cfg["directory"], "text"), self._deliver_entry,
+                                   max_entries=spool_cfg["max_entries"], max_per_key=spool_cfg["max_per_symbol"])
 
     def generate_market_analysis(self, manager: OrderBookManager) -> str:
-        """Generate market analysis text (maintaining original format)"""
-        market_data = manager.get_market_data()
-        if not market_data:
+        """Generate market analysis text from the manager's current order book (change records are kept)"""
+        return self.generate_report(manager.capture_snapshot(include_changes=True, top_levels=REPORT_LEVELS))
+
+    def generate_report(self, snapshot: Optional[Dict]) -> str:
+        """Generate market analysis text (maintaining original format) from a captured order book snapshot"""
+        if not snapshot:
             return "Insufficient order book data for analysis"
 
-        symbol = market_data["symbol"]
-        is_futures = market_data["is_futures"]
-        highest_bid = market_data["highest_bid"]
-        lowest_ask = market_data["lowest_ask"]
-        mid_price = market_data["mid_price"]
-        spread = market_data["spread"]
-        order_book = market_data["order_book"]
-        order_changes = market_data["order_changes"]
-        removed_orders = market_data["removed_orders"]
-        min_quantity = market_data["min_quantity"]
+        symbol = snapshot["symbol"]
+        is_futures = snapshot["is_futures"]
+        bids, asks = snapshot["bids"], snapshot["asks"]
+        highest_bid = max(bids)
+        lowest_ask = min(asks)
+        mid_price = snapshot["mid_price"]
+        spread = lowest_ask - highest_bid
+        # Best qualifying levels read from the book's sorted price index; fall back to a scan for plain snapshots
+        levels = snapshot.get("top_levels") or {
+            "bids": heapq.nlargest(REPORT_LEVELS, ((p, q) for p, q in bids.items() if q > snapshot["min_quantity"])),
+            "asks": heapq.nsmallest(REPORT_LEVELS, ((p, q) for p, q in asks.items() if q > snapshot["min_quantity"])),
+        }
+        order_changes = snapshot["order_changes"]
+        removed_orders = snapshot["removed_orders"]
+        min_quantity = snapshot["min_quantity"]
 
         market_type = "Futures" if is_futures else "Spot"
 
         # Build order book summary
-        order_book_summary = f"**Binance {market_type} {symbol} Order Book Summary** (Quantity > {min_quantity}, Top 10):\n\n"
+        order_book_summary = f"**Binance {market_type} {symbol} Order Book Summary** (Quantity > {min_quantity}, Top {REPORT_LEVELS}):\n\n"
         
         # Add sell order information
-        order_book_summary += self._format_orders(order_book, order_changes, removed_orders, "asks", reverse=True)
+        order_book_summary += self._format_orders(levels["asks"], order_changes, removed_orders, "asks", reverse=True)
         
         # Add buy order information
-        order_book_summary += "\n" + self._format_orders(order_book, order_changes, removed_orders, "bids", reverse=True)
+        order_book_summary += "\n" + self._format_orders(levels["bids"], order_changes, removed_orders, "bids", reverse=True)
         
         # Calculate buy/sell ratios for various ranges
         ratios = {}
         for i, (lower, upper) in enumerate(Config.ANALYSIS_RANGES):
             if i == 0:
                 # First range uses simple ratio calculation
-                ratio, bids_vol, asks_vol, delta = manager.calculate_depth_ratio(upper)
+                ratio, bids_vol, asks_vol, delta = calculate_depth_ratio(bids, asks, mid_price, upper)
                 range_name = f"0-{upper}%"
             else:
                 # Other ranges use range ratio calculation
-                ratio, bids_vol, asks_vol, delta = manager.calculate_depth_ratio_range(lower, upper)
+                ratio, bids_vol, asks_vol, delta = calculate_depth_ratio_range(bids, asks, mid_price, lower, upper)
                 range_name = f"{lower}-{upper}%"
             
             ratios[range_name] = (ratio, bids_vol, asks_vol, delta)
@@ -74,49 +103,42 @@ class TextOutputManager:
         
         return message
 
-    def _format_orders(self, order_book: Dict, order_changes: Dict, removed_orders: Dict, 
+    def _format_orders(self, levels: List[Tuple[float, float]], order_changes: Dict, removed_orders: Dict,
                       side: str, reverse: bool = False) -> str:
-        """Format order information (maintaining original format)"""
-        # Use first symbol's spot market threshold as default for backward compatibility
-        min_quantity = Config.get_min_quantity(list(Config.SYMBOLS)[0], "spot")
-        
-        df = pd.DataFrame(list(order_book[side].items()), columns=["price", "quantity"])
-        df = df[df["quantity"] > min_quantity].sort_values(by="price", ascending=not reverse)
-        df = df.head(10)
-        
+        """Format order information (maintaining original format) from the best qualifying levels of one side"""
         title = "Sell Orders (Asks):" if side == "asks" else "Buy Orders (Bids):"
-        result = f"**{title}**\n"
+        lines = [f"**{title}**\n"]
         
-        if df.empty:
-            result += f"No qualifying {title[:-1]}\n"
+        if not levels:
+            lines.append(f"No qualifying {title[:-1]}\n")
         else:
-            for _, row in df.iterrows():
-                price = row['price']
-                change_str = ""
-                if price in order_changes[side]:
-                    change = order_changes[side][price]
-                    sign = "+" if change > 0 else ""
-                    change_str = f" ({sign}{change:.4f})"
-                result += f"Price: ${price:.2f}, Quantity: {row['quantity']:.4f}{change_str}\n"
+            changes = order_changes[side]
+            for price, qty in sorted(levels, reverse=reverse):
+                change = changes.get(price)
+                change_str = _CHANGE_TEMPLATE.format(change) if change is not None else ""
+                lines.append(_LEVEL_TEMPLATE.format(price, qty, change_str))
         
         # Add removed order information
         if removed_orders[side]:
-            result += f"\n**Removed {title[:-1]}:**\n"
-            removed_items = sorted(removed_orders[side].items(), reverse=reverse)
-            for price, qty in removed_items:
-                result += f"Price: ${price:.2f}, Original Quantity: {qty:.4f} (Completely Removed)\n"
+            lines.append(f"\n**Removed {title[:-1]}:**\n")
+            lines.extend(_REMOVED_TEMPLATE.format(price, qty)
+                         for price, qty in sorted(removed_orders[side].items(), reverse=reverse))
         
-        return result
+        return "".join(lines)
 
     def send_to_discord(self, content: str, webhook_urls: List[str]):
-        """Send message to Discord Webhook(s)"""
-        if not webhook_urls:
+        """Send message to Discord Webhook(s), split into several messages when over Discord's length limit"""
+        parts = split_content(content or "")
+        if not webhook_urls or not parts:
             return
             
         for url in webhook_urls:
             try:
-                response = requests.post(url, json={"content": content})
-                if response.status_code == 204:
+                for part in parts:
+                    response = webhook_dispatcher.post_sync(url, part)
+                    if response.status_code not in (200, 204):
+                        break
+                if response.status_code in (200, 204):
                     if Config.OUTPUT_OPTIONS["enable_console_output"]:
                         print(f"Text message successfully sent to Discord")
                 else:
@@ -126,60 +148,133 @@ class TextOutputManager:
                 if Config.OUTPUT_OPTIONS["enable_console_output"]:
                     print(f"Error sending to Discord: {e}, URL: {url}")
 
-    def should_send_now(self) -> bool:
-        """Check if text analysis should be sent now"""
-        current_time = time.time()
+    async def _post_parts(self, url: str, parts: List[str]):
+        # Parts of one report go out in order; stop at the first failure so the retry resends the report
+        response = None
+        for part in parts:
+            response = await webhook_dispatcher.post(url, part)
+            if response.status not in (200, 204):
+                break
+        return response
+
+    async def _deliver_entry(self, entry: Dict, payload: Optional[bytes], urls: List[str]) -> List[str]:
+        """Deliver one spooled report; returns the webhooks that are done (sent, or failed with a non-retryable 4xx)"""
+        results = await asyncio.gather(*(self._post_parts(url, entry["content"]) for url in urls), return_exceptions=True)
+        finished = []
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                    print(f"Error sending to Discord: {result}, URL: {url}")
+            elif result is None:
+                # Nothing to send for an empty report
+                finished.append(url)
+            elif result.status in (200, 204):
+                finished.append(url)
+                if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                    print(f"Text message successfully sent to Discord")
+            else:
+                if 400 <= result.status < 500 and result.status != 429:
+                    finished.append(url)
+                if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                    print(f"Failed to send to Discord, status code: {result.status}, URL: {url}")
+        return finished
+
+    def _phase_offset(self, symbol: str, market_type: str, interval: float) -> float:
+        """Offset of a symbol/market slot within the interval, so reports spread evenly instead of bursting"""
+        slots = [(s, m) for s in Config.SYMBOLS for m in MARKET_TYPES]
+        if (symbol, market_type) not in slots:
+            return 0.0
+        return interval * slots.index((symbol, market_type)) / len(slots)
+
+    def due_markets(self, symbol: str, now: Optional[float] = None) -> List[str]:
+        """Return the markets of the symbol whose text report is due, and schedule their next report"""
+        now = now or time.time()
         interval = Config.SEND_INTERVALS["text_output"]
-        
-        if current_time - self.last_send_time >= interval:
-            self.last_send_time = current_time
-            return True
-        return False
+        due = []
+        with self.schedule_lock:
+            for market_type in MARKET_TYPES:
+                key = (symbol, market_type)
+                next_time = self.next_send_time.get(key)
+                if next_time is None:
+                    next_time = self.next_send_time[key] = now + self._phase_offset(symbol, market_type, interval)
+                if now >= next_time:
+                    due.append(market_type)
+                    # Stay on the slot's phase; missed slots are skipped rather than sent in a burst
+                    self.next_send_time[key] = next_time + interval * (int((now - next_time) // interval) + 1)
+        return due
 
     def process_and_send(self, spot_manager: OrderBookManager, futures_manager: OrderBookManager):
-        """Process and send analysis results"""
+        """Capture the due order books and hand report building and delivery to the background pipeline"""
         if not Config.is_output_enabled("text_output"):
             return
             
-        if not self.should_send_now():
+        symbol = spot_manager.symbol
+        due = self.due_markets(symbol)
+        if not due:
             return
 
         try:
-            symbol = spot_manager.symbol
-            
-            # Generate spot analysis
-            spot_analysis = self.generate_market_analysis(spot_manager)
-            spot_webhooks = Config.get_webhooks(symbol, "text_output")
-            
-            # Generate futures analysis
-            futures_analysis = self.generate_market_analysis(futures_manager)
-            futures_webhooks = Config.get_webhooks(symbol, "text_output")
-            
-            # Send spot analysis
-            if spot_analysis and spot_webhooks:
-                message = f"# {symbol} Spot Market Depth Analysis\n\n{spot_analysis}"
-                if Config.OUTPUT_OPTIONS["enable_console_output"]:
-                    print("=== Spot Market Analysis ===")
-                    print(message)
-                    print("============================")
-                self.send_to_discord(message, spot_webhooks)
-            
-            # Send futures analysis
-            if futures_analysis and futures_webhooks:
-                message = f"# {symbol} Futures Market Depth Analysis\n\n{futures_analysis}"
+            webhooks = Config.get_webhooks(symbol, "text_output")
+            managers = {"Spot": spot_manager, "Futures": futures_manager}
+            # Books and change records are copied (and the records cleared) under each book's lock in one step;
+            # formatting and HTTP happen on other threads so the WebSocket thread never waits on them
+            snapshots = {market_type: managers[market_type].capture_snapshot(include_changes=True, clear_changes=True,
+                                                                             top_levels=REPORT_LEVELS)
+                         for market_type in due}
+            self.executor.submit(self._build_and_spool, symbol, snapshots, webhooks)
+        except Exception as e:
+            if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                print(f"Error sending text analysis report: {e}")
+
+    def _build_and_spool(self, symbol: str, snapshots: Dict[str, Optional[Dict]], webhooks: List[str]):
+        """Build the spot and futures reports and queue them for delivery"""
+        try:
+            for market_type, snapshot in snapshots.items():
+                analysis = self.generate_report(snapshot)
+                if not (analysis and webhooks):
+                    continue
+                message = f"# {symbol} {market_type} Market Depth Analysis\n\n{analysis}"
                 if Config.OUTPUT_OPTIONS["enable_console_output"]:
-                    print("=== Futures Market Analysis ===")
+                    banner = f"=== {market_type} Market Analysis ==="
+                    print(banner)
                     print(message)
-                    print("===============================")
-                self.send_to_discord(message, futures_webhooks)
-            
-            # Clear order change records
-            spot_manager.clear_changes()
-            futures_manager.clear_changes()
-            
+                    print("=" * len(banner))
+                self.spool.put(f"text:{symbol}:{market_type}", {
+                    "kind": "text", "symbol": symbol, "webhooks": webhooks, "content": split_content(message)
+                })
         except Exception as e:
             if Config.OUTPUT_OPTIONS["enable_console_output"]:
                 print(f"Error sending text analysis report: {e}")
 
-# Global text output manager instance
-text_output_manager = TextOutputManager() 
\ No newline at end of file
+    def start(self):
+        """Starts the delivery spool (replaying reports left from the last run)"""
+        self.spool.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Waits for reports being built and sends what is due within `timeout` seconds;
+        undelivered reports stay on disk for the next start"""
+        deadline = time.monotonic() + timeout
+        # Reports not started yet are dropped; the one being built gets what is left of the timeout
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for thread in list(self.executor._threads):
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self.spool.drain(max(0.0, deadline - time.monotonic()))
+        self.spool.stop(max(0.0, deadline - time.monotonic()))
+
+# Global text output manager instance, created on first access (normally by main.create_app)
+_text_output_manager: Optional[TextOutputManager] = None
+_instance_lock = threading.Lock()
+
+def get_text_output_manager() -> TextOutputManager:
+    """Returns the shared text output manager, creating it on first use"""
+    global _text_output_manager
+    with _instance_lock:
+        if _text_output_manager is None:
+            _text_output_manager = TextOutputManager()
+        return _text_output_manager
+
+def __getattr__(name: str):
+    # Keeps `from text_output import text_output_manager` working
+    if name == "text_output_manager":
+        return get_text_output_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}") 
\ No newline at end of file
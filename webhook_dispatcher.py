@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Discord Webhook 发送模块
+按响应头 X-RateLimit-* 跟踪每个webhook的限流桶，遇到429时按 retry_after 等待后重试；
+同一个桶内的请求按顺序发送，不同webhook之间并发发送，不再使用固定的发送延迟；
+短时间窗口内发往同一地址的消息合并为一次多附件请求，重复的消息只发送一次
+"""
+
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from config import Config
+from http_client import http_client, HttpResponse
+import profiler
+
+# 附件: (文件名, 数据, content_type)
+Attachment = Tuple[str, bytes, str]
+
+def split_content(content: str, limit: Optional[int] = None) -> List[str]:
+    """
+    按行把超过Discord长度限制的文本拆分为多条消息，单行超长时按长度硬切
+
+    Args:
+        content: 消息文本
+        limit: 每条消息的最大字符数，默认使用 WEBHOOK_CONFIG["max_content_length"]
+
+    Returns:
+        List[str]: 依次发送的消息（不含空消息，空白内容返回空列表）
+    """
+    limit = limit or Config.WEBHOOK_CONFIG["max_content_length"]
+    if len(content) <= limit:
+        return [content] if content.strip() else []
+    parts, current, size = [], [], 0
+    for line in content.split("\n"):
+        while len(line) > limit:
+            if current:
+                parts.append("\n".join(current))
+                current, size = [], 0
+            parts.append(line[:limit])
+            line = line[limit:]
+        added = len(line) + (1 if current else 0)
+        if current and size + added > limit:
+            parts.append("\n".join(current))
+            current, size = [line], len(line)
+        else:
+            current.append(line)
+            size += added
+    if current:
+        parts.append("\n".join(current))
+    return [part for part in parts if part.strip()]
+
+class RateLimitBucket:
+    """单个限流桶的状态（只在HTTP客户端事件循环中访问）"""
+
+    def __init__(self):
+        self.name: Optional[str] = None
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def update(self, headers: Dict[str, str]):
+        """根据响应头更新剩余次数与重置时间"""
+        try:
+            if "X-RateLimit-Bucket" in headers:
+                self.name = headers["X-RateLimit-Bucket"]
+            if "X-RateLimit-Limit" in headers:
+                self.limit = int(headers["X-RateLimit-Limit"])
+            if "X-RateLimit-Remaining" in headers:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Reset-After" in headers:
+                self.reset_at = time.monotonic() + float(headers["X-RateLimit-Reset-After"])
+        except ValueError:
+            pass
+
+    def wait_time(self) -> float:
+        """本桶额度用尽时需要等待的秒数"""
+        if self.remaining is None or self.remaining > 0:
+            return 0.0
+        return max(0.0, self.reset_at - time.monotonic())
+
+class _PendingBatch:
+    """同一webhook地址在批处理窗口内等待合并发送的消息"""
+
+    def __init__(self):
+        # [(content, files, future)]
+        self.items: List[Tuple[Optional[str], List[Attachment], asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def attachment_count(self) -> int:
+        return sum(len(files) for _, files, _ in self.items)
+
+    def content(self) -> Optional[str]:
+        parts = [content for content, _, _ in self.items if content]
+        return "\n".join(parts) if parts else None
+
+    def fits(self, content: Optional[str], files: List[Attachment]) -> bool:
+        """加入这条消息后是否仍在单条Discord消息的限制之内"""
+        cfg = Config.WEBHOOK_CONFIG
+        merged = len(self.content() or "") + (len(content) + 1 if content else 0)
+        size = sum(len(data) for _, files_, _ in self.items for _, data, _ in files_) + sum(len(data) for _, data, _ in files)
+        return (self.attachment_count() + len(files) <= cfg["max_attachments"]
+                and merged <= cfg["max_content_length"] and size <= cfg["max_batch_bytes"])
+
+    def find(self, content: Optional[str], files: List[Attachment]) -> Optional[asyncio.Future]:
+        """窗口内已有完全相同的消息时返回它的 Future"""
+        for item_content, item_files, future in self.items:
+            if item_content == content and item_files == files:
+                return future
+        return None
+
+class WebhookDispatcher:
+    """按Discord限流桶调度的webhook发送器"""
+
+    def __init__(self, client=http_client):
+        self.client = client
+        # 每个webhook地址各自一个桶（Discord按webhook id区分限流）
+        self.buckets: Dict[str, RateLimitBucket] = {}
+        self.global_reset_at = 0.0
+        # 每个webhook地址当前的合并批次（只在HTTP客户端事件循环中访问）
+        self.batches: Dict[str, _PendingBatch] = {}
+        self._stats_lock = threading.Lock()
+        self.stats = defaultdict(float)
+
+    def _count(self, key: str, value: float = 1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def _bucket(self, url: str) -> RateLimitBucket:
+        bucket = self.buckets.get(url)
+        if bucket is None:
+            bucket = self.buckets[url] = RateLimitBucket()
+        return bucket
+
+    @staticmethod
+    def _build_request(content: Optional[str], files: Optional[List[Attachment]]) -> Dict:
+        # FormData 只能被发送一次，每次（重试）都重新构建
+        if not files:
+            return {"json": {"content": content}}
+        import aiohttp
+
+        form = aiohttp.FormData()
+        if content is not None:
+            form.add_field("content", content)
+        for index, (filename, data, content_type) in enumerate(files):
+            form.add_field(f"files[{index}]", data, filename=filename, content_type=content_type)
+        return {"data": form}
+
+    @staticmethod
+    def _retry_after(response: HttpResponse) -> Tuple[float, bool]:
+        """解析429响应的等待秒数以及是否为全局限流"""
+        try:
+            body = response.json()
+        except (ValueError, UnicodeDecodeError):
+            body = None
+        # 429 的响应体不一定是 JSON 对象（代理返回的错误页、列表或字符串）
+        if not isinstance(body, dict):
+            body = {}
+        headers = response.headers
+        retry_after = body.get("retry_after") or headers.get("Retry-After") or headers.get("X-RateLimit-Reset-After") or 1.0
+        is_global = bool(body.get("global")) or headers.get("X-RateLimit-Global", "").lower() == "true"
+        try:
+            return float(retry_after), is_global
+        except (TypeError, ValueError):
+            return 1.0, is_global
+
+    async def _wait(self, seconds: float):
+        if seconds > 0:
+            self._count("wait_seconds", seconds)
+            await asyncio.sleep(seconds)
+
+    async def _post(self, url: str, content: Optional[str], files: List[Attachment]) -> HttpResponse:
+        cfg = Config.WEBHOOK_CONFIG
+        bucket = self._bucket(url)
+        # 同一个桶串行发送，保证 remaining 计数准确且消息按提交顺序到达
+        async with bucket.lock:
+            for attempt in range(cfg["max_retries"] + 1):
+                await self._wait(max(bucket.wait_time(), self.global_reset_at - time.monotonic()))
+                self._count("requests")
+                with profiler.stage("webhook_post"):
+                    response = await self.client.request("POST", url, **self._build_request(content, files))
+                bucket.update(response.headers)
+                if response.status != 429:
+                    return response
+
+                retry_after, is_global = self._retry_after(response)
+                self._count("rate_limited")
+                if is_global:
+                    self.global_reset_at = time.monotonic() + retry_after
+                else:
+                    bucket.remaining = 0
+                    bucket.reset_at = time.monotonic() + retry_after
+                if retry_after > cfg["max_retry_after"] or attempt == cfg["max_retries"]:
+                    break
+                if Config.OUTPUT_OPTIONS["enable_console_output"]:
+                    print(f"Discord rate limited ({'global' if is_global else bucket.name or 'webhook'}), "
+                          f"retrying in {retry_after:.2f}s")
+            return response
+
+    def _enqueue(self, url: str, content: Optional[str], files: List[Attachment]) -> asyncio.Future:
+        """把消息放入该地址的合并批次，窗口到期或批次已满时发送"""
+        loop = asyncio.get_running_loop()
+        batch = self.batches.get(url)
+        if batch is not None:
+            duplicate = batch.find(content, files)
+            if duplicate is not None:
+                self._count("deduplicated")
+                return duplicate
+            if not batch.fits(content, files):
+                self._flush(url)
+                batch = None
+        if batch is None:
+            batch = self.batches[url] = _PendingBatch()
+            batch.timer = loop.call_later(Config.WEBHOOK_CONFIG["batch_window"], self._flush, url)
+
+        future = loop.create_future()
+        batch.items.append((content, files, future))
+        if batch.attachment_count() >= Config.WEBHOOK_CONFIG["max_attachments"]:
+            self._flush(url)
+        return future
+
+    def _flush(self, url: str):
+        batch = self.batches.pop(url, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        asyncio.get_running_loop().create_task(self._send_batch(url, batch))
+
+    async def _send_batch(self, url: str, batch: _PendingBatch):
+        files = [attachment for _, item_files, _ in batch.items for attachment in item_files]
+        self._count("batches")
+        self._count("batched_messages", len(batch.items))
+        try:
+            response = await self._post(url, batch.content(), files)
+        except Exception as e:
+            for _, _, future in batch.items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, _, future in batch.items:
+            if not future.done():
+                future.set_result(response)
+
+    async def _submit(self, url: str, content: Optional[str], files: Optional[List[Attachment]]) -> HttpResponse:
+        files = list(files or [])
+        if Config.WEBHOOK_CONFIG["batch_window"] <= 0:
+            return await self._post(url, content, files)
+        # shield: 调用方被取消时不影响同一批次里的其他消息
+        return await asyncio.shield(self._enqueue(url, content, files))
+
+    async def post(self, url: str, content: Optional[str] = None,
+                   files: Optional[List[Attachment]] = None) -> HttpResponse:
+        """
+        发送一条webhook消息，按限流桶等待，遇到429时自动重试，可在任意事件循环中调用；
+        批处理窗口内发往同一地址的消息会合并发送，返回的是所在批次的响应
+
+        Args:
+            url: webhook地址
+            content: 消息文本
+            files: 附件列表 [(文件名, 数据, content_type)]
+
+        Returns:
+            HttpResponse: 最终响应（重试次数用尽时为最后一次429响应）
+        """
+        coroutine = self._submit(url, content, files)
+        if self.client.in_client_loop():
+            return await coroutine
+        return await asyncio.wrap_future(self.client.submit(coroutine))
+
+    async def post_many(self, urls: List[str], content: Optional[str] = None,
+                        files: Optional[List[Attachment]] = None) -> List:
+        """并发发送到多个webhook（重复地址只发送一次），返回与 urls 一一对应的响应或异常"""
+        unique = list(dict.fromkeys(urls))
+        results = await asyncio.gather(*(self.post(url, content, files) for url in unique), return_exceptions=True)
+        by_url = dict(zip(unique, results))
+        return [by_url[url] for url in urls]
+
+    def post_sync(self, url: str, content: Optional[str] = None,
+                  files: Optional[List[Attachment]] = None) -> HttpResponse:
+        """同步发送（阻塞当前线程），不能在HTTP客户端事件循环线程中调用"""
+        return self.client.submit(self._submit(url, content, files)).result()
+
+    def get_stats(self) -> Dict:
+        """获取请求数、429次数、因限流等待的总时长以及合并/去重的消息数"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        for key in ("requests", "rate_limited", "wait_seconds", "batches", "batched_messages", "deduplicated"):
+            stats.setdefault(key, 0)
+        stats["buckets"] = len(self.buckets)
+        return stats
+
+# 全局webhook发送器
+webhook_dispatcher = WebhookDispatcher()